@@ -1,15 +1,36 @@
 import socketio
+import dotenv
+import heapq
 import os
+import random
+import sys
+import time
 from enum import Enum
-from typing import List, Tuple
-
-class TileType(Enum):
-    Fog = 0
-    Obstacle = 1
-    Mountain = 2
-    City = 3
-    Plain = 4
-    King = 5
+from typing import List, Tuple, Union
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "python"))
+
+from deadline import Deadline, TurnStats
+from distance_field import DistanceFields, UNREACHABLE
+from expansion import Capture, plan_expansion
+from fog_memory import FogMemory
+from forward_model import BeamPlanner
+from hierarchy import ClusterGraph
+from map_state import MapState, TilePropTuple, TileType
+from native import BotEngine
+from pathfinding import SearchKernel, SIGHT_BLOCKED
+from recording import GameRecorder
+from snapshot import SnapshotWriter, read_snapshot
+from speculation import invalidated, predict
+from tile_index import TileIndex
+from tracing import Tracer, traced
+
+directions = [
+    (-1, 0),
+    (0, 1),
+    (1, 0),
+    (0, -1)
+]
 
 class QuePurpose(Enum):
     Defend = 0
@@ -22,13 +43,28 @@ class Position:
         self.x = x
         self.y = y
 
+# how many turns a tile that went back under fog still counts as a threat
+THREAT_MEMORY = 10
+
+# maps with at least this many cells confine long gathers to a corridor of clusters
+CLUSTER_MIN_CELLS = 100 * 100
+
+# lower runs first; moves with the same rank run by descending priority
+PURPOSE_RANK = {
+    QuePurpose.Defend: 0,
+    QuePurpose.AttackGeneral: 1,
+    QuePurpose.Attack: 2,
+    QuePurpose.ExpandLand: 3,
+}
+
 class QueItem:
-    def __init__(self, from_pos: Position, to_pos: Position, purpose: QuePurpose, priority: int, target: Position):
+    def __init__(self, from_pos: Position, to_pos: Position, purpose: QuePurpose, priority: int, target: Position, plan: int = 0):
         self.from_pos = from_pos
         self.to_pos = to_pos
         self.purpose = purpose
         self.priority = priority
         self.target = target
+        self.plan = plan
 
 class GBot:
     def __init__(self, room_id: str, username: str):
@@ -44,24 +80,142 @@ class GBot:
         self.init_game_info = None
         self.game_map = None
         self.total_viewed = None
+        self.memory = None
+        self.turns_count = 0
         self.leader_board_data = None
         self.queue = AttackQueue()
+        self.kernel = None
+        # native searches from BotEngine.cpp, when built and enabled
+        self.engine = None
+        self.use_native = True
+        self.distances = None
+        self.tiles = None
+        # cluster graph that routes long searches on very large maps
+        self.clusters = None
+        self.use_clusters = True
+        # lookahead for turns the strategies leave without a move
+        self.beam = None
+        self.use_beam = True
+        # plan the next turn on a predicted map while waiting for it
+        self.speculate = True
+        self.speculation = None
+        self.dirty = []
+        self.socket = None
+        self.record_dir = None
+        self.recorder = None
+        self.turn_budget = 0.25
+        self.deadline = None
+        self.turn_stats = TurnStats()
+        self.warmup_ms = 0.0
+        self.tracer = Tracer()
+        self.trace_dir = None
+        # crash-safe state snapshots, written every `snapshot_every` turns
+        self.snapshot_dir = None
+        self.snapshot = None
+        self.snapshot_every = 1
+        # snapshots last saved longer ago than this (seconds) belong to a game that is over
+        self.snapshot_max_age = 120.0
+        # wall-clock time the current game started, which snapshots carry along
+        self.started_at = 0.0
+        # state came from a snapshot, not from this process's game_started
+        self.resumed = False
 
 class AttackQueue:
+    """Move heap ordered by (PURPOSE_RANK, -priority, insertion order).
+
+    The moves of one path share a plan id. When a move turns out to be stale
+    its whole plan is marked dropped, and the plan's remaining moves are
+    discarded in O(1) each as they reach the top of the heap.
+    """
+
     def __init__(self):
         self.que = []
+        self.seq = 0
+        self.plans = 0
+        self.dropped = set()
 
     def push_back(self, item: QueItem):
-        self.que.append(item)
+        heapq.heappush(self.que, (PURPOSE_RANK[item.purpose], -item.priority, self.seq, item))
+        self.seq += 1
+
+    def push_path(self, way: List[Position], purpose: QuePurpose, priority: int):
+        self.plans += 1
+        prev = None
+        for next_pos in way:
+            if prev:
+                self.push_back(QueItem(prev, next_pos, purpose, priority, way[-1], self.plans))
+            prev = next_pos
 
     def pop_front(self):
-        if len(self.que) > 0:
-            return self.que.pop(0)
+        while len(self.que) > 0:
+            item = heapq.heappop(self.que)[3]
+            if item.plan not in self.dropped:
+                return item
+        self.dropped.clear()
         return None
 
+    def pop_valid(self, game_map: MapState, color: int):
+        """Pop the next move whose source is still ours and whose target still needs taking."""
+        owners = game_map.owners
+        while True:
+            item = self.pop_front()
+            if not item:
+                return None
+            stale = owners[game_map.index(item.from_pos.x, item.from_pos.y)] != color
+            if not stale and (item.purpose == QuePurpose.AttackGeneral or item.purpose == QuePurpose.ExpandLand):
+                stale = owners[game_map.index(item.target.x, item.target.y)] == color
+            if not stale:
+                return item
+            if item.plan:
+                self.dropped.add(item.plan)
+
+    def clear(self):
+        self.que = []
+        self.dropped.clear()
+
     def is_empty(self):
         return len(self.que) == 0
 
+    def dump(self) -> dict:
+        """The live moves as plain lists, for snapshots."""
+        moves = []
+        for _, _, seq, item in self.que:
+            if item.plan not in self.dropped:
+                moves.append([
+                    seq, item.purpose.value, item.priority, item.plan,
+                    item.from_pos.x, item.from_pos.y, item.to_pos.x, item.to_pos.y, item.target.x, item.target.y,
+                ])
+        return {"seq": self.seq, "plans": self.plans, "moves": moves}
+
+    @classmethod
+    def load(cls, state: dict) -> "AttackQueue":
+        queue = cls()
+        queue.seq = state["seq"]
+        queue.plans = state["plans"]
+        for seq, purpose, priority, plan, fx, fy, tx, ty, gx, gy in state["moves"]:
+            item = QueItem(Position(fx, fy), Position(tx, ty), QuePurpose(purpose), priority, Position(gx, gy), plan)
+            queue.que.append((PURPOSE_RANK[item.purpose], -priority, seq, item))
+        heapq.heapify(queue.que)
+        return queue
+
+    def footprint(self, game_map: MapState):
+        """Cells the queued moves go from or to."""
+        cells = set()
+        for item in self.que:
+            if item[3].plan not in self.dropped:
+                cells.add(game_map.index(item[3].from_pos.x, item[3].from_pos.y))
+                cells.add(game_map.index(item[3].to_pos.x, item[3].to_pos.y))
+        return cells
+
+class Speculation:
+    def __init__(self, turn: int, predicted: MapState, changed: List[int], queue: AttackQueue, attack_color: int, attack_position):
+        self.turn = turn
+        self.predicted = predicted
+        self.changed = changed
+        self.queue = queue
+        self.attack_color = attack_color
+        self.attack_position = attack_position
+
 class MapDiffData:
     def __init__(self, diff: List[Tuple[TileType, int, int]]):
         self.diff = diff
@@ -70,11 +224,6 @@ class LeaderBoardTable:
     def __init__(self, data: List[Tuple[int, int]]):
         self.data = data
 
-class Room:
-    def __init__(self, players: List[Player], game_started: bool):
-        self.players = players
-        self.game_started = game_started
-
 class Player:
     def __init__(self, id: str, color: int, force_start: bool, is_room_host: bool):
         self.id = id
@@ -82,6 +231,11 @@ class Player:
         self.force_start = force_start
         self.is_room_host = is_room_host
 
+class Room:
+    def __init__(self, players: List[Player], game_started: bool):
+        self.players = players
+        self.game_started = game_started
+
 class UserData:
     def __init__(self, id: str):
         self.id = id
@@ -103,14 +257,14 @@ class initGameInfo:
         self.map_height = map_height
 
 def init_map(map_width: int, map_height: int):
-    game_map = [[(TileType.Fog, None, None)] * map_height for _ in range(map_width)]
-    total_viewed = [[False] * map_height for _ in range(map_width)]
-    return game_map, total_viewed
+    game_map = MapState(map_width, map_height)
+    memory = FogMemory(map_width, map_height)
+    return game_map, memory
 
-def un_revealed(tile: Tuple[TileType, int, int]):
+def un_revealed(tile: TilePropTuple):
     return tile[0] == TileType.Fog or tile[0] == TileType.Obstacle
 
-def un_moveable(tile: Tuple[TileType, int, int], ignore_city: bool):
+def un_moveable(tile: TilePropTuple, ignore_city: bool):
     return tile[0] == TileType.Mountain or tile[0] == TileType.Obstacle or (ignore_city and tile[0] == TileType.City)
 
 def pos_out_of_range(pos: Position, game_map, init_game_info):
@@ -127,66 +281,157 @@ def pos_out_of_range(pos: Position, game_map, init_game_info):
 def calc_dist(a: Position, b: Position):
     return abs(a.x - b.x) + abs(a.y - b.y)
 
-def patch_map(map_diff: MapDiffData, game_map, total_viewed, init_game_info):
+def receive_update(map_diff: List[Union[int, TilePropTuple]], turns_count: int, leader_board_data: list, gbot):
+    gbot.leader_board_data = leader_board_data
+    gbot.turns_count = turns_count
+    gbot.tracer.begin_turn(turns_count)
+    if gbot.recorder:
+        gbot.recorder.game_update(map_diff, turns_count, leader_board_data)
+    patch_map(map_diff, gbot.game_map, gbot.total_viewed, gbot.init_game_info, gbot)
+
+@traced
+def patch_map(map_diff: List[Union[int, TilePropTuple]], game_map, total_viewed, init_game_info, gbot):
     if not game_map or not total_viewed or not init_game_info:
         return
-    map_width = init_game_info.map_width
-    map_height = init_game_info.map_height
-    flattened = [tile for sublist in game_map for tile in sublist]
-    new_state = list(game_map)
-    j = 0
-    for i in range(len(map_diff.diff)):
-        tmp = map_diff.diff[i]
-        if isinstance(tmp, int):
-            j += tmp
-        else:
-            flattened[j] = tmp
-            j += 1
-    for i in range(map_width):
-        for j in range(map_height):
-            new_state[i][j] = flattened[i * map_height + j]
-            if not total_viewed[i][j] and not un_revealed(new_state[i][j]):
-                total_viewed[i][j] = True
-            if new_state[i][j][0] == TileType.King and new_state[i][j][1]:
-                if new_state[i][j][1] == gbot.color:
-                    gbot.my_general = Position(i, j)
-                elif len([a for a in gbot.enemy_general if a.color == new_state[i][j][1]]) == 0:
-                    gbot.enemy_general.append(ExPosition(i, j, new_state[i][j][1]))
-    gbot.enemy_general = [g for g in gbot.enemy_general if new_state[g.x][g.y][1] == g.color or new_state[g.x][g.y][0] == TileType.Fog]
-    gbot.game_map = new_state
+    dirty = gbot.dirty = game_map.apply_diff(map_diff)
+    # only cells that opened or closed matter to the cluster graph
+    changed = gbot.distances.update(game_map, dirty) if gbot.distances else dirty
+    if gbot.tiles:
+        gbot.tiles.update(game_map, dirty)
+    if gbot.clusters:
+        gbot.clusters.update(game_map, changed)
+    if gbot.snapshot:
+        # every update, including ones a runtime patches without planning for
+        gbot.snapshot.mark(dirty)
+    if not gbot.memory:
+        return
+    # the memory sets `total_viewed` and tracks generals, from the dirty cells only
+    lost = gbot.memory.update(game_map, dirty, gbot.turns_count)
+    generals = gbot.memory.generals
+    if gbot.color in generals:
+        gbot.my_general = Position(*game_map.position(generals[gbot.color]))
+    gbot.enemy_general = [ExPosition(*game_map.position(cell), color) for color, cell in generals.items() if color != gbot.color]
+    if gbot.distances:
+        for cell in lost:
+            gbot.distances.drop(cell)
+
+def emit_move(gbot, from_pos: Position, to_pos: Position):
+    gbot.socket.emit("attack", ({"x": from_pos.x, "y": from_pos.y}, {"x": to_pos.x, "y": to_pos.y}, False))
+
+def fallback_move(game_map, gbot):
+    # a random move off one of our tiles, for turns where no plan got ready
+    if not gbot.tiles or not gbot.tiles.movable:
+        return False
+    from_pos = Position(*game_map.position(random.choice(tuple(gbot.tiles.movable))))
+    for d in random.sample(directions, len(directions)):
+        to_pos = Position(from_pos.x + d[0], from_pos.y + d[1])
+        if game_map.in_range(to_pos.x, to_pos.y) and not un_moveable(game_map[to_pos.x][to_pos.y], False):
+            emit_move(gbot, from_pos, to_pos)
+            return True
+    return False
 
+@traced
 def handle_move(turns_count: int, game_map, init_game_info, gbot):
     if not game_map or not init_game_info or not gbot.color:
         return
+    gbot.deadline = deadline = Deadline(gbot.turn_budget)
+    a = None
+    speculated = adopt_speculation(turns_count, game_map, gbot)
+    if gbot.queue and not gbot.queue.is_empty():
+        a = gbot.queue.pop_valid(game_map, gbot.color)
+    if not a:
+        plan_move(turns_count, game_map, init_game_info, gbot)
+        # send the best plan found, even if planning was cut short
+        a = gbot.queue.pop_valid(game_map, gbot.color)
+    if not a:
+        a = beam_move(turns_count, game_map, gbot)
+    if a:
+        emit_move(gbot, a.from_pos, a.to_pos)
+    gbot.turn_stats.record(deadline, fallback=not a and fallback_move(game_map, gbot), speculated=speculated and a is not None)
+    gbot.deadline = None
+    if a:
+        speculate(turns_count, game_map, init_game_info, a, deadline, gbot)
+
+@traced
+def speculate(turns_count: int, game_map, init_game_info, a: QueItem, deadline: Deadline, gbot):
+    """Plan the next turn against the map we expect after move `a`, once it has been sent.
+
+    It only gets what is left of this turn's `deadline`, so the handler
+    returns within the turn budget either way.
+    """
+    gbot.speculation = None
+    if not gbot.speculate or not gbot.memory or not gbot.tiles or not gbot.queue or not gbot.queue.is_empty():
+        return
+    if deadline.expired():
+        return
+    move = (game_map.index(a.from_pos.x, a.from_pos.y), game_map.index(a.to_pos.x, a.to_pos.y))
+    predicted, changed = predict(game_map, move, gbot.color, turns_count + 1, gbot.memory, gbot.tiles)
+    live = (gbot.queue, gbot.game_map, gbot.attack_color, gbot.attack_position)
+    gbot.queue = AttackQueue()
+    gbot.game_map = predicted
+    gbot.deadline = deadline
+    try:
+        plan_move(turns_count + 1, predicted, init_game_info, gbot)
+        # a plan cut short is left to the next turn, which has a budget of its own
+        if not gbot.queue.is_empty() and not deadline.cut:
+            gbot.speculation = Speculation(turns_count + 1, predicted, changed, gbot.queue, gbot.attack_color, gbot.attack_position)
+    finally:
+        gbot.queue, gbot.game_map, gbot.attack_color, gbot.attack_position = live
+        gbot.deadline = None
+
+@traced
+def adopt_speculation(turns_count: int, game_map, gbot):
+    """Take over the plan made before this update if the update left its moves alone."""
+    spec = gbot.speculation
+    gbot.speculation = None
+    if not spec or spec.turn != turns_count or not gbot.queue or not gbot.queue.is_empty():
+        return False
+    # only cells the update or the prediction touched can differ
+    if invalidated(game_map, spec.predicted, set(gbot.dirty).union(spec.changed), spec.queue.footprint(game_map)):
+        return False
+    gbot.queue = spec.queue
+    gbot.attack_color = spec.attack_color
+    gbot.attack_position = spec.attack_position
+    return True
+
+@traced
+def beam_move(turns_count: int, game_map, gbot):
+    if not gbot.beam or not gbot.tiles or not gbot.tiles.movable:
+        return None
+    move = gbot.beam.plan(game_map, gbot.color, turns_count, gbot.tiles.movable, gbot.deadline)
+    gbot.tracer.count("beam_move.futures", gbot.beam.evaluated)
+    if not move:
+        return None
+    from_pos = Position(*game_map.position(move[0]))
+    to_pos = Position(*game_map.position(move[1]))
+    return QueItem(from_pos, to_pos, QuePurpose.ExpandLand, 0, to_pos)
+
+@traced
+def plan_move(turns_count: int, game_map, init_game_info, gbot):
+    """Run the strategies in priority order until one plans or the turn's deadline expires."""
+    deadline = gbot.deadline
     map_width = init_game_info.map_width
     map_height = init_game_info.map_height
-    if not gbot.queue or gbot.queue.is_empty():
-        while not gbot.queue.is_empty():
-            item = gbot.queue.pop_front()
-            if gbot.game_map[item.from_pos.x][item.from_pos.y][1] != gbot.color:
-                gbot.queue.pop_front()
-            if (item.purpose == QuePurpose.Defend or item.purpose == QuePurpose.AttackGeneral or item.purpose == QuePurpose.ExpandLand) and gbot.game_map[item.target.x][item.target.y][1] == gbot.color:
-                gbot.queue.pop_front()
-            else:
-                break
-        a = gbot.queue.pop_front()
-        if a:
-            socket.emit("attack", a.from_pos, a.to_pos, False)
-            return
     if gbot.enemy_general and gbot.queue:
         for a in gbot.enemy_general:
-            gbot.queue.que = []
+            if deadline and deadline.expired():
+                break
+            gbot.queue.clear()
+            if gbot.distances and gbot.my_general and gbot.distances.distance(game_map.index(a.x, a.y), game_map.index(gbot.my_general.x, gbot.my_general.y)) == UNREACHABLE:
+                continue
             if a.color == gbot.attack_color:
-                gather_armies(QuePurpose.AttackGeneral, 5, Position(a.x, a.y), 2 * (map_width + map_height))
-            gather_armies(QuePurpose.AttackGeneral, 100, Position(a.x, a.y), 2 * (map_width + map_height))
+                gather_armies(QuePurpose.AttackGeneral, 5, Position(a.x, a.y), 2 * (map_width + map_height), game_map, init_game_info, gbot)
+            gather_armies(QuePurpose.AttackGeneral, 100, Position(a.x, a.y), 2 * (map_width + map_height), game_map, init_game_info, gbot)
         return
     if king_in_danger(game_map, init_game_info, gbot):
         return
+    if deadline and deadline.expired():
+        return
     if gbot.attack_color != -1 and gbot.attack_position and gbot.queue and gbot.total_viewed:
         if gbot.game_map[gbot.attack_position.x][gbot.attack_position.y][1] == gbot.color:
             for d in sorted(directions, key=lambda x: random.random() - 0.5):
                 new_pos = Position(gbot.attack_position.x + d[0], gbot.attack_position.y + d[1])
-                if pos_out_of_range(new_pos, game_map, init_game_info) or un_moveable(gbot.game_map[new_pos.x][new_pos.y], True) or gbot.total_viewed[new_pos.x][new_pos.y]:
+                if pos_out_of_range(new_pos, game_map, init_game_info) or un_moveable(gbot.game_map[new_pos.x][new_pos.y], True) or gbot.total_viewed[game_map.index(new_pos.x, new_pos.y)]:
                     continue
                 if gbot.game_map[new_pos.x][new_pos.y][1] == gbot.attack_color:
                     gbot.queue.push_back(QueItem(gbot.attack_position, new_pos, QuePurpose.Attack, 999, new_pos))
@@ -205,13 +450,18 @@ def handle_move(turns_count: int, game_map, init_game_info, gbot):
         else:
             gbot.attack_color = -1
             gbot.attack_position = None
+    if deadline and deadline.expired():
+        return
     if detect_threat(game_map, init_game_info, gbot):
         return
+    if deadline and deadline.expired():
+        return
     if (turns_count + 1) % 17 == 0:
-        quick_expand(game_map, total_viewed, gbot)
+        quick_expand(game_map, gbot.total_viewed, gbot)
     elif turns_count + 1 > 17:
         expand_land(game_map, init_game_info, gbot)
 
+@traced
 def king_in_danger(game_map, init_game_info, gbot):
     if not gbot.my_general or not game_map or not init_game_info or not gbot.queue:
         return False
@@ -221,191 +471,318 @@ def king_in_danger(game_map, init_game_info, gbot):
     for d in ex_directions:
         tile = Position(gbot.my_general.x + d[0], gbot.my_general.y + d[1])
         if not pos_out_of_range(tile, game_map, init_game_info) and game_map[tile.x][tile.y][1] and game_map[tile.x][tile.y][1] != gbot.color:
-            gather_armies(QuePurpose.Defend, 999, gbot.my_general, 10)
+            gather_armies(QuePurpose.Defend, 999, gbot.my_general, 10, game_map, init_game_info, gbot)
             return True
     return False
 
+@traced
 def detect_threat(game_map, init_game_info, gbot):
-    if not gbot.my_general or not game_map:
+    if not gbot.my_general or not game_map or not gbot.kernel:
+        return False
+    general = game_map.index(gbot.my_general.x, gbot.my_general.y)
+    owners = game_map.owners
+    if gbot.engine:
+        # scored by the walking distance over revealed tiles
+        threat = gbot.engine.threat(general, gbot.color, game_map.types, owners, game_map.armies, search_budget(gbot))
+    else:
+        kernel = gbot.kernel
+        count = kernel.bfs(general, game_map, SIGHT_BLOCKED, deadline=gbot.deadline)
+        gbot.tracer.count("detect_threat.nodes", count)
+        threat = None
+        for i in kernel.order[1:count]:
+            if owners[i] >= 0 and owners[i] != gbot.color:
+                dist = gbot.distances.distance(general, i) if gbot.distances else calc_dist(gbot.my_general, Position(*game_map.position(i)))
+                score = game_map.armies[i] - dist
+                if not threat or score > threat[1]:
+                    threat = (i, score)
+    if not threat:
+        threat = remembered_threat(game_map, gbot)
+    if not threat:
         return False
-    queue = []
-    book = []
-    queue.append((gbot.my_general, 0))
-    book.append(str(gbot.my_general))
-    front = 0
-    end = 0
-    selected = []
-    while front <= end:
-        a = queue[front]
-        for d in sorted(directions, key=lambda x: random.random() - 0.5):
-            b = Position(a[0].x + d[0], a[0].y + d[1])
-            if str(b) in book or pos_out_of_range(b, game_map, init_game_info) or un_revealed(game_map[b.x][b.y]) or un_moveable(game_map[b.x][b.y], False):
+    cell, score = threat
+    target = Position(*game_map.position(cell))
+    gather_armies(QuePurpose.Defend, score, target, 25, game_map, init_game_info, gbot)
+    gbot.attack_color = owners[cell] if owners[cell] >= 0 else gbot.memory.seen_owner[cell]
+    gbot.attack_position = target
+    return True
+
+@traced
+def remembered_threat(game_map, gbot):
+    """The enemy tile out of sight but seen lately that would hit home hardest, as (cell, score)."""
+    memory = gbot.memory
+    if not memory or not gbot.distances:
+        return None
+    general = game_map.index(gbot.my_general.x, gbot.my_general.y)
+    threat = None
+    for color in memory.enemy_colors(gbot.color):
+        for i in memory.recent(color, THREAT_MEMORY):
+            if memory.visible[i]:
                 continue
-            queue.append((b, a[1] + 1))
-            book.append(str(b))
-            end += 1
-            if game_map[b.x][b.y][1] and game_map[b.x][b.y][1] != gbot.color:
-                selected.append((game_map[b.x][b.y], b, (game_map[b.x][b.y][2] as int) - calc_dist(gbot.my_general, b)))
-    selected = sorted(selected, key=lambda x: x[2], reverse=True)
-    threat = selected[0] if selected else None
-    if threat:
-        gather_armies(QuePurpose.Defend, threat[2], threat[1], 25)
-        gbot.attack_color = threat[0][1] as int
-        gbot.attack_position = threat[1]
-    return len(selected) > 0
+            dist = gbot.distances.distance(general, i)
+            if dist == UNREACHABLE:
+                continue
+            score = memory.army_estimate(i, memory.turn) - dist
+            if score > 0 and (not threat or score > threat[1]):
+                threat = (i, score)
+    return threat
+
+def search_budget(gbot) -> float:
+    return gbot.deadline.remaining() if gbot.deadline else -1.0
 
+@traced
 def gather_armies(purpose: QuePurpose, priority: int, to_pos: Position, limit: int, game_map, init_game_info, gbot):
-    if not game_map or not gbot.queue or not init_game_info:
+    if not game_map or not gbot.queue or not init_game_info or not gbot.kernel:
         return 0
-    map_width = init_game_info.map_width
-    map_height = init_game_info.map_height
-    queue = []
-    possible_way = [[PossibleWay() for _ in range(map_height)] for _ in range(map_width)]
-    queue.append((to_pos, 0))
-    possible_way[to_pos.x][to_pos.y] = PossibleWay(gbot.game_map[to_pos.x][to_pos.y][2] as int, [to_pos], False)
-    front = 0
-    end = 0
-    while front <= end:
-        a = queue[front]
-        possible_way[a[0].x][a[0].y].tag = True
-        if a[1] >= limit:
-            break
-        for d in sorted(directions, key=lambda x: random.random() - 0.5):
-            b = Position(a[0].x + d[0], a[0].y + d[1])
-            if pos_out_of_range(b, game_map, init_game_info) or un_moveable(game_map[b.x][b.y], False) or possible_way[b.x][b.y].tag:
-                continue
-            new_val = possible_way[a[0].x][a[0].y].val - 1
-            if game_map[b.x][b.y][1] != gbot.color:
-                if game_map[b.x][b.y][0] == TileType.City:
-                    continue
-                new_val -= game_map[b.x][b.y][2] as int
-            else:
-                new_val += game_map[b.x][b.y][2] as int
-            if possible_way[b.x][b.y].val >= new_val:
-                continue
-            new_way = possible_way[a[0].x][a[0].y].way + [b]
-            queue.append((b, a[1] + 1))
-            end += 1
-            possible_way[b.x][b.y] = PossibleWay(new_val, new_way, False)
-    max_way = PossibleWay(0, [], False)
-    for a in possible_way:
-        for b in a:
-            if b.val > max_way.val:
-                max_way = b
-    if max_way.val <= 0:
+    source = game_map.index(to_pos.x, to_pos.y)
+    if gbot.engine:
+        cells = gbot.engine.gather(source, gbot.color, game_map.types, game_map.owners, game_map.armies, limit, search_budget(gbot))
+    else:
+        within = None
+        if gbot.clusters and gbot.my_general and limit > 2 * gbot.clusters.size:
+            # route to our general over the clusters first and only search the ones on the way
+            within = gbot.clusters.corridor(source, game_map.index(gbot.my_general.x, gbot.my_general.y))
+        best = gbot.kernel.gather(source, gbot.color, game_map, limit, gbot.deadline, within)
+        if best < 0 and within:
+            best = gbot.kernel.gather(source, gbot.color, game_map, limit, gbot.deadline)
+        gbot.tracer.count("gather_armies.nodes", gbot.kernel.count)
+        cells = gbot.kernel.path(best) if best >= 0 else []
+    if not cells:
         return 0
-    prev = None
-    for next_pos in max_way.way:
-        if prev:
-            gbot.queue.push_back(QueItem(prev, next_pos, purpose, priority, max_way.way[-1]))
-        prev = next_pos
-    return len(max_way.way)
+    # the path runs from the best source tile back to `to_pos`
+    way = [Position(*game_map.position(i)) for i in cells]
+    gbot.queue.push_path(way, purpose, priority)
+    return len(way)
 
+@traced
 def quick_expand(game_map, total_viewed, gbot):
-    if not game_map or not total_viewed or not gbot.queue or not gbot.my_general or not gbot.init_game_info:
+    if not game_map or not total_viewed or not gbot.queue or not gbot.my_general or not gbot.init_game_info or not gbot.kernel:
         return 0
-    map_width = gbot.init_game_info.map_width
-    map_height = gbot.init_game_info.map_height
-    queue = []
-    possible_way = [[PossibleWay() for _ in range(map_height)] for _ in range(map_width)]
-    queue.append((gbot.my_general, 0))
-    possible_way[gbot.my_general.x][gbot.my_general.y] = PossibleWay(gbot.game_map[gbot.my_general.x][gbot.my_general.y][2] as int, [gbot.my_general], False)
-    front = 0
-    end = 0
-    while front <= end:
-        a = queue[front]
-        possible_way[a[0].x][a[0].y].tag = True
-        for d in sorted(directions, key=lambda x: random.random() - 0.5):
-            b = Position(a[0].x + d[0], a[0].y + d[1])
-            if pos_out_of_range(b, game_map, init_game_info) or un_moveable(game_map[b.x][b.y], False) or possible_way[b.x][b.y].tag:
-                continue
-            new_val = possible_way[a[0].x][a[0].y].val - 1
-            if game_map[b.x][b.y][1] != gbot.color:
-                if game_map[b.x][b.y][0] == TileType.City:
-                    continue
-                new_val -= game_map[b.x][b.y][2] as int
-            else:
-                new_val += game_map[b.x][b.y][2] as int
-            if possible_way[b.x][b.y].val >= new_val:
-                continue
-            new_way = possible_way[a[0].x][a[0].y].way + [b]
-            queue.append((b, a[1] + 1))
-            end += 1
-            possible_way[b.x][b.y] = PossibleWay(new_val, new_way, False)
-    max_way = PossibleWay(0, [], False)
-    for a in possible_way:
-        for b in a:
-            if b.val > 0 and not total_viewed[b.way[-1].x][b.way[-1].y]:
-                if max_way.val == 0:
-                    max_way = b
-                elif random.random() < 0.7:
-                    max_way = b
-    if max_way.val == 0:
+    kernel = gbot.kernel
+    kernel.gather(game_map.index(gbot.my_general.x, gbot.my_general.y), gbot.color, game_map, deadline=gbot.deadline)
+    gbot.tracer.count("quick_expand.nodes", kernel.count)
+    value = kernel.value
+    target = -1
+    for i in kernel.order[:kernel.count]:
+        if value[i] > 0 and not total_viewed[i]:
+            if target < 0:
+                target = i
+            elif random.random() < 0.7:
+                target = i
+    if target < 0:
         return 0
-    prev = None
-    for next_pos in max_way.way:
-        if prev:
-            gbot.queue.push_back(QueItem(prev, next_pos, QuePurpose.ExpandLand, 50, max_way.way[-1]))
-        prev = next_pos
+    # walk outwards from the general towards the unexplored tile
+    way = [Position(*game_map.position(i)) for i in reversed(kernel.path(target))]
+    gbot.queue.push_path(way, QuePurpose.ExpandLand, 50)
+    return len(way)
 
+@traced
 def expand_land(game_map, init_game_info, gbot):
-    if not game_map or not init_game_info:
+    if not game_map or not init_game_info or not gbot.kernel:
         return
-    tiles = []
-    map_width = init_game_info.map_width
-    map_height = init_game_info.map_height
-    for i in range(map_width):
-        for j in range(map_height):
-            if game_map[i][j][0] == TileType.Plain and game_map[i][j][1] != gbot.color:
-                tiles.append(Position(i, j))
-    random.shuffle(tiles)
-    ok = False
-    for tile in tiles:
-        if gather_armies(QuePurpose.ExpandLand, 10, tile, 1, game_map, init_game_info, gbot):
-            ok = True
-    if not ok:
-        gather_armies(QuePurpose.ExpandLand, 10, tiles[0], 10, game_map, init_game_info, gbot)
-
-def main():
-    dotenv.load_dotenv()
-    server_url = os.getenv("SERVER_URL")
-    room_id = os.getenv("ROOM_ID")
-    bot_name = os.getenv("BOT_NAME") or "GenniaBot"
-
-    if not server_url or not room_id:
-        raise Exception("Important arguments missing.")
-
-    gbot = GBot(room_id, bot_name)
-
-    directions = [
-        (-1, 0),
-        (0, 1),
-        (1, 0),
-        (0, -1)
-    ]
-
-    socket = socketio.Client()
-    socket.connect(server_url)
+    if gbot.engine:
+        captures = [Capture(*c) for c in gbot.engine.expand(gbot.color, game_map.types, game_map.owners, game_map.armies)]
+    else:
+        captures = plan_expansion(game_map, gbot.color, gbot.kernel.neighbors, frontier=gbot.tiles.frontier if gbot.tiles else None)
+    gbot.tracer.count("expand_land.captures", len(captures))
+    if not captures:
+        return
+    used = set()
+    for capture in captures:
+        if capture.surplus <= 0:
+            break
+        if capture.source in used:
+            continue
+        used.add(capture.source)
+        way = [Position(*game_map.position(capture.source)), Position(*game_map.position(capture.target))]
+        gbot.queue.push_path(way, QuePurpose.ExpandLand, 10)
+    if not used:
+        target = captures[0].target
+        if gbot.distances and gbot.my_general:
+            # the frontier tile closest to home
+            target = gbot.distances.nearest(game_map.index(gbot.my_general.x, gbot.my_general.y), (c.target for c in captures))
+            if target < 0:
+                target = captures[0].target
+        gather_armies(QuePurpose.ExpandLand, 10, Position(*game_map.position(target)), 10, game_map, init_game_info, gbot)
+
+@traced
+def warmup(init_game_info: dict, gbot):
+    """Build everything sized to the map and rehearse a turn, before the first update arrives."""
+    start = time.perf_counter()
+    map_width = gbot.init_game_info.map_width
+    map_height = gbot.init_game_info.map_height
+    gbot.game_map, gbot.memory = init_map(map_width, map_height)
+    gbot.total_viewed = gbot.memory.viewed
+    build_searches(map_width, map_height, gbot)
+    king = init_game_info.get("king")
+    if king and gbot.color is not None:
+        rehearse(Position(king["x"], king["y"]), gbot)
+    gbot.warmup_ms = (time.perf_counter() - start) * 1000
+
+def build_searches(map_width: int, map_height: int, gbot):
+    gbot.kernel = SearchKernel(map_width, map_height)
+    gbot.distances = DistanceFields(map_width, map_height)
+    gbot.tiles = TileIndex(map_width, map_height, gbot.color, gbot.kernel.neighbors)
+    if gbot.use_beam:
+        gbot.beam = BeamPlanner(gbot.kernel.neighbors)
+    if gbot.use_clusters and map_width * map_height >= CLUSTER_MIN_CELLS:
+        gbot.clusters = ClusterGraph(map_width, map_height, neighbors=gbot.kernel.neighbors)
+    if BotEngine and gbot.use_native:
+        gbot.engine = BotEngine.Engine(map_width, map_height)
+
+def rehearse(king: Position, gbot):
+    """Run every strategy once on a copy of the blank map holding only our king, leaving no trace."""
+    game_map = gbot.game_map.copy()
+    general = game_map.index(king.x, king.y)
+    game_map.types[general] = TileType.King
+    game_map.owners[general] = gbot.color
+    game_map.armies[general] = 10
+    live = (gbot.queue, gbot.game_map, gbot.attack_color, gbot.attack_position, gbot.my_general)
+    fields = set(gbot.distances.fields)
+    gbot.queue = AttackQueue()
+    gbot.game_map = game_map
+    gbot.my_general = king
+    gbot.deadline = Deadline(gbot.turn_budget)
+    try:
+        # the turns on which quick_expand and expand_land run
+        for turns_count in (16, 18):
+            plan_move(turns_count, game_map, gbot.init_game_info, gbot)
+        gather_armies(QuePurpose.Defend, 0, king, 10, game_map, gbot.init_game_info, gbot)
+        if gbot.beam:
+            gbot.beam.plan(game_map, gbot.color, 0, [general], gbot.deadline)
+    finally:
+        gbot.queue, gbot.game_map, gbot.attack_color, gbot.attack_position, gbot.my_general = live
+        gbot.deadline = None
+        # fields built on the blank map would have to be repaired by the first update
+        for source in set(gbot.distances.fields) - fields:
+            gbot.distances.drop(source)
+
+def snapshot_path(gbot) -> str:
+    return os.path.join(gbot.snapshot_dir, f"{gbot.room_id}-{gbot.username}.gsnap")
+
+def bot_state(gbot) -> dict:
+    """What a snapshot keeps beside the map and the fog memory."""
+    return {
+        "room_id": gbot.room_id,
+        "username": gbot.username,
+        "player_id": gbot.my_player_id,
+        "color": gbot.color,
+        "turn": gbot.turns_count,
+        "started_at": gbot.started_at,
+        "saved_at": time.time(),
+        "attack_color": gbot.attack_color,
+        "attack_position": [gbot.attack_position.x, gbot.attack_position.y] if gbot.attack_position else None,
+        "my_general": [gbot.my_general.x, gbot.my_general.y] if gbot.my_general else None,
+        "enemy_general": [[g.x, g.y, g.color] for g in gbot.enemy_general],
+        "queue": gbot.queue.dump(),
+    }
+
+def finish_turn(gbot):
+    """What follows every handle_move, whichever runtime drives the bot."""
+    gbot.resumed = False
+    save_snapshot(gbot)
+
+def save_snapshot(gbot):
+    writer = gbot.snapshot
+    if not writer or not gbot.memory:
+        return
+    if gbot.turns_count % gbot.snapshot_every:
+        return
+    state = bot_state(gbot)
+    if not writer.save(gbot.turns_count, gbot.game_map, gbot.memory, state):
+        # too many queued moves to fit: keep the rest, plan_move queues them again
+        state["queue"] = AttackQueue().dump()
+        writer.save(gbot.turns_count, gbot.game_map, gbot.memory, state)
+
+def close_snapshot(gbot, remove: bool = False):
+    if gbot.snapshot:
+        gbot.snapshot.close(remove)
+        gbot.snapshot = None
+    elif remove and gbot.snapshot_dir and os.path.exists(snapshot_path(gbot)):
+        os.remove(snapshot_path(gbot))
+
+def forget_resumed(gbot):
+    """Drop the state `resume` restored, and its snapshot, once it turns out to be for another game."""
+    gbot.resumed = False
+    close_snapshot(gbot, remove=True)
+    gbot.queue = AttackQueue()
+    gbot.attack_color = -1
+    gbot.attack_position = None
+    gbot.my_general = None
+    gbot.enemy_general = []
+    # nothing is patched or planned until the next game_started builds a new map
+    gbot.init_game_info = None
+    gbot.game_map = None
+    gbot.memory = None
+    gbot.total_viewed = None
+
+def resume(gbot) -> bool:
+    """Pick up the game a crashed process was playing, from its newest snapshot."""
+    path = snapshot_path(gbot)
+    snapshot = read_snapshot(path)
+    if not snapshot:
+        return False
+    state = snapshot.meta
+    if state["room_id"] != gbot.room_id or state["username"] != gbot.username:
+        return False
+    if time.time() - state["saved_at"] > gbot.snapshot_max_age:
+        # the game it was taken in has ended since
+        os.remove(path)
+        return False
+    game_map = snapshot.game_map
+    gbot.my_player_id = state["player_id"]
+    gbot.color = state["color"]
+    gbot.turns_count = state["turn"]
+    gbot.started_at = state["started_at"]
+    gbot.attack_color = state["attack_color"]
+    gbot.attack_position = Position(*state["attack_position"]) if state["attack_position"] else None
+    gbot.my_general = Position(*state["my_general"]) if state["my_general"] else None
+    gbot.enemy_general = [ExPosition(*g) for g in state["enemy_general"]]
+    gbot.queue = AttackQueue.load(state["queue"])
+    gbot.init_game_info = initGameInfo(game_map.width, game_map.height)
+    gbot.game_map = game_map
+    gbot.memory = snapshot.memory
+    gbot.total_viewed = gbot.memory.viewed
+    build_searches(game_map.width, game_map.height, gbot)
+    cells = range(game_map.size)
+    changed = gbot.distances.update(game_map, cells)
+    gbot.tiles.update(game_map, cells)
+    if gbot.clusters:
+        gbot.clusters.update(game_map, changed)
+    # keeps the snapshot just read until the next one is whole
+    gbot.snapshot = SnapshotWriter(path, game_map.width, game_map.height)
+    gbot.resumed = True
+    return True
+
+def register_handlers(socket, gbot):
+    gbot.socket = socket
 
     @socket.on("connect")
     def on_connect():
         pass
 
     @socket.on("update_room")
-    def on_update_room(room: Room):
+    def on_update_room(room: dict):
         gbot.room = room
-        bot_player = next((p for p in room.players if p.id == gbot.my_player_id), None)
-        gbot.color = bot_player.color
-        if not bot_player.force_start:
+        if gbot.resumed and not room["gameStarted"]:
+            # rejoined a room whose game is over: the snapshot's game is gone
+            forget_resumed(gbot)
+        bot_player = next((p for p in room["players"] if p["id"] == gbot.my_player_id), None)
+        if not bot_player:
+            return
+        gbot.color = bot_player["color"]
+        if not bot_player["forceStart"]:
             socket.emit("force_start")
-        if bot_player.is_room_host and not room.game_started:
+        if bot_player["isRoomHost"] and not room["gameStarted"]:
             socket.emit("tran")
-            human_player = next((p for p in room.players if p.id != gbot.my_player_id), None)
+            human_player = next((p for p in room["players"] if p["id"] != gbot.my_player_id), None)
             if human_player:
-                socket.emit("change_host", human_player.id)
+                socket.emit("change_host", human_player["id"])
 
     @socket.on("set_player_id")
     def on_set_player_id(player_id: str):
+        if gbot.resumed and player_id != gbot.my_player_id:
+            # the server seated us as a new player, not in the snapshot's seat
+            forget_resumed(gbot)
         gbot.my_player_id = player_id
 
     @socket.on("error")
@@ -413,25 +790,87 @@ def main():
         pass
 
     @socket.on("game_started")
-    def on_game_started(init_game_info: initGameInfo):
-        gbot.init_game_info = init_game_info
-        gbot.game_map, gbot.total_viewed = init_map(init_game_info.map_width, init_game_info.map_height)
+    def on_game_started(init_game_info: dict):
+        if gbot.resumed:
+            king = init_game_info.get("king")
+            same_map = gbot.init_game_info.map_width == init_game_info["mapWidth"] and gbot.init_game_info.map_height == init_game_info["mapHeight"]
+            same_king = king and gbot.my_general and (king["x"], king["y"]) == (gbot.my_general.x, gbot.my_general.y)
+            # `resume` already matched the room and name: keep the state only for the very same game
+            if same_map and same_king:
+                gbot.resumed = False
+                return
+            forget_resumed(gbot)
+        gbot.started_at = time.time()
+        gbot.init_game_info = initGameInfo(init_game_info["mapWidth"], init_game_info["mapHeight"])
+        warmup(init_game_info, gbot)
+        if gbot.snapshot_dir:
+            os.makedirs(gbot.snapshot_dir, exist_ok=True)
+            close_snapshot(gbot)
+            gbot.snapshot = SnapshotWriter(snapshot_path(gbot), init_game_info["mapWidth"], init_game_info["mapHeight"], fresh=True)
+        if gbot.record_dir:
+            gbot.recorder = GameRecorder(os.path.join(gbot.record_dir, f"{gbot.room_id}-{gbot.username}-{int(time.time())}.grec"))
+            gbot.recorder.game_started(init_game_info, gbot.color, gbot.my_player_id)
 
     @socket.on("game_update")
-    def on_game_update(map_diff: MapDiffData, turns_count: int, leader_board_data: LeaderBoardTable):
-        gbot.leader_board_data = leader_board_data
-        patch_map(map_diff, gbot.game_map, gbot.total_viewed, gbot.init_game_info)
+    def on_game_update(map_diff: List[Union[int, TilePropTuple]], turns_count: int, leader_board_data: list):
+        receive_update(map_diff, turns_count, leader_board_data, gbot)
         handle_move(turns_count, gbot.game_map, gbot.init_game_info, gbot)
+        finish_turn(gbot)
 
     @socket.on("game_over")
-    def on_game_over(captured_by: UserData):
-        pass
+    def on_game_over(captured_by: dict):
+        stop_recording(gbot)
+        dump_trace(gbot)
+        close_snapshot(gbot, remove=True)
 
     @socket.on("game_ended")
-    def on_game_ended(winner: UserData, replay_link: str):
-        pass
+    def on_game_ended(winner: dict, replay_link: str):
+        stop_recording(gbot)
+        dump_trace(gbot)
+        close_snapshot(gbot, remove=True)
+
+def stop_recording(gbot):
+    if gbot.recorder:
+        gbot.recorder.close()
+        gbot.recorder = None
+
+def dump_trace(gbot):
+    """Write the game's trace as `<name>.json` and `<name>.folded` to `trace_dir`."""
+    tracer = gbot.tracer
+    if not tracer.enabled or not gbot.trace_dir or not tracer.turns:
+        return
+    tracer.end_turn()
+    name = os.path.join(gbot.trace_dir, f"{gbot.room_id}-{gbot.username}-{int(time.time())}")
+    tracer.dump(name + ".json", name + ".folded")
+    gbot.tracer = Tracer(enabled=True, memory=tracer.memory)
+
+def main():
+    dotenv.load_dotenv()
+    server_url = os.getenv("SERVER_URL")
+    room_id = os.getenv("ROOM_ID")
+    bot_name = os.getenv("BOT_NAME") or "GenniaBot"
+
+    if not server_url or not room_id:
+        raise Exception("Important arguments missing.")
+
+    gbot = GBot(room_id, bot_name)
+    gbot.record_dir = os.getenv("RECORD_DIR")
+    gbot.turn_budget = float(os.getenv("TURN_BUDGET_MS") or 250) / 1000
+    gbot.trace_dir = os.getenv("TRACE_DIR")
+    gbot.tracer.enabled = bool(gbot.trace_dir)
+    gbot.tracer.memory = bool(os.getenv("TRACE_MEMORY"))
+    gbot.snapshot_dir = os.getenv("SNAPSHOT_DIR")
+    gbot.snapshot_every = int(os.getenv("SNAPSHOT_EVERY") or 1)
+    gbot.snapshot_max_age = float(os.getenv("SNAPSHOT_MAX_AGE") or gbot.snapshot_max_age)
+
+    if gbot.snapshot_dir:
+        # a restart mid-game: the handshake below tells whether it is still the same game
+        resume(gbot)
+    socket = socketio.Client()
+    register_handlers(socket, gbot)
+    socket.connect(server_url + f"?username={gbot.username}&roomId={gbot.room_id}")
 
     socket.emit("get_room_info")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
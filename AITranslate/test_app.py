@@ -0,0 +1,234 @@
+import os
+
+import pytest
+
+pytest.importorskip("socketio")
+pytest.importorskip("dotenv")
+
+from app import AttackQueue, GBot, Position, QuePurpose, register_handlers, resume
+from map_state import TileType
+from snapshot import read_snapshot
+
+WIDTH = 12
+HEIGHT = 10
+KING = (2, 3)
+
+
+class FakeSocket:
+    def __init__(self):
+        self.handlers = {}
+        self.emitted = []
+
+    def on(self, event: str):
+        def register(handler):
+            self.handlers[event] = handler
+            return handler
+
+        return register
+
+    def emit(self, *args):
+        self.emitted.append(args)
+
+
+def new_bot(snapshot_dir: str) -> GBot:
+    gbot = GBot("room", "bot")
+    gbot.snapshot_dir = snapshot_dir
+    gbot.use_native = False
+    gbot.speculate = False
+    gbot.my_player_id = "p0"
+    gbot.color = 1
+    return gbot
+
+
+def game_started(socket: FakeSocket, king=KING):
+    socket.handlers["game_started"]({"mapWidth": WIDTH, "mapHeight": HEIGHT, "king": {"x": king[0], "y": king[1]}})
+
+
+def full_diff(turn: int) -> list:
+    """Everything around our king in sight, with a mountain wall and an enemy city."""
+    tiles = []
+    for x in range(WIDTH):
+        for y in range(HEIGHT):
+            if (x, y) == KING:
+                tiles.append([TileType.King, 1, 10 + turn])
+            elif abs(x - KING[0]) + abs(y - KING[1]) == 1:
+                tiles.append([TileType.Plain, 1, 2])
+            elif x == 6 and y < 8:
+                tiles.append([TileType.Mountain, None, 0])
+            elif (x, y) == (9, 1):
+                tiles.append([TileType.City, 2, 30])
+            elif abs(x - KING[0]) <= 4 and abs(y - KING[1]) <= 4:
+                tiles.append([TileType.Plain, None, 0])
+            else:
+                tiles.append([TileType.Fog, None, None])
+    return tiles
+
+
+def play(tmp_path, turns: int = 20):
+    gbot = new_bot(str(tmp_path))
+    socket = FakeSocket()
+    register_handlers(socket, gbot)
+    game_started(socket)
+    for turn in range(1, turns + 1):
+        socket.handlers["game_update"](full_diff(turn), turn, [])
+    return gbot
+
+
+def test_attack_queue_dump_load_keeps_order():
+    queue = AttackQueue()
+    queue.push_path([Position(0, 0), Position(0, 1), Position(0, 2)], QuePurpose.ExpandLand, 5)
+    queue.push_path([Position(3, 3), Position(3, 4)], QuePurpose.Defend, 1)
+    queue.push_path([Position(5, 5), Position(5, 6), Position(6, 6)], QuePurpose.Attack, 9)
+    queue.dropped.add(3)
+    loaded = AttackQueue.load(queue.dump())
+    assert loaded.dump() == queue.dump()
+    order = []
+    while not loaded.is_empty():
+        item = loaded.pop_front()
+        if item:
+            order.append((item.purpose, item.from_pos.x, item.from_pos.y, item.to_pos.x, item.to_pos.y, item.plan))
+    assert order == [
+        (QuePurpose.Defend, 3, 3, 3, 4, 2),
+        (QuePurpose.ExpandLand, 0, 0, 0, 1, 1),
+        (QuePurpose.ExpandLand, 0, 1, 0, 2, 1),
+    ]
+    # new plans keep numbering after the restored ones
+    loaded.push_path([Position(1, 1), Position(1, 2)], QuePurpose.Attack, 1)
+    assert loaded.pop_front().plan == 4
+
+
+def test_resume_restores_the_bot(tmp_path):
+    live = play(tmp_path)
+    assert live.queue.dump()["moves"]
+    gbot = new_bot(str(tmp_path))
+    gbot.color = None
+    assert resume(gbot)
+    assert gbot.resumed
+    assert gbot.turns_count == live.turns_count == 20
+    assert gbot.color == 1 and gbot.my_player_id == "p0"
+    assert (gbot.my_general.x, gbot.my_general.y) == KING
+    assert gbot.queue.dump() == live.queue.dump()
+    for name in ("types", "owners", "armies"):
+        assert list(getattr(gbot.game_map, name)) == list(getattr(live.game_map, name))
+    assert list(gbot.total_viewed) == list(live.total_viewed)
+    assert gbot.memory.cities == live.memory.cities
+    assert gbot.memory.generals == live.memory.generals
+    # the searches are rebuilt from the restored map
+    king = gbot.game_map.index(*KING)
+    assert list(gbot.distances.field(king)) == list(live.distances.field(king))
+    live.snapshot.close()
+    gbot.snapshot.close()
+
+
+def test_resume_needs_a_snapshot_of_this_bot(tmp_path):
+    assert not resume(new_bot(str(tmp_path)))
+    play(tmp_path).snapshot.close()
+    other = GBot("room", "someone else")
+    other.snapshot_dir = str(tmp_path)
+    assert not resume(other)
+
+
+def test_same_game_keeps_resumed_state(tmp_path):
+    play(tmp_path).snapshot.close()
+    gbot = new_bot(str(tmp_path))
+    assert resume(gbot)
+    queue = gbot.queue.dump()
+    game_map = gbot.game_map
+    socket = FakeSocket()
+    register_handlers(socket, gbot)
+    game_started(socket)
+    assert not gbot.resumed
+    assert gbot.game_map is game_map
+    assert gbot.queue.dump() == queue
+    socket.handlers["game_update"](full_diff(21), 21, [])
+    assert socket.emitted
+    gbot.snapshot.close(remove=True)
+
+
+def test_other_game_discards_the_snapshot(tmp_path):
+    play(tmp_path).snapshot.close()
+    path = os.path.join(str(tmp_path), "room-bot.gsnap")
+    gbot = new_bot(str(tmp_path))
+    assert resume(gbot)
+    socket = FakeSocket()
+    register_handlers(socket, gbot)
+    game_started(socket, king=(8, 8))
+    # the new game starts its own snapshots over the old file
+    assert read_snapshot(path) is None
+    assert gbot.queue.is_empty()
+    assert gbot.my_general is None
+    assert gbot.game_map.types[gbot.game_map.index(*KING)] == TileType.Fog
+    gbot.snapshot.close(remove=True)
+
+
+def resumed_bot(tmp_path):
+    play(tmp_path).snapshot.close()
+    gbot = new_bot(str(tmp_path))
+    assert resume(gbot)
+    socket = FakeSocket()
+    register_handlers(socket, gbot)
+    return gbot, socket
+
+
+def room(started: bool, player_id: str = "p0") -> dict:
+    player = {"id": player_id, "color": 1, "forceStart": True, "isRoomHost": False}
+    return {"players": [player], "gameStarted": started}
+
+
+def test_stale_snapshot_is_deleted(tmp_path):
+    play(tmp_path).snapshot.close()
+    gbot = new_bot(str(tmp_path))
+    gbot.snapshot_max_age = -1
+    assert not resume(gbot)
+    assert not os.path.exists(os.path.join(str(tmp_path), "room-bot.gsnap"))
+    assert gbot.game_map is None
+
+
+def test_rejoining_the_same_seat_keeps_resumed_state(tmp_path):
+    gbot, socket = resumed_bot(tmp_path)
+    socket.handlers["set_player_id"]("p0")
+    socket.handlers["update_room"](room(True))
+    assert gbot.resumed and gbot.game_map is not None
+    socket.handlers["game_update"](full_diff(21), 21, [])
+    assert socket.emitted
+    assert read_snapshot(os.path.join(str(tmp_path), "room-bot.gsnap")).turn == 21
+    gbot.snapshot.close(remove=True)
+
+
+def test_new_seat_forgets_resumed_state(tmp_path):
+    gbot, socket = resumed_bot(tmp_path)
+    socket.handlers["set_player_id"]("p1")
+    assert not gbot.resumed
+    assert gbot.my_player_id == "p1"
+    assert gbot.game_map is None and gbot.queue.is_empty()
+    assert not os.path.exists(os.path.join(str(tmp_path), "room-bot.gsnap"))
+    # updates before the next game_started are ignored
+    socket.handlers["game_update"](full_diff(21), 21, [])
+    assert not socket.emitted
+
+
+def test_finished_game_forgets_resumed_state(tmp_path):
+    gbot, socket = resumed_bot(tmp_path)
+    socket.handlers["set_player_id"]("p0")
+    socket.handlers["update_room"](room(False))
+    assert not gbot.resumed and gbot.game_map is None
+    assert not os.path.exists(os.path.join(str(tmp_path), "room-bot.gsnap"))
+
+
+def test_game_over_deletes_the_snapshot(tmp_path):
+    gbot = play(tmp_path)
+    path = os.path.join(str(tmp_path), "room-bot.gsnap")
+    assert os.path.exists(path)
+    gbot.socket.handlers["game_over"]({})
+    assert not os.path.exists(path)
+
+
+def test_app_bot_uses_snapshots(tmp_path):
+    from bots import AppBot
+
+    play(tmp_path).snapshot.close()
+    bot = AppBot(FakeSocket(), "room", "bot")
+    assert bot.use_snapshots(str(tmp_path))
+    assert bot.gbot.resumed and bot.gbot.turns_count == 20
+    bot.gbot.snapshot.close(remove=True)
+    assert not AppBot(FakeSocket(), "room", "bot").use_snapshots(str(tmp_path))
@@ -1,7 +1,16 @@
 #include <pybind11/pybind11.h>
+#include <pybind11/stl.h>
 #include <algorithm>
+#include <chrono>
+#include <cstdint>
+#include <mutex>
+#include <random>
+#include <string>
+#include <tuple>
+#include <utility>
+#include <vector>
 
-// TileType
+// TileType, same values as the server and map_state.TileType
 #define TILE_KING 0
 #define TILE_CITY 1
 #define TILE_FOG 2
@@ -13,114 +22,294 @@
 typedef int TileType;
 // End TileType
 
-// QuePurpose
-#define QUE_DEFEND 0
-#define QUE_ATTACK 1
-#define QUE_ATTACK_GATHER 2
-#define QUE_ATTACK_GENERAL 3
-#define QUE_EXPAND_CITY 4
-#define QUE_EXPAND_LAND 5
+namespace py = pybind11;
 
-typedef int QuePurpose;
-// End QuePurpose
+// (dx, dy) in the same order as the bots' `directions`
+const int DX[] = { -1, 0, 1, 0 };
+const int DY[] = { 0, 1, 0, -1 };
 
-int add(int i, int j) {
-    return i + j;
-}
+// searches look at the clock once per this many expanded cells
+const int CHECK_EVERY = 256;
+
+typedef std::chrono::steady_clock Clock;
 
-struct Position {
-    int x;
-    int y;
+// One map array as handed over by Python (array.array, numpy, memoryview...).
+// The pointer aliases the caller's memory, nothing is copied.
+template <typename T>
+struct MapBuffer {
+    py::buffer_info info;
+    const T* data;
 
-    friend Position operator+ (Position a, Position b) {
-        return Position{ a.x + b.x, a.y + b.y };
+    MapBuffer(py::buffer buffer, int size, const char* name) : info(buffer.request()) {
+        if (info.ndim != 1 || info.itemsize != sizeof(T) || info.format != py::format_descriptor<T>::format()) {
+            throw py::type_error(std::string(name) + " must be a flat buffer of " + py::format_descriptor<T>::format() + " items");
+        }
+        if (info.size != size) {
+            throw py::value_error(std::string(name) + " has " + std::to_string(info.size) + " cells, expected " + std::to_string(size));
+        }
+        data = static_cast<const T*>(info.ptr);
     }
 };
 
-struct TileProp {
-    TileType type;
-    int color;
-    int army;
-};
+// The three map arrays. Holding the buffer exports for the whole call also
+// stops Python from resizing them while the GIL is released.
+struct MapView {
+    MapBuffer<int8_t> t;
+    MapBuffer<int16_t> o;
+    MapBuffer<int32_t> a;
+    const int8_t* types;
+    const int16_t* owners;
+    const int32_t* armies;
 
-struct BFSQueueItem {
-    Position pos;
-    int step;
-    std::vector<Position> way;
+    MapView(py::buffer types, py::buffer owners, py::buffer armies, int size)
+        : t(types, size, "types"), o(owners, size, "owners"), a(armies, size, "armies"),
+          types(t.data), owners(o.data), armies(a.data) {}
 };
 
-const Position directions[] = { Position{-1, 0}, Position{0, 1}, Position{1, 0}, Position{0, -1} };
 
-
-class GBot {
+// Native versions of the searches in pathfinding.py and expansion.py, over
+// flat cell indices `x * height + y`. The searches share one set of scratch
+// arrays and run without the GIL, so calls on the same Engine from several
+// threads take turns on `busy`; use one Engine per thread to run them at once.
+class Engine {
     public:
-        GBot(
-            const int color,
-            TileProp** game_map,
-            int map_width,
-            int map_height
-        ) : color(color), game_map(game_map), map_width(map_width), map_height(map_height) {}
-        ~GBot() {}
-
-        void updateMap(TileProp** new_map) {
-            game_map = new_map;
-        }
-
-        void gatherArmies(QuePurpose purpose, int priority, Position toPos, int limit) {
-            que_front = que_end = 0;
-            bfs_queue[que_end] = BFSQueueItem{ toPos, 0, std::vector<Position>()};
-            bfs_queue[que_end].way.push_back(toPos);
-            while (que_front <= que_end) {
-                BFSQueueItem fr = bfs_queue[que_front++];
-                std::random_shuffle(directions, directions + 4);
-                for (auto& dir : directions) {
-                    auto to = fr.pos + dir;
-                    if (posOutOfRange(pos)) continue;
+        Engine(int width, int height)
+            : width(width), height(height), size(checkedSize(width, height)),
+              neighbors(size * 4, -1), queue(size * 4 + 1), order(size), parent(size, -1),
+              depth(size), value(size), state(size), rng(std::random_device{}()) {
+            for (int x = 0; x < width; x++) {
+                for (int y = 0; y < height; y++) {
+                    for (int d = 0; d < 4; d++) {
+                        int nx = x + DX[d], ny = y + DY[d];
+                        if (nx >= 0 && nx < width && ny >= 0 && ny < height) {
+                            neighbors[(x * height + y) * 4 + d] = nx * height + ny;
+                        }
+                    }
                 }
             }
         }
 
+        void seed(unsigned int n) {
+            std::lock_guard<std::mutex> lock(busy);
+            rng.seed(n);
+        }
+
+        // Army-weighted search from `source`, as SearchKernel.gather. Returns the
+        // cells from the best reached tile back to `source`, empty if none.
+        std::vector<int> gather(int source, int color, py::buffer types, py::buffer owners, py::buffer armies, int limit, double budget) {
+            MapView map(types, owners, armies, size);
+            checkCell(source);
+            std::vector<int> way;
+            {
+                py::gil_scoped_release release;
+                std::lock_guard<std::mutex> lock(busy);
+                int best = gatherSearch(source, color, map, limit, budget);
+                for (int cell = best; cell >= 0 && best >= 0; cell = parent[cell]) {
+                    way.push_back(cell);
+                }
+            }
+            return way;
+        }
+
+        // Every capture of a `target_type` tile next to our land as
+        // (surplus, source, target), best first, as expansion.plan_expansion.
+        std::vector<std::tuple<int, int, int>> expand(int color, py::buffer types, py::buffer owners, py::buffer armies, int target_type) {
+            MapView map(types, owners, armies, size);
+            std::vector<std::tuple<int, int, int>> captures;
+            {
+                py::gil_scoped_release release;
+                std::lock_guard<std::mutex> lock(busy);
+                std::vector<int>& best = order;  // source per frontier tile
+                std::vector<int64_t>& surplus = value;
+                std::fill(best.begin(), best.end(), -1);
+                std::vector<int> frontier;
+                for (int i = 0; i < size; i++) {
+                    if (map.owners[i] != color) continue;
+                    int64_t movable = std::max(map.armies[i] - 1, 0);
+                    for (int d = 0; d < 4; d++) {
+                        int b = neighbors[i * 4 + d];
+                        if (b < 0 || map.owners[b] == color || map.types[b] != target_type) continue;
+                        int64_t left = movable - map.armies[b];
+                        if (best[b] < 0) {
+                            frontier.push_back(b);
+                        } else if (surplus[b] >= left) {
+                            continue;
+                        }
+                        best[b] = i;
+                        surplus[b] = left;
+                    }
+                }
+                // shuffle first so equal surpluses come out in random order
+                std::shuffle(frontier.begin(), frontier.end(), rng);
+                std::stable_sort(frontier.begin(), frontier.end(), [&](int a, int b) { return surplus[a] > surplus[b]; });
+                captures.reserve(frontier.size());
+                for (int b : frontier) {
+                    captures.emplace_back((int)surplus[b], best[b], b);
+                }
+            }
+            return captures;
+        }
+
+        // The most dangerous enemy tile seen from `general`: BFS over revealed
+        // tiles, scored by army minus distance. Returns (cell, score) or None.
+        py::object threat(int general, int color, py::buffer types, py::buffer owners, py::buffer armies, double budget) {
+            MapView map(types, owners, armies, size);
+            checkCell(general);
+            int best = -1;
+            int64_t best_score = 0;
+            {
+                py::gil_scoped_release release;
+                std::lock_guard<std::mutex> lock(busy);
+                int count = bfs(general, map, budget);
+                for (int k = 1; k < count; k++) {
+                    int i = order[k];
+                    if (map.owners[i] < 0 || map.owners[i] == color) continue;
+                    int64_t score = (int64_t)map.armies[i] - depth[i];
+                    if (best < 0 || score > best_score) {
+                        best = i;
+                        best_score = score;
+                    }
+                }
+            }
+            if (best < 0) return py::none();
+            return py::make_tuple(best, best_score);
+        }
+
     private:
-        const int color;
-        Position my_general;
-        Position* enemy_generals;
-        int attack_color;
-        Position attack_position;
-        TileProp** game_map;
-        int map_width;
-        int map_height;
-        bool** total_visited;
-        BFSQueueItem bfs_queue[114514];
-        int que_front;
-        int que_end;
+        const int width;
+        const int height;
+        const int size;
+        std::vector<int> neighbors;
+        std::vector<int> queue;
+        std::vector<int> order;
+        std::vector<int> parent;
+        std::vector<int> depth;
+        std::vector<int64_t> value;
+        std::vector<uint8_t> state;
+        std::mt19937 rng;
+        // held by whichever call is using the scratch arrays and `rng`
+        std::mutex busy;
 
-        bool posOutOfRange(Position pos) {
-            return pos.x < 0 || pos.x >= map_width || pos.y < 0 || pos.y > map_height;
+        static int checkedSize(int width, int height) {
+            if (width <= 0 || height <= 0) {
+                throw py::value_error("map size must be positive");
+            }
+            return width * height;
         }
 
-        bool unRevealed(TileType type) {
-            return type == TILE_FOG || type == TILE_OBSTACLE;
+        void checkCell(int cell) {
+            if (cell < 0 || cell >= size) {
+                throw py::index_error("cell " + std::to_string(cell) + " is off the map");
+            }
         }
 
-        bool unMoveable(TileType type, bool ignore_city) {
-            return type == TILE_MOUNTAIN || type == TILE_OBSTACLE || (ignore_city && type == TILE_CITY);
+        static bool moveBlocked(int type) {
+            return type == TILE_MOUNTAIN || type == TILE_OBSTACLE;
+        }
+
+        static bool sightBlocked(int type) {
+            return type == TILE_FOG || type == TILE_OBSTACLE || type == TILE_MOUNTAIN;
         }
-};
 
+        // a random visiting order of the four directions
+        void directionOrder(int* dirs) {
+            for (int d = 0; d < 4; d++) dirs[d] = d;
+            std::shuffle(dirs, dirs + 4, rng);
+        }
 
-namespace py = pybind11;
+        bool expired(Clock::time_point end, double budget, int expanded) {
+            return budget >= 0 && expanded % CHECK_EVERY == 0 && Clock::now() >= end;
+        }
+
+        Clock::time_point deadline(double budget) {
+            return Clock::now() + std::chrono::duration_cast<Clock::duration>(std::chrono::duration<double>(budget < 0 ? 0 : budget));
+        }
+
+        int gatherSearch(int source, int color, const MapView& map, int limit, double budget) {
+            Clock::time_point end = deadline(budget);
+            std::fill(state.begin(), state.end(), 0);
+            int dirs[4];
+            state[source] = 1;
+            value[source] = map.armies[source];
+            parent[source] = -1;
+            depth[source] = 0;
+            queue[0] = source;
+            int front = 0, back = 1;
+            int best = -1;
+            int64_t best_value = 0;
+            while (front < back) {
+                int a = queue[front++];
+                if (expired(end, budget, front)) break;
+                if (state[a] == 2) continue;
+                state[a] = 2;
+                // a cell re-queued for a better value can sit ahead of shallower ones
+                if (limit >= 0 && depth[a] >= limit) continue;
+                int64_t moved = value[a] - 1;
+                directionOrder(dirs);
+                for (int k = 0; k < 4; k++) {
+                    int b = neighbors[a * 4 + dirs[k]];
+                    if (b < 0 || state[b] == 2 || moveBlocked(map.types[b])) continue;
+                    int64_t next;
+                    if (map.owners[b] != color) {
+                        if (map.types[b] == TILE_CITY) continue;
+                        next = moved - map.armies[b];
+                    } else {
+                        next = moved + map.armies[b];
+                    }
+                    if (state[b] && value[b] >= next) continue;
+                    state[b] = 1;
+                    value[b] = next;
+                    parent[b] = a;
+                    depth[b] = depth[a] + 1;
+                    queue[back++] = b;
+                    if (next > best_value) {
+                        best = b;
+                        best_value = next;
+                    }
+                }
+            }
+            return best;
+        }
+
+        int bfs(int source, const MapView& map, double budget) {
+            Clock::time_point end = deadline(budget);
+            std::fill(state.begin(), state.end(), 0);
+            int dirs[4];
+            state[source] = 1;
+            order[0] = source;
+            depth[source] = 0;
+            int front = 0, back = 1;
+            while (front < back) {
+                int a = order[front++];
+                if (expired(end, budget, front)) break;
+                directionOrder(dirs);
+                for (int k = 0; k < 4; k++) {
+                    int b = neighbors[a * 4 + dirs[k]];
+                    if (b < 0 || state[b] || sightBlocked(map.types[b])) continue;
+                    state[b] = 1;
+                    depth[b] = depth[a] + 1;
+                    order[back++] = b;
+                }
+            }
+            return back;
+        }
+};
 
-PYBIND11_MODULE(example, m) {
-    // optional module docstring
-    m.doc() = "pybind11 example plugin";
 
-    // define add function
-    m.def("add", &add, "A function which adds two numbers");
+PYBIND11_MODULE(BotEngine, m) {
+    m.doc() = "Native gather/expand/threat searches over the bot's flat map arrays";
 
-    // bindings to GBot class
-    py::class_<GBot>(m, "GBot")
-        .def(py::init<const std::string &, int>())
-        .def("go_for_a_walk", &GBot::go_for_a_walk)
-        .def("get_hunger", &GBot::get_hunger)
-        .def("get_name", &GBot::get_name);
+    py::class_<Engine>(m, "Engine")
+        .def(py::init<int, int>(), py::arg("width"), py::arg("height"))
+        .def("seed", &Engine::seed, py::arg("n"))
+        .def("gather", &Engine::gather,
+             py::arg("source"), py::arg("color"), py::arg("types"), py::arg("owners"), py::arg("armies"),
+             py::arg("limit") = -1, py::arg("budget") = -1.0,
+             "Cells from the best tile to gather from back to `source`; `budget` is in seconds, negative for none")
+        .def("expand", &Engine::expand,
+             py::arg("color"), py::arg("types"), py::arg("owners"), py::arg("armies"), py::arg("target_type") = TILE_PLAIN,
+             "(surplus, source, target) for every capturable tile next to our land, best first")
+        .def("threat", &Engine::threat,
+             py::arg("general"), py::arg("color"), py::arg("types"), py::arg("owners"), py::arg("armies"), py::arg("budget") = -1.0,
+             "(cell, army - distance) of the most dangerous enemy tile in sight of `general`, or None");
 }
@@ -0,0 +1,184 @@
+"""Run a bot on an asyncio socket client, planning only on the newest update.
+
+    python async_runtime.py --bot app
+
+Socket events are queued as they arrive and handled in order by a single
+consumer task, so the bot's state only ever has one writer. Every
+`game_update` is patched into the map, but when several arrive while the
+bot is still thinking about an older one, it only plans for the latest and
+the superseded turns are counted as dropped. Planning runs in a worker
+thread so the connection keeps reading while it does, and the bot's emits
+are handed back to the event loop instead of blocking on the socket.
+With `snapshot_dir` (`SNAPSHOT_DIR`), a bot that keeps snapshots restores
+the game it was playing before it connects.
+"""
+import argparse
+import asyncio
+import os
+import time
+import traceback
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+import socketio
+from dotenv import load_dotenv
+
+from bots import BOTS, create_bot
+from latency import format_summary, summarize
+
+# these end the game for this bot, nothing is planned after them
+FINAL_EVENTS = ("game_over", "game_ended")
+
+
+class BotClient:
+    """The `socketio.Client` surface the bots expect, backed by an AsyncClient.
+
+    Handlers are only collected here; `AsyncBotRuntime` decides when they
+    run. `emit` and `disconnect` may be called from the planning thread.
+    """
+
+    def __init__(self, sio: socketio.AsyncClient):
+        self.sio = sio
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.handlers: Dict[str, Callable] = {}
+
+    @property
+    def sid(self):
+        return self.sio.sid
+
+    def event(self, handler: Callable) -> Callable:
+        self.handlers[handler.__name__] = handler
+        return handler
+
+    def on(self, event: str, handler: Optional[Callable] = None):
+        if handler:
+            self.handlers[event] = handler
+            return handler
+
+        def set_handler(handler: Callable) -> Callable:
+            self.handlers[event] = handler
+            return handler
+
+        return set_handler
+
+    def emit(self, event: str, data=None, **kwargs):
+        asyncio.run_coroutine_threadsafe(self.sio.emit(event, data, **kwargs), self.loop)
+
+    def disconnect(self):
+        asyncio.run_coroutine_threadsafe(self.sio.disconnect(), self.loop)
+
+
+class RuntimeStats:
+    def __init__(self):
+        self.updates = 0
+        self.planned = 0
+        self.dropped = 0  # patched, but a newer update arrived before planning
+        self.latency: List[float] = []  # ms per plan
+
+    def as_dict(self) -> dict:
+        return {
+            "updates": self.updates,
+            "planned": self.planned,
+            "dropped": self.dropped,
+            "latency": summarize(self.latency),
+        }
+
+
+class AsyncBotRuntime:
+    def __init__(
+        self, kind: str, room_id: str, username: str, sio: Optional[socketio.AsyncClient] = None, snapshot_dir: Optional[str] = None
+    ):
+        self.sio = sio or socketio.AsyncClient()
+        self.client = BotClient(self.sio)
+        self.bot = create_bot(kind, self.client, room_id, username)
+        self.room_id = room_id
+        self.username = username
+        self.snapshot_dir = snapshot_dir
+        self.resumed = False
+        self.inbox: deque = deque()
+        self.wake = asyncio.Event()
+        self.finished = False
+        # disconnect once the game is over instead of waiting in the room
+        self.leave_after_game = False
+        self.stats = RuntimeStats()
+        for event in self.client.handlers:
+            self.sio.on(event, handler=self.receiver(event))
+
+    def receiver(self, event: str):
+        async def receive(*args):
+            self.inbox.append((event, args))
+            self.wake.set()
+
+        return receive
+
+    async def plan(self, turns_count: int):
+        start = time.perf_counter()
+        await asyncio.get_running_loop().run_in_executor(None, self.bot.plan, turns_count)
+        self.stats.planned += 1
+        self.stats.latency.append((time.perf_counter() - start) * 1000)
+
+    async def consume(self):
+        while True:
+            await self.wake.wait()
+            self.wake.clear()
+            latest = None
+            while self.inbox:
+                event, args = self.inbox.popleft()
+                if event in FINAL_EVENTS:
+                    self.finished = True
+                elif event == "game_started":
+                    # a new game in the same room: plan again, but not for the last game's turns
+                    self.finished = False
+                    if latest is not None:
+                        self.stats.dropped += 1
+                        latest = None
+                try:
+                    if event == "game_update":
+                        self.bot.patch(*args)
+                        self.stats.updates += 1
+                        if latest is not None:
+                            self.stats.dropped += 1
+                        latest = args[1]
+                    else:
+                        self.client.handlers[event](*args)
+                except Exception:
+                    # like socketio's own dispatch: report it and keep going
+                    traceback.print_exc()
+            if self.finished and self.leave_after_game and self.sio.connected:
+                await self.sio.disconnect()
+            if latest is not None:
+                if self.finished:
+                    self.stats.dropped += 1
+                    continue
+                try:
+                    await self.plan(latest)
+                except Exception:
+                    traceback.print_exc()
+
+    async def run(self, server_url: str):
+        self.client.loop = asyncio.get_running_loop()
+        if self.snapshot_dir:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            self.resumed = self.bot.use_snapshots(self.snapshot_dir)
+        consumer = asyncio.create_task(self.consume())
+        try:
+            await self.sio.connect(server_url + f"?username={self.username}&roomId={self.room_id}")
+            await self.sio.emit(self.bot.join_event)
+            await self.sio.wait()
+        finally:
+            consumer.cancel()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Run a bot on an asyncio socket client")
+    parser.add_argument("--bot", type=str, default="random", choices=list(BOTS))
+    args = parser.parse_args()
+
+    runtime = AsyncBotRuntime(args.bot, os.getenv("ROOM_ID"), os.getenv("BOT_NAME"), snapshot_dir=os.getenv("SNAPSHOT_DIR"))
+    asyncio.run(runtime.run(os.getenv("SERVER_URL")))
+    stats = runtime.stats.as_dict()
+    print(
+        f"updates={stats['updates']} planned={stats['planned']} dropped={stats['dropped']} "
+        f"plan latency: {format_summary(stats['latency'])}"
+    )
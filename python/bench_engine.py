@@ -0,0 +1,100 @@
+"""Time the native BotEngine searches against the pure-Python ones.
+
+    python bench_engine.py --sizes 20,50,100,200 --repeat 20
+
+Each size gets a random board with one player owning a blob around the
+middle and an enemy scattered across it. The same MapState arrays are
+handed to both sides, the engine reads them in place.
+"""
+import argparse
+import random
+import time
+from typing import Callable, Dict
+
+from expansion import plan_expansion
+from map_state import MapState, TileType
+from native import BotEngine
+from pathfinding import SIGHT_BLOCKED, SearchKernel
+
+COLOR = 1
+ENEMY = 2
+
+
+def random_map(width: int, height: int, seed: int) -> MapState:
+    rng = random.Random(seed)
+    game_map = MapState(width, height)
+    cx, cy = width // 2, height // 2
+    radius = max(width, height) // 4
+    for x in range(width):
+        for y in range(height):
+            i = game_map.index(x, y)
+            roll = rng.random()
+            if roll < 0.15:
+                game_map.types[i] = TileType.Mountain
+                continue
+            game_map.types[i] = TileType.City if roll < 0.17 else TileType.Plain
+            if abs(x - cx) + abs(y - cy) <= radius:
+                game_map.owners[i] = COLOR
+                game_map.armies[i] = rng.randint(1, 30)
+            elif roll > 0.9:
+                game_map.owners[i] = ENEMY
+                game_map.armies[i] = rng.randint(1, 30)
+            elif game_map.types[i] == TileType.City:
+                game_map.armies[i] = 40
+    return game_map
+
+
+def best_ms(fn: Callable, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def bench(width: int, height: int, repeat: int, seed: int = 0) -> Dict[str, Dict[str, float]]:
+    game_map = random_map(width, height, seed)
+    kernel = SearchKernel(width, height)
+    engine = BotEngine.Engine(width, height)
+    engine.seed(seed)
+    middle = game_map.index(width // 2, height // 2)
+    arrays = (game_map.types, game_map.owners, game_map.armies)
+
+    def python_gather():
+        best = kernel.gather(middle, COLOR, game_map)
+        return kernel.path(best) if best >= 0 else []
+
+    def python_threat():
+        count = kernel.bfs(middle, game_map, SIGHT_BLOCKED)
+        owners = game_map.owners
+        return max(
+            ((i, game_map.armies[i] - kernel.depth[i]) for i in kernel.order[1:count] if owners[i] >= 0 and owners[i] != COLOR),
+            key=lambda t: t[1],
+            default=None,
+        )
+
+    pairs = {
+        "gather": (python_gather, lambda: engine.gather(middle, COLOR, *arrays)),
+        "expand": (lambda: plan_expansion(game_map, COLOR, kernel.neighbors), lambda: engine.expand(COLOR, *arrays)),
+        "threat": (python_threat, lambda: engine.threat(middle, COLOR, *arrays)),
+    }
+    results = {}
+    for name, (python_fn, native_fn) in pairs.items():
+        python_ms = best_ms(python_fn, repeat)
+        native_ms = best_ms(native_fn, repeat)
+        results[name] = {"python_ms": python_ms, "native_ms": native_ms, "speedup": python_ms / native_ms if native_ms else 0.0}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark BotEngine against the pure-Python searches")
+    parser.add_argument("--sizes", type=str, default="20,50,100,200", help="comma separated square map sizes")
+    parser.add_argument("--repeat", type=int, default=20, help="runs per search, the best one is kept")
+    args = parser.parse_args()
+    if not BotEngine:
+        parser.exit(1, "BotEngine is not built, see README.md (with C++)\n")
+
+    for size in (int(s) for s in args.sizes.split(",")):
+        for name, r in bench(size, size, args.repeat).items():
+            print(f"{size}x{size} {name}: python {r['python_ms']:.3f}ms native {r['native_ms']:.3f}ms ({r['speedup']:.1f}x)")
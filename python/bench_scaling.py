@@ -0,0 +1,322 @@
+"""Time the bots' per-turn work on synthetic boards from 10x10 to 500x500.
+
+    python bench_scaling.py --sizes 10,50,100,200,500 --mountains 0.1,0.3 --fog 0,0.5,0.9 \
+        --out scaling.json --baseline baseline.json
+
+Every combination of size, mountain density, city density and fog coverage
+gets a random board: our player holds a blob around one king, an enemy a
+blob around another plus scattered land, and `fog` of the cells we don't
+touch are hidden. A first full update is followed by `--turns` updates
+that grow kings and cities and move armies and fog around a few cells, in
+the server's run-length format. Timed per call:
+
+- `main.py`'s `GBot.patch_map` on every update, and `GBot.handle_move`
+  moving at random (`handle_move`) and by beam search (`handle_move.beam`)
+- `AITranslate/app.py`'s `gather_armies`, `quick_expand`, `detect_threat`
+  and `expand_land` on the final map, with no deadline
+
+Each op reports latency percentiles, calls and cells per second, and the
+peak memory one call allocates (tracemalloc, measured on a separate call).
+Results go to `--out` as JSON. With `--baseline`, ops whose fastest call or peak
+memory grew by more than `--tolerance` over that file are listed and the
+exit status is 1, so a results file can be checked in and compared against.
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from itertools import product
+from typing import Callable, Dict, List, Tuple, Union
+
+from bots import APP_DIR
+from latency import summarize
+from map_state import NO_OWNER, TilePropTuple, TileType
+from native import BotEngine
+from replay import start_bot
+from simulator import diff_views
+
+COLOR = 1
+ENEMY = 2
+# share of the board's cells changed by each update after the first
+CHURN = 0.01
+
+
+class Board:
+    """The true state of a synthetic game and what `COLOR` sees of it."""
+
+    def __init__(self, width: int, height: int, mountains: float, cities: float, fog: float, seed: int):
+        self.width = width
+        self.height = height
+        self.size = width * height
+        self.random = rng = random.Random(seed)
+        self.turn = 0
+        size = self.size
+        self.types = [TileType.Plain] * size
+        self.owners = [NO_OWNER] * size
+        self.armies = [0] * size
+        self.home = self.index(width // 4, height // 4)
+        self.enemy_home = self.index(width - 1 - width // 4, height - 1 - height // 4)
+        radius = max(max(width, height) // 6, 1)
+        for i in range(size):
+            x, y = divmod(i, height)
+            roll = rng.random()
+            if roll < mountains:
+                self.types[i] = TileType.Mountain
+                continue
+            if roll < mountains + cities:
+                self.types[i] = TileType.City
+                self.armies[i] = rng.randrange(35, 55)
+            for home, color in ((self.home, COLOR), (self.enemy_home, ENEMY)):
+                hx, hy = divmod(home, height)
+                if abs(x - hx) + abs(y - hy) <= radius:
+                    self.owners[i] = color
+                    self.armies[i] = rng.randint(1, 30)
+            if self.owners[i] == NO_OWNER and rng.random() < 0.05:
+                self.owners[i] = ENEMY
+                self.armies[i] = rng.randint(1, 30)
+        for home, color in ((self.home, COLOR), (self.enemy_home, ENEMY)):
+            self.types[home] = TileType.King
+            self.owners[home] = color
+            self.armies[home] = 50
+        # our land and the ring around it are always in sight
+        self.hidden = bytearray(size)
+        near = bytearray(size)
+        for i in range(size):
+            if self.owners[i] == COLOR:
+                x, y = divmod(i, height)
+                for nx in range(max(x - 1, 0), min(x + 2, width)):
+                    for ny in range(max(y - 1, 0), min(y + 2, height)):
+                        near[nx * height + ny] = 1
+        for i in range(size):
+            if not near[i] and rng.random() < fog:
+                self.hidden[i] = 1
+        self.view = [self.tile(i) for i in range(size)]
+
+    def index(self, x: int, y: int) -> int:
+        return x * self.height + y
+
+    def tile(self, i: int) -> TilePropTuple:
+        if self.hidden[i]:
+            blocked = self.types[i] == TileType.Mountain or self.types[i] == TileType.City
+            return [TileType.Obstacle if blocked else TileType.Fog, None, 0]
+        owner = self.owners[i]
+        return [self.types[i], None if owner == NO_OWNER else owner, self.armies[i]]
+
+    def first_update(self) -> List[Union[int, TilePropTuple]]:
+        return diff_views(None, self.view)
+
+    def step(self) -> List[Union[int, TilePropTuple]]:
+        """Advance a turn and return the update `COLOR` gets for it."""
+        rng = self.random
+        self.turn += 1
+        changed = []
+        if self.turn % 2 == 0:
+            for i in range(self.size):
+                if self.owners[i] != NO_OWNER and (self.types[i] == TileType.King or self.types[i] == TileType.City):
+                    self.armies[i] += 1
+                    changed.append(i)
+        for _ in range(max(int(self.size * CHURN), 1)):
+            i = rng.randrange(self.size)
+            if self.types[i] == TileType.Mountain or i == self.home or i == self.enemy_home:
+                continue
+            roll = rng.random()
+            if roll < 0.2:
+                self.hidden[i] ^= 1
+            elif roll < 0.5:
+                self.owners[i] = rng.choice((COLOR, ENEMY, NO_OWNER))
+                self.armies[i] = rng.randint(0 if self.owners[i] == NO_OWNER else 1, 30)
+            else:
+                self.armies[i] = max(self.armies[i] + rng.randint(-5, 5), 1 if self.owners[i] != NO_OWNER else 0)
+            changed.append(i)
+        prev = self.view
+        self.view = list(prev)
+        for i in changed:
+            self.view[i] = self.tile(i)
+        return diff_views(prev, self.view)
+
+
+def measure(fn: Callable, repeat: int, prepare: Union[Callable, None] = None) -> Tuple[List[float], int]:
+    """Latency samples in ms of `repeat` calls, and the peak bytes one extra call allocates."""
+    samples = []
+    for _ in range(repeat):
+        if prepare:
+            prepare()
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    if prepare:
+        prepare()
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return samples, peak
+
+
+def calibrate(repeat: int = 5) -> float:
+    """Best time in ms of a fixed pure-Python loop, how fast this machine is right now."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        total = 0
+        for i in range(200000):
+            total += i & 7
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def report(samples: List[float], peak: int, size: int) -> Dict[str, float]:
+    result = summarize(samples)
+    result["min"] = min(samples, default=0.0)
+    per_sec = 1000 / result["mean"] if result["mean"] else 0.0
+    result.update(per_sec=per_sec, cells_per_sec=per_sec * size, peak_kb=peak / 1024)
+    return result
+
+
+def bench_board(
+    width: int,
+    height: int,
+    mountains: float,
+    cities: float,
+    fog: float,
+    turns: int,
+    repeat: int,
+    native: bool,
+    budget: float,
+    seed: int = 0,
+) -> Dict[str, Dict[str, float]]:
+    board = Board(width, height, mountains, cities, fog, seed)
+    first = board.first_update()
+    updates = [board.step() for _ in range(turns)]
+    init_game_info = {"mapWidth": width, "mapHeight": height}
+    size = width * height
+    ops = {}
+
+    for kind, name in (("random", "handle_move"), ("beam", "handle_move.beam")):
+        _, bot = start_bot(kind, COLOR, init_game_info)
+        gbot = bot.gbot
+        gbot.turn_budget = budget
+        samples = []
+        for turn, map_diff in enumerate([first] + updates):
+            gbot.turns_count = turn
+            start = time.perf_counter()
+            gbot.patch_map(map_diff)
+            samples.append((time.perf_counter() - start) * 1000)
+        if kind == "random":
+            # the first update is the whole board, the rest are a turn's worth of changes
+            ops["patch_map.first"] = report(samples[:1], 0, size)
+            ops["patch_map"] = report(samples[1:], 0, size)
+        ops[name] = report(*measure(gbot.handle_move, repeat), size)
+    # a fresh bot to see what one update allocates
+    _, bot = start_bot("random", COLOR, init_game_info)
+    bot.gbot.patch_map(first)
+    _, peak = measure(lambda: bot.gbot.patch_map(updates[0]), 0)
+    ops["patch_map"]["peak_kb"] = peak / 1024
+
+    if APP_DIR not in sys.path:
+        sys.path.insert(0, APP_DIR)
+    import app
+
+    _, bot = start_bot("app", COLOR, init_game_info)
+    gbot = bot.gbot
+    gbot.use_native = native
+    gbot.engine = BotEngine.Engine(width, height) if native and BotEngine else None
+    for turn, map_diff in enumerate([first] + updates):
+        app.receive_update(map_diff, turn, [], gbot)
+    game_map = gbot.game_map
+    info = gbot.init_game_info
+    target = app.Position(*game_map.position(board.enemy_home))
+    reach = 2 * (width + height)
+
+    def reset():
+        gbot.queue.clear()
+        gbot.attack_color = -1
+        gbot.attack_position = None
+
+    searches = {
+        "gather_armies": lambda: app.gather_armies(app.QuePurpose.Attack, 10, target, reach, game_map, info, gbot),
+        "quick_expand": lambda: app.quick_expand(game_map, gbot.total_viewed, gbot),
+        "detect_threat": lambda: app.detect_threat(game_map, info, gbot),
+        "expand_land": lambda: app.expand_land(game_map, info, gbot),
+    }
+    for name, fn in searches.items():
+        ops[name] = report(*measure(fn, repeat, reset), size)
+    return ops
+
+
+def compare(results: dict, baseline: dict, tolerance: float, min_ms: float) -> List[str]:
+    """One line per op that got slower or hungrier than in `baseline`.
+
+    Times are scaled by the calibration each board was run with first, so a
+    machine that is busier or slower across the board does not flag every op.
+    """
+    before = {b["board"]: b for b in baseline["boards"]}
+    flagged = []
+    for b in results["boards"]:
+        base = before.get(b["board"])
+        if not base:
+            continue
+        scale = b["calibration_ms"] / base["calibration_ms"]
+        for op, r in b["ops"].items():
+            old = base["ops"].get(op)
+            if not old:
+                continue
+            # the fastest call is the one least disturbed by the rest of the machine
+            best = r["min"] / scale
+            if max(old["min"], best) >= min_ms and best > old["min"] * (1 + tolerance):
+                flagged.append(f"{b['board']} {op}: best {old['min']:.3f}ms -> {best:.3f}ms (scaled)")
+            if old["peak_kb"] and r["peak_kb"] > old["peak_kb"] * (1 + tolerance):
+                flagged.append(f"{b['board']} {op}: peak {old['peak_kb']:.1f}kB -> {r['peak_kb']:.1f}kB")
+    return flagged
+
+
+def floats(text: str) -> List[float]:
+    return [float(s) for s in text.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the bots across map sizes, densities and fog")
+    parser.add_argument("--sizes", type=str, default="10,50,100,200,500", help="comma separated square map sizes")
+    parser.add_argument("--mountains", type=str, default="0.1,0.3", help="comma separated mountain densities")
+    parser.add_argument("--cities", type=str, default="0.02", help="comma separated city densities")
+    parser.add_argument("--fog", type=str, default="0,0.5,0.9", help="comma separated shares of hidden cells")
+    parser.add_argument("--turns", type=int, default=10, help="updates to patch after the first one")
+    parser.add_argument("--repeat", type=int, default=5, help="calls per move or search")
+    parser.add_argument("--budget-ms", type=float, default=250, help="handle_move's turn budget")
+    parser.add_argument("--python", action="store_true", help="keep app.py on its Python searches even if BotEngine is built")
+    parser.add_argument("--out", type=str, default="scaling.json", help="where to write the results")
+    parser.add_argument("--baseline", type=str, help="results file to flag regressions against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="growth over the baseline that counts as a regression")
+    parser.add_argument("--min-ms", type=float, default=0.2, help="ignore timing changes of ops faster than this")
+    args = parser.parse_args()
+
+    native = bool(BotEngine) and not args.python
+    results = {
+        "python": platform.python_version(),
+        "native": native,
+        "turns": args.turns,
+        "repeat": args.repeat,
+        "boards": [],
+    }
+    configs = product((int(s) for s in args.sizes.split(",")), floats(args.mountains), floats(args.cities), floats(args.fog))
+    for size, mountains, cities, fog in configs:
+        name = f"{size}x{size}-m{mountains}-c{cities}-f{fog}"
+        calibration = calibrate()
+        ops = bench_board(size, size, mountains, cities, fog, args.turns, args.repeat, native, args.budget_ms / 1000)
+        results["boards"].append({"board": name, "width": size, "height": size, "mountains": mountains, "cities": cities, "fog": fog, "calibration_ms": calibration, "ops": ops})
+        print(name)
+        for op, r in ops.items():
+            print(f"  {op}: p50 {r['p50']:.3f}ms max {r['max']:.3f}ms {r['cells_per_sec'] / 1e6:.1f}M cells/s peak {r['peak_kb']:.1f}kB")
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            flagged = compare(results, json.load(f), args.tolerance, args.min_ms)
+        for line in flagged:
+            print(f"REGRESSION {line}")
+        if flagged:
+            sys.exit(1)
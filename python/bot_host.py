@@ -0,0 +1,178 @@
+"""Host many bots in a few processes.
+
+    python bot_host.py --rooms 1,2,3 --bot app --per-room 2 --workers 2 --once
+    python bot_host.py --config bots.json
+
+Every bot gets its own `AsyncBotRuntime` (its own socket and GBot, so no
+state is shared between bots), the bots of a worker share one asyncio loop,
+and the bots are dealt round-robin across a pool of worker processes. A
+config file looks like:
+
+    {
+        "server_url": "http://127.0.0.1:3001",
+        "workers": 2,
+        "once": true,
+        "bots": [
+            {"room": "1", "kind": "app", "username": "GenniaBot", "count": 2},
+            {"room": "2", "kind": "random"}
+        ]
+    }
+
+When the bots are done, throughput and plan latency are printed per bot
+and across all of them. With `--snapshots` (`"snapshot_dir"`), bots that
+keep snapshots write them there, and a restarted host picks up the games
+its bots were playing.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, NamedTuple, Union
+
+from dotenv import load_dotenv
+
+from async_runtime import AsyncBotRuntime
+from latency import format_summary, summarize
+
+
+class BotSpec(NamedTuple):
+    kind: str
+    room_id: str
+    username: str
+
+
+def load_specs(entries: List[dict]) -> List[BotSpec]:
+    specs = []
+    for entry in entries:
+        kind = entry.get("kind", "random")
+        username = entry.get("username") or f"GenniaBot-{kind}"
+        count = entry.get("count", 1)
+        for i in range(count):
+            specs.append(BotSpec(kind, str(entry["room"]), username if count == 1 else f"{username}-{i}"))
+    return specs
+
+
+async def host(
+    server_url: str, specs: List[BotSpec], record_dir: Union[str, None], once: bool, snapshot_dir: Union[str, None] = None
+) -> List[dict]:
+    async def run(spec: BotSpec) -> dict:
+        result = {**spec._asdict(), "updates": 0, "planned": 0, "dropped": 0, "latency": [], "error": None, "resumed": False}
+        runtime = None
+        try:
+            runtime = AsyncBotRuntime(spec.kind, spec.room_id, spec.username, snapshot_dir=snapshot_dir)
+            runtime.bot.gbot.record_dir = record_dir
+            runtime.leave_after_game = once
+            await runtime.run(server_url)
+        except Exception as e:
+            # one bot failing to start or connect leaves the rest of the shard running
+            result["error"] = f"{type(e).__name__}: {e}"
+            print(f"{spec.room_id}/{spec.username} failed: {result['error']}")
+        if runtime:
+            result.update(
+                updates=runtime.stats.updates,
+                planned=runtime.stats.planned,
+                dropped=runtime.stats.dropped,
+                latency=runtime.stats.latency,
+                resumed=runtime.resumed,
+            )
+        return result
+
+    return list(await asyncio.gather(*(run(spec) for spec in specs)))
+
+
+def run_shard(
+    server_url: str, specs: List[BotSpec], record_dir: Union[str, None], once: bool, snapshot_dir: Union[str, None] = None
+) -> List[dict]:
+    return asyncio.run(host(server_url, specs, record_dir, once, snapshot_dir))
+
+
+def run_all(
+    server_url: str,
+    specs: List[BotSpec],
+    workers: int = 1,
+    record_dir: Union[str, None] = None,
+    once: bool = False,
+    snapshot_dir: Union[str, None] = None,
+) -> List[dict]:
+    workers = max(1, min(workers, len(specs)))
+    if workers == 1:
+        return run_shard(server_url, specs, record_dir, once, snapshot_dir)
+    shards = [specs[i::workers] for i in range(workers)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_shard, server_url, shard, record_dir, once, snapshot_dir) for shard in shards]
+        return [result for future in futures for result in future.result()]
+
+
+def aggregate(results: List[dict], elapsed: float) -> dict:
+    latency = [sample for result in results for sample in result["latency"]]
+    updates = sum(result["updates"] for result in results)
+    planned = sum(result["planned"] for result in results)
+    return {
+        "bots": len(results),
+        "errors": sum(1 for result in results if result["error"]),
+        "updates": updates,
+        "planned": planned,
+        "dropped": sum(result["dropped"] for result in results),
+        "seconds": elapsed,
+        "updates_per_sec": updates / elapsed if elapsed else 0.0,
+        "plans_per_sec": planned / elapsed if elapsed else 0.0,
+        "latency": summarize(latency),
+    }
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Run many bots across a process pool")
+    parser.add_argument("--config", type=str, help="JSON file listing the bots to run")
+    parser.add_argument("--rooms", type=str, help="comma separated room ids")
+    parser.add_argument("--bot", type=str, default="random", help="bot kind for --rooms")
+    parser.add_argument("--per-room", type=int, default=1, help="bots joining each of --rooms")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--server", type=str, default=None, help="server url (default: SERVER_URL)")
+    parser.add_argument("--record", type=str, default=None, help="directory to write .grec recordings to")
+    parser.add_argument("--once", action="store_true", help="leave each room after one game")
+    parser.add_argument("--snapshots", type=str, default=None, help="directory for the bots' snapshots, to resume after a restart")
+    args = parser.parse_args()
+
+    config = {}
+    if args.config:
+        with open(args.config) as f:
+            config = json.load(f)
+    entries = config.get("bots", [])
+    if args.rooms:
+        entries += [
+            {"room": room, "kind": args.bot, "username": f"{os.getenv('BOT_NAME') or 'GenniaBot'}-{room}", "count": args.per_room}
+            for room in args.rooms.split(",")
+        ]
+    specs = load_specs(entries)
+    server_url = args.server or config.get("server_url") or os.getenv("SERVER_URL")
+    if not specs or not server_url:
+        parser.error("no bots to run: pass --config or --rooms, and a server url")
+    workers = args.workers or config.get("workers") or os.cpu_count() or 1
+
+    start = time.perf_counter()
+    results = run_all(
+        server_url,
+        specs,
+        workers,
+        args.record or config.get("record_dir"),
+        args.once or config.get("once", False),
+        args.snapshots or config.get("snapshot_dir"),
+    )
+    elapsed = time.perf_counter() - start
+
+    for result in results:
+        line = f"{result['room_id']}/{result['username']} ({result['kind']}): updates={result['updates']} dropped={result['dropped']}"
+        if result["resumed"]:
+            line += " (resumed)"
+        if result["error"]:
+            line += f" error: {result['error']}"
+        print(line)
+    stats = aggregate(results, elapsed)
+    print(
+        f"{stats['bots']} bots ({stats['errors']} failed) in {stats['seconds']:.1f}s: "
+        f"{stats['updates_per_sec']:.1f} updates/s, {stats['plans_per_sec']:.1f} plans/s, dropped {stats['dropped']}"
+    )
+    print(f"plan latency: {format_summary(stats['latency'])}")
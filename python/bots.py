@@ -0,0 +1,87 @@
+"""The bots in this repo behind one interface.
+
+Each bot registers its socket handlers on any client with the
+`socketio.Client` surface (a real client, `simulator.LocalClient`,
+`replay.ReplayClient`, ...). `patch` and `plan` split its `game_update`
+handler in two, so a runtime can apply every update but only plan some.
+`use_snapshots` is called before connecting, so a restarted bot can pick
+up the game it was playing.
+"""
+import os
+import sys
+from typing import Dict, List, Type, Union
+
+from map_state import TilePropTuple
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "AITranslate")
+
+
+class RandomBot:
+    """`main.py`'s GBot, which moves a random owned army each turn."""
+
+    # what the bot emits once connected to get the game going
+    join_event = "force_start"
+
+    def __init__(self, client, room_id: str, username: str):
+        import main
+
+        self.gbot = main.GBot(room_id=room_id, username=username, sio=client)
+        main.register_handlers(client, self.gbot)
+
+    def patch(self, map_diff: List[Union[int, TilePropTuple]], turns_count: int, leader_board_data: list):
+        self.gbot.receive_update(map_diff, turns_count, leader_board_data)
+
+    def plan(self, turns_count: int):
+        self.gbot.handle_move()
+
+    def use_snapshots(self, snapshot_dir: str) -> bool:
+        # main.py keeps no snapshots: a restart always starts over
+        return False
+
+
+class BeamBot(RandomBot):
+    """`main.py`'s GBot choosing each move by beam search over forward-model futures."""
+
+    def __init__(self, client, room_id: str, username: str):
+        super().__init__(client, room_id, username)
+        self.gbot.use_beam = True
+
+
+class AppBot:
+    """`AITranslate/app.py`'s strategy bot."""
+
+    join_event = "get_room_info"
+
+    def __init__(self, client, room_id: str, username: str):
+        if APP_DIR not in sys.path:
+            sys.path.insert(0, APP_DIR)
+        import app
+
+        self.app = app
+        self.gbot = app.GBot(room_id, username)
+        app.register_handlers(client, self.gbot)
+
+    def patch(self, map_diff: List[Union[int, TilePropTuple]], turns_count: int, leader_board_data: list):
+        self.app.receive_update(map_diff, turns_count, leader_board_data, self.gbot)
+
+    def plan(self, turns_count: int):
+        self.app.handle_move(turns_count, self.gbot.game_map, self.gbot.init_game_info, self.gbot)
+        self.app.finish_turn(self.gbot)
+
+    def use_snapshots(self, snapshot_dir: str) -> bool:
+        """Keep snapshots in `snapshot_dir`; True if the newest one there was restored."""
+        self.gbot.snapshot_dir = snapshot_dir
+        return self.app.resume(self.gbot)
+
+
+BOTS: Dict[str, Type] = {
+    "random": RandomBot,
+    "beam": BeamBot,
+    "app": AppBot,
+}
+
+
+def create_bot(kind: str, client, room_id: str, username: str):
+    if kind not in BOTS:
+        raise ValueError(f"unknown bot {kind}, expected one of {', '.join(BOTS)}")
+    return BOTS[kind](client, room_id, username)
@@ -0,0 +1,57 @@
+import time
+from typing import Dict
+
+# searches look at the clock once per this many expanded cells
+CHECK_EVERY = 256
+
+
+class Deadline:
+    """Time budget for one turn's planning, shared by every step of it."""
+
+    def __init__(self, budget: float):
+        self.budget = budget
+        self.start = time.perf_counter()
+        self.end = self.start + budget
+        self.cut = False
+
+    def expired(self) -> bool:
+        if not self.cut and time.perf_counter() >= self.end:
+            self.cut = True
+        return self.cut
+
+    def remaining(self) -> float:
+        return max(self.end - time.perf_counter(), 0.0)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+
+class TurnStats:
+    """Counts how turns went against their budget over a game."""
+
+    def __init__(self):
+        self.turns = 0
+        self.cut = 0  # planning was stopped early by the deadline
+        self.overruns = 0  # the turn took longer than its budget anyway
+        self.fallbacks = 0  # no plan was ready, a fallback move went out
+        self.speculated = 0  # the move came from a plan made before the update
+        self.max_elapsed = 0.0
+
+    def record(self, deadline: Deadline, fallback: bool = False, speculated: bool = False):
+        elapsed = deadline.elapsed()
+        self.turns += 1
+        self.speculated += speculated
+        self.cut += deadline.cut
+        self.overruns += elapsed > deadline.budget
+        self.fallbacks += fallback
+        self.max_elapsed = max(self.max_elapsed, elapsed)
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "turns": self.turns,
+            "cut": self.cut,
+            "overruns": self.overruns,
+            "fallbacks": self.fallbacks,
+            "speculated": self.speculated,
+            "max_ms": self.max_elapsed * 1000,
+        }
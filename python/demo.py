@@ -1,13 +1,22 @@
-
 import sys
 sys.path.insert(0, './build')
 
-from BotEngine import add, Pet
-print(add(2, 3))
-my_dog = Pet('Pluto', 5)
-print(my_dog.get_name())
+from BotEngine import Engine
+from map_state import MapState, TileType
+
+game_map = MapState(3, 3)
+for i in range(game_map.size):
+    game_map.types[i] = TileType.Plain
+# we hold the middle column with 10 on the top and 5 in the center
+game_map.owners[game_map.index(1, 0)] = game_map.owners[game_map.index(1, 1)] = 1
+game_map.armies[game_map.index(1, 0)] = 10
+game_map.armies[game_map.index(1, 1)] = 5
+
+engine = Engine(3, 3)
+way = engine.gather(game_map.index(1, 2), 1, game_map.types, game_map.owners, game_map.armies)
+print([game_map.position(i) for i in way])
+assert [game_map.position(i) for i in way][-1] == (1, 2)
 
-assert my_dog.get_name() == 'Pluto'
-assert my_dog.get_hunger() == 5
-my_dog.go_for_a_walk()
-assert my_dog.get_hunger() == 6
+captures = engine.expand(1, game_map.types, game_map.owners, game_map.armies)
+print(captures)
+assert captures[0][1] == game_map.index(1, 0)
@@ -0,0 +1,164 @@
+import heapq
+from array import array
+from typing import Dict, Iterable, List
+
+from map_state import MapState
+from pathfinding import MOVE_BLOCKED, neighbor_table
+
+# distance of cells that cannot be reached from the source
+UNREACHABLE = 0x7FFFFFFF
+
+
+class DistanceFields:
+    """Cached walking distances from a few fixed sources (usually generals).
+
+    A field is built with one BFS the first time it is asked for. After that
+    `update` only repairs the cells whose distance depends on tiles that
+    became passable or blocked, which happens when the fog reveals terrain.
+    Fog and cities count as passable, mountains and obstacles do not.
+    """
+
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.size = width * height
+        self.neighbors = neighbor_table(width, height)
+        self.blocked = bytearray(self.size)
+        self.fields: Dict[int, array] = {}
+
+    def __contains__(self, source: int) -> bool:
+        return source in self.fields
+
+    def field(self, source: int) -> array:
+        dist = self.fields.get(source)
+        if dist is None:
+            dist = self.fields[source] = self.build(source)
+        return dist
+
+    def distance(self, source: int, cell: int) -> int:
+        return self.field(source)[cell]
+
+    def nearest(self, source: int, cells: Iterable[int]) -> int:
+        """The reachable cell among `cells` closest to `source`, or -1."""
+        dist = self.field(source)
+        best = -1
+        best_dist = UNREACHABLE
+        for i in cells:
+            if dist[i] < best_dist:
+                best = i
+                best_dist = dist[i]
+        return best
+
+    def drop(self, source: int):
+        self.fields.pop(source, None)
+
+    def build(self, source: int) -> array:
+        neighbors = self.neighbors
+        blocked = self.blocked
+        dist = array("i", [UNREACHABLE]) * self.size
+        if blocked[source]:
+            return dist
+        dist[source] = 0
+        queue = [source]
+        for a in queue:
+            next_dist = dist[a] + 1
+            for b in neighbors[a * 4:a * 4 + 4]:
+                if b >= 0 and dist[b] == UNREACHABLE and not blocked[b]:
+                    dist[b] = next_dist
+                    queue.append(b)
+        return dist
+
+    def update(self, game_map: MapState, cells: Iterable[int]) -> List[int]:
+        """Track the terrain of `cells` and repair every cached field.
+
+        Returns the cells whose passability changed.
+        """
+        types = game_map.types
+        blocked = self.blocked
+        opened = []
+        closed = []
+        for i in cells:
+            now = MOVE_BLOCKED[types[i]]
+            if now != blocked[i]:
+                blocked[i] = now
+                (closed if now else opened).append(i)
+        if not opened and not closed:
+            return []
+        for source in list(self.fields):
+            if blocked[source] or source in opened:
+                # the field of a blocked source is empty, rebuild it once asked for again
+                del self.fields[source]
+                continue
+            dist = self.fields[source]
+            if closed:
+                self.close(dist, closed)
+            if opened:
+                self.open(dist, opened)
+        return opened + closed
+
+    def close(self, dist: array, closed: List[int]):
+        neighbors = self.neighbors
+        blocked = self.blocked
+        # find every cell whose shortest path ran through a closed cell,
+        # level by level, so a cell is only lost once all its parents are
+        lost = set()
+        heap = []
+        for i in closed:
+            if dist[i] != UNREACHABLE:
+                lost.add(i)
+                heapq.heappush(heap, (dist[i], i))
+        while heap:
+            d, a = heapq.heappop(heap)
+            for b in neighbors[a * 4:a * 4 + 4]:
+                if b < 0 or b in lost or blocked[b] or dist[b] != d + 1:
+                    continue
+                supported = False
+                for c in neighbors[b * 4:b * 4 + 4]:
+                    if c >= 0 and c not in lost and not blocked[c] and dist[c] == d:
+                        supported = True
+                        break
+                if not supported:
+                    lost.add(b)
+                    heapq.heappush(heap, (d + 1, b))
+        for i in lost:
+            dist[i] = UNREACHABLE
+        # re-seed the lost region from its intact border
+        seeds = []
+        for i in lost:
+            if blocked[i]:
+                continue
+            best = UNREACHABLE
+            for c in neighbors[i * 4:i * 4 + 4]:
+                if c >= 0 and dist[c] < best:
+                    best = dist[c]
+            if best != UNREACHABLE:
+                seeds.append(i)
+                dist[i] = best + 1
+        self.relax(dist, seeds)
+
+    def open(self, dist: array, opened: List[int]):
+        neighbors = self.neighbors
+        seeds = []
+        for i in opened:
+            best = dist[i]
+            for c in neighbors[i * 4:i * 4 + 4]:
+                if c >= 0 and dist[c] != UNREACHABLE and dist[c] + 1 < best:
+                    best = dist[c] + 1
+            if best < dist[i]:
+                dist[i] = best
+                seeds.append(i)
+        self.relax(dist, seeds)
+
+    def relax(self, dist: array, seeds: List[int]):
+        neighbors = self.neighbors
+        blocked = self.blocked
+        heap = [(dist[i], i) for i in seeds]
+        heapq.heapify(heap)
+        while heap:
+            d, a = heapq.heappop(heap)
+            if d != dist[a]:
+                continue
+            for b in neighbors[a * 4:a * 4 + 4]:
+                if b >= 0 and not blocked[b] and dist[b] > d + 1:
+                    dist[b] = d + 1
+                    heapq.heappush(heap, (d + 1, b))
@@ -0,0 +1,55 @@
+import random
+from array import array
+from typing import Iterable, List, NamedTuple, Union
+
+from map_state import MapState, TileType
+
+
+class Capture(NamedTuple):
+    surplus: int  # army left on `target` after taking it
+    source: int
+    target: int
+
+
+def plan_expansion(
+    game_map: MapState,
+    color: int,
+    neighbors: array,
+    target_type: int = TileType.Plain,
+    frontier: Union[Iterable[int], None] = None,
+) -> List[Capture]:
+    """Rank every capture of a `target_type` tile next to our land.
+
+    One sweep over our tiles scores each neighboring tile we don't own by
+    the army that would be left after moving in from the best adjacent
+    source. Every frontier tile is returned, best first, so captures with a
+    positive surplus can be made now and the rest show what is short; ties
+    are broken at random. Given the `frontier` (see TileIndex), only those
+    cells and their neighbors are looked at.
+    """
+    types = game_map.types
+    owners = game_map.owners
+    armies = game_map.armies
+    best = {}
+    if frontier is not None:
+        for b in frontier:
+            if types[b] != target_type:
+                continue
+            for i in neighbors[b * 4:b * 4 + 4]:
+                if i < 0 or owners[i] != color:
+                    continue
+                surplus = max(armies[i] - 1, 0) - armies[b]
+                if b not in best or best[b].surplus < surplus:
+                    best[b] = Capture(surplus, i, b)
+        return sorted(best.values(), key=lambda c: (-c.surplus, random.random()))
+    for i, owner in enumerate(owners):
+        if owner != color:
+            continue
+        movable = max(armies[i] - 1, 0)
+        for b in neighbors[i * 4:i * 4 + 4]:
+            if b < 0 or owners[b] == color or types[b] != target_type:
+                continue
+            surplus = movable - armies[b]
+            if b not in best or best[b].surplus < surplus:
+                best[b] = Capture(surplus, i, b)
+    return sorted(best.values(), key=lambda c: (-c.surplus, random.random()))
@@ -0,0 +1,105 @@
+from array import array
+from typing import Dict, Iterable, List, Set
+
+from map_state import NO_OWNER, MapState, TileType
+
+# cities and generals grow by one every this many turns, owned land every LAND_GROWTH
+CITY_GROWTH = 2
+LAND_GROWTH = 50
+
+
+class FogMemory:
+    """What we last saw of every cell, kept after it goes back under fog.
+
+    Per cell: the last turn it was in sight and the type, owner and army it
+    had then. Cells currently in sight count as seen this turn. Cities and
+    generals are remembered by position, and remembered cells are filed by
+    owner so "what of color C did we see lately" walks only that color's
+    cells. Everything is updated from each update's dirty cells.
+    """
+
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.size = width * height
+        self.turn = -1
+        self.seen_turn = array("i", [-1]) * self.size
+        self.seen_type = array("b", [TileType.Fog]) * self.size
+        self.seen_owner = array("h", [NO_OWNER]) * self.size
+        self.seen_army = array("i", [0]) * self.size
+        self.visible = bytearray(self.size)
+        # 1 once a cell has ever been in sight, the bots' `total_viewed`
+        self.viewed = bytearray(self.size)
+        self.cities: Set[int] = set()
+        self.generals: Dict[int, int] = {}  # color -> cell
+        self.by_owner: Dict[int, Set[int]] = {}
+
+    def update(self, game_map: MapState, cells: Iterable[int], turn: int) -> List[int]:
+        """Remember `cells` as of `turn`; returns the cells of generals found lost."""
+        types = game_map.types
+        owners = game_map.owners
+        armies = game_map.armies
+        fog = TileType.Fog
+        obstacle = TileType.Obstacle
+        king = TileType.King
+        city = TileType.City
+        last = self.turn
+        lost = []
+        for i in cells:
+            tile_type = types[i]
+            if tile_type == fog or tile_type == obstacle:
+                if self.visible[i]:
+                    # in sight up to the previous update
+                    self.visible[i] = 0
+                    self.seen_turn[i] = last
+                continue
+            self.visible[i] = 1
+            self.viewed[i] = 1
+            self.seen_turn[i] = turn
+            self.seen_type[i] = tile_type
+            self.seen_army[i] = armies[i]
+            owner = owners[i]
+            old = self.seen_owner[i]
+            if owner != old:
+                if old != NO_OWNER:
+                    self.by_owner[old].discard(i)
+                if owner != NO_OWNER:
+                    self.by_owner.setdefault(owner, set()).add(i)
+                self.seen_owner[i] = owner
+            if tile_type == city:
+                self.cities.add(i)
+            else:
+                self.cities.discard(i)
+            if tile_type == king and owner != NO_OWNER:
+                self.generals[owner] = i
+            elif old != NO_OWNER and self.generals.get(old) == i:
+                del self.generals[old]
+                lost.append(i)
+        self.turn = turn
+        return lost
+
+    def last_seen(self, i: int) -> int:
+        return self.turn if self.visible[i] else self.seen_turn[i]
+
+    def army_estimate(self, i: int, turn: int) -> int:
+        """The army on cell i by `turn`, growing what we last saw by the growth rules."""
+        army = self.seen_army[i]
+        if self.visible[i] or self.seen_owner[i] == NO_OWNER:
+            return army
+        seen = self.seen_turn[i]
+        tile_type = self.seen_type[i]
+        if tile_type == TileType.King or tile_type == TileType.City:
+            return army + turn // CITY_GROWTH - seen // CITY_GROWTH
+        if tile_type == TileType.Plain:
+            return army + turn // LAND_GROWTH - seen // LAND_GROWTH
+        return army
+
+    def recent(self, color: int, within: int) -> List[int]:
+        """Cells of `color` as last seen, seen in the last `within` turns."""
+        oldest = self.turn - within
+        visible = self.visible
+        seen_turn = self.seen_turn
+        return [i for i in self.by_owner.get(color, ()) if visible[i] or seen_turn[i] >= oldest]
+
+    def enemy_colors(self, color: int) -> List[int]:
+        return [c for c, cells in self.by_owner.items() if c != color and cells]
@@ -0,0 +1,171 @@
+"""Lookahead over many candidate futures of the current map.
+
+A `Future` is the live map plus the handful of cells its own moves
+changed, so a batch of hundreds of futures shares one copy of the board
+and branching one costs a copy of a small dict. Army growth (generals and
+cities every 2 turns, land every 50, swamps shrinking) is not stepped cell
+by cell: every stored army carries the turn it was written and is grown to
+the turn it is read at, so advancing the batch a turn is free and a
+future's cost is its moves. Other players are assumed to stand still.
+
+`BeamPlanner` searches chains of moves of one army: every movable tile in
+every direction as the first move, then the best `beam_width` futures are
+extended a turn at a time (another step, or waiting) up to `depth` turns.
+"""
+from typing import Dict, Iterable, List, Tuple, Union
+
+from deadline import Deadline
+from map_state import NO_OWNER, MapState, TileType
+from pathfinding import MOVE_BLOCKED
+
+# what a tile is worth to its owner in the evaluation, on top of its army
+LAND_VALUE = 2
+CITY_VALUE = 25
+KING_VALUE = 1000
+
+
+def growth(tile_type: int, owner: int, start: int, end: int) -> int:
+    """Army gained by a tile between turn `start` (excluded) and `end`."""
+    if end <= start or owner == NO_OWNER and tile_type != TileType.King:
+        return 0
+    if tile_type == TileType.King or tile_type == TileType.City:
+        return end // 2 - start // 2
+    if tile_type == TileType.Plain:
+        return end // 50 - start // 50
+    if tile_type == TileType.Swamp:
+        return start // 2 - end // 2
+    return 0
+
+
+class Future:
+    __slots__ = ("cells", "first", "last", "score")
+
+    def __init__(self, cells: Dict[int, Tuple[int, int, int]], first: Tuple[int, int], last: int):
+        # cell -> (owner, army, turn the army was written at)
+        self.cells = cells
+        self.first = first
+        self.last = last
+        self.score = 0
+
+
+class ForwardModel:
+    """The game rules of `simulator.LocalServer` applied to futures of `game_map` as of `turn`."""
+
+    def __init__(self, game_map: MapState, color: int, turn: int):
+        self.types = game_map.types
+        self.owners = game_map.owners
+        self.armies = game_map.armies
+        self.color = color
+        self.turn = turn
+
+    def read(self, future: Future, cell: int, turn: int) -> Tuple[int, int]:
+        """(owner, army) of `cell` in `future` at `turn`."""
+        tile_type = self.types[cell]
+        stored = future.cells.get(cell)
+        if stored:
+            owner, army, stamp = stored
+        else:
+            owner, army, stamp = self.owners[cell], self.armies[cell], self.turn
+        army += growth(tile_type, owner, stamp, turn)
+        if army <= 0 and tile_type == TileType.Swamp:
+            return NO_OWNER, 0
+        return owner, army
+
+    def move(self, future: Future, a: int, b: int, turn: int) -> bool:
+        """Play our move a -> b at `turn`, as `LocalServer.move` would."""
+        owner, army = self.read(future, a, turn - 1)
+        if owner != self.color or army <= 1 or MOVE_BLOCKED[self.types[b]]:
+            return False
+        unit = army - 1
+        cells = future.cells
+        cells[a] = (owner, 1, turn - 1)
+        target_owner, target_army = self.read(future, b, turn - 1)
+        if target_owner == self.color:
+            cells[b] = (target_owner, target_army + unit, turn - 1)
+        elif target_army >= unit:
+            cells[b] = (target_owner, target_army - unit, turn - 1)
+        else:
+            cells[b] = (self.color, unit - target_army, turn - 1)
+        return True
+
+    def value(self, cell: int, owner: int, army: int) -> int:
+        if owner == NO_OWNER:
+            return 0
+        worth = LAND_VALUE + army
+        tile_type = self.types[cell]
+        if tile_type == TileType.City:
+            worth += CITY_VALUE
+        elif tile_type == TileType.King:
+            worth += KING_VALUE
+        return worth if owner == self.color else -worth
+
+    def evaluate(self, future: Future, turn: int) -> int:
+        """How much better `future` is than the map as it stands, both seen at `turn`."""
+        score = 0
+        owners = self.owners
+        armies = self.armies
+        types = self.types
+        for cell in future.cells:
+            owner, army = self.read(future, cell, turn)
+            base_owner = owners[cell]
+            base_army = armies[cell] + growth(types[cell], base_owner, self.turn, turn)
+            score += self.value(cell, owner, army) - self.value(cell, base_owner, base_army)
+        future.score = score
+        return score
+
+
+class BeamPlanner:
+    def __init__(self, neighbors, beam_width: int = 32, depth: int = 4):
+        self.neighbors = neighbors
+        self.beam_width = beam_width
+        self.depth = depth
+        self.evaluated = 0  # futures scored by the last plan
+
+    def plan(
+        self,
+        game_map: MapState,
+        color: int,
+        turn: int,
+        sources: Iterable[int],
+        deadline: Union[Deadline, None] = None,
+    ) -> Union[Tuple[int, int], None]:
+        """The first move (from, to) of the best future found, or None."""
+        model = ForwardModel(game_map, color, turn)
+        neighbors = self.neighbors
+        blocked = MOVE_BLOCKED
+        types = game_map.types
+        futures: List[Future] = []
+        next_turn = turn + 1
+        for a in sources:
+            for b in neighbors[a * 4:a * 4 + 4]:
+                if b < 0 or blocked[types[b]]:
+                    continue
+                future = Future({}, (a, b), b)
+                if model.move(future, a, b, next_turn):
+                    model.evaluate(future, next_turn)
+                    futures.append(future)
+        self.evaluated = len(futures)
+        for step in range(1, self.depth):
+            if not futures or deadline and deadline.expired():
+                break
+            beam = sorted(futures, key=lambda f: f.score, reverse=True)[:self.beam_width]
+            step_turn = turn + step + 1
+            futures = []
+            for parent in beam:
+                if deadline and deadline.expired():
+                    break
+                # waiting a turn is always an option
+                futures.append(parent)
+                model.evaluate(parent, step_turn)
+                a = parent.last
+                for b in neighbors[a * 4:a * 4 + 4]:
+                    if b < 0 or blocked[types[b]]:
+                        continue
+                    future = Future(dict(parent.cells), parent.first, b)
+                    if model.move(future, a, b, step_turn):
+                        model.evaluate(future, step_turn)
+                        futures.append(future)
+                        self.evaluated += 1
+        if not futures:
+            return None
+        return max(futures, key=lambda f: f.score).first
@@ -0,0 +1,212 @@
+"""Hierarchical routing over clusters of the board, for very large maps.
+
+The board is cut into `size` x `size` clusters, and the passable cells of
+each cluster into its connected components (walking without leaving the
+cluster). Two components are linked when they touch across a cluster
+border. `route` runs A* over those components, one hop per cluster
+crossed, so it only labels the clusters it expands. `corridor` marks the
+clusters of a route so a search over the whole board can be confined to
+them, and `path` refines a route into cells with a BFS inside it.
+
+Everything is built lazily and cached per cluster. `update` takes the
+dirty cells of each update. When a cell changes between passable and
+blocked, only the components of its cluster are relabeled, along with
+the links of the clusters around it. Fog counts as passable, like in
+`DistanceFields`.
+"""
+import heapq
+from array import array
+from typing import Dict, Iterable, List, Set, Tuple, Union
+
+from map_state import MapState
+from pathfinding import MOVE_BLOCKED, neighbor_table
+
+
+class ClusterGraph:
+    def __init__(self, width: int, height: int, size: int = 16, neighbors: Union[array, None] = None):
+        self.width = width
+        self.height = height
+        self.size = size
+        self.columns = -(-width // size)
+        self.rows = -(-height // size)
+        self.neighbors = neighbors or neighbor_table(width, height)
+        self.blocked = bytearray(width * height)
+        column = [y // size for y in range(height)]
+        self.cluster_of = array("i")
+        for x in range(width):
+            base = (x // size) * self.rows
+            self.cluster_of.extend([base + c for c in column])
+        # component of each cell within its cluster, -1 for blocked cells
+        self.label = array("i", [-1]) * (width * height)
+        # cluster -> number of components, for clusters whose labels are current
+        self.counts: Dict[int, int] = {}
+        # cluster -> per component, the (cluster, component) pairs it touches across a border
+        self.links: Dict[int, List[Set[Tuple[int, int]]]] = {}
+
+    def bounds(self, cluster: int) -> Tuple[int, int, int, int]:
+        """x0, x1, y0, y1 (exclusive ends) of a cluster."""
+        cx, cy = divmod(cluster, self.rows)
+        x0 = cx * self.size
+        y0 = cy * self.size
+        return x0, min(x0 + self.size, self.width), y0, min(y0 + self.size, self.height)
+
+    def adjacent(self, cluster: int) -> List[int]:
+        cx, cy = divmod(cluster, self.rows)
+        return [
+            nx * self.rows + ny
+            for nx, ny in ((cx - 1, cy), (cx + 1, cy), (cx, cy - 1), (cx, cy + 1))
+            if 0 <= nx < self.columns and 0 <= ny < self.rows
+        ]
+
+    def update(self, game_map: MapState, cells: Iterable[int]):
+        """Track the terrain of `cells`, dropping what depended on cells that opened or closed."""
+        types = game_map.types
+        blocked = self.blocked
+        cluster_of = self.cluster_of
+        touched = set()
+        for i in cells:
+            now = MOVE_BLOCKED[types[i]]
+            if now != blocked[i]:
+                blocked[i] = now
+                touched.add(cluster_of[i])
+        for cluster in touched:
+            self.counts.pop(cluster, None)
+            self.links.pop(cluster, None)
+            # their links name this cluster's components, which are about to be renumbered
+            for other in self.adjacent(cluster):
+                self.links.pop(other, None)
+
+    def components(self, cluster: int) -> int:
+        """Label the components of a cluster; returns how many there are."""
+        count = self.counts.get(cluster)
+        if count is not None:
+            return count
+        x0, x1, y0, y1 = self.bounds(cluster)
+        height = self.height
+        neighbors = self.neighbors
+        blocked = self.blocked
+        cluster_of = self.cluster_of
+        label = self.label
+        cells = [x * height + y for x in range(x0, x1) for y in range(y0, y1)]
+        for i in cells:
+            label[i] = -1
+        count = 0
+        for i in cells:
+            if blocked[i] or label[i] >= 0:
+                continue
+            label[i] = count
+            queue = [i]
+            for a in queue:
+                for b in neighbors[a * 4:a * 4 + 4]:
+                    if b >= 0 and label[b] < 0 and not blocked[b] and cluster_of[b] == cluster:
+                        label[b] = count
+                        queue.append(b)
+            count += 1
+        self.counts[cluster] = count
+        return count
+
+    def border(self, cluster: int, other: int) -> List[Tuple[int, int]]:
+        """Facing cell pairs (cell in cluster, cell in other) along a shared border."""
+        x0, x1, y0, y1 = self.bounds(cluster)
+        height = self.height
+        if other == cluster + self.rows:
+            return [((x1 - 1) * height + y, x1 * height + y) for y in range(y0, y1)]
+        if other == cluster - self.rows:
+            return [(x0 * height + y, (x0 - 1) * height + y) for y in range(y0, y1)]
+        if other == cluster + 1:
+            return [(x * height + y1 - 1, x * height + y1) for x in range(x0, x1)]
+        return [(x * height + y0, x * height + y0 - 1) for x in range(x0, x1)]
+
+    def linked(self, cluster: int) -> List[Set[Tuple[int, int]]]:
+        links = self.links.get(cluster)
+        if links is not None:
+            return links
+        links = [set() for _ in range(self.components(cluster))]
+        label = self.label
+        for other in self.adjacent(cluster):
+            self.components(other)
+            for a, b in self.border(cluster, other):
+                if label[a] >= 0 and label[b] >= 0:
+                    links[label[a]].add((other, label[b]))
+        self.links[cluster] = links
+        return links
+
+    def route(self, start: int, goal: int) -> Union[List[int], None]:
+        """Clusters a route from `start` to `goal` crosses, crossing as few as possible, or None."""
+        if self.blocked[start] or self.blocked[goal]:
+            return None
+        rows = self.rows
+        source = self.cluster_of[start]
+        target = self.cluster_of[goal]
+        self.components(source)
+        self.components(target)
+        first = (source, self.label[start])
+        last = (target, self.label[goal])
+        gx, gy = divmod(target, rows)
+
+        def estimate(node: Tuple[int, int]) -> int:
+            x, y = divmod(node[0], rows)
+            return abs(x - gx) + abs(y - gy)
+
+        hops = {first: 0}
+        parent = {first: first}
+        heap = [(estimate(first), 0, first)]
+        while heap:
+            _, g, node = heapq.heappop(heap)
+            if node == last:
+                clusters = [node[0]]
+                while node != first:
+                    node = parent[node]
+                    clusters.append(node[0])
+                clusters.reverse()
+                return clusters
+            if g > hops[node]:
+                continue
+            for other in self.linked(node[0])[node[1]]:
+                if other not in hops or g + 1 < hops[other]:
+                    hops[other] = g + 1
+                    parent[other] = node
+                    heapq.heappush(heap, (g + 1 + estimate(other), g + 1, other))
+        return None
+
+    def corridor(self, start: int, goal: int, margin: int = 1) -> Union[bytearray, None]:
+        """1 for every cell of the clusters a route crosses and those within `margin` of them, or None."""
+        clusters = self.route(start, goal)
+        if clusters is None:
+            return None
+        clusters = set(clusters)
+        for _ in range(margin):
+            clusters |= {other for cluster in clusters for other in self.adjacent(cluster)}
+        mask = bytearray(self.width * self.height)
+        height = self.height
+        for cluster in clusters:
+            x0, x1, y0, y1 = self.bounds(cluster)
+            ones = b"\x01" * (y1 - y0)
+            for x in range(x0, x1):
+                mask[x * height + y0:x * height + y1] = ones
+        return mask
+
+    def path(self, start: int, goal: int, margin: int = 0) -> List[int]:
+        """Cells of a shortest path from `start` to `goal` inside their corridor, or [] if there is none."""
+        mask = self.corridor(start, goal, margin)
+        if mask is None:
+            return []
+        neighbors = self.neighbors
+        blocked = self.blocked
+        parent = {start: -1}
+        queue = [start]
+        for a in queue:
+            if a == goal:
+                break
+            for b in neighbors[a * 4:a * 4 + 4]:
+                if b >= 0 and mask[b] and not blocked[b] and b not in parent:
+                    parent[b] = a
+                    queue.append(b)
+        if goal not in parent:
+            return []
+        cells = []
+        while goal >= 0:
+            cells.append(goal)
+            goal = parent[goal]
+        cells.reverse()
+        return cells
@@ -0,0 +1,32 @@
+import math
+from typing import Dict, Iterable, Sequence
+
+
+def percentile(ordered: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted sequence."""
+    if not ordered:
+        return 0.0
+    rank = max(math.ceil(q / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarize(samples: Iterable[float]) -> Dict[str, float]:
+    """Count, mean, p50/p90/p99 and max of latency samples (in ms)."""
+    ordered = sorted(samples)
+    if not ordered:
+        return {"count": 0, "mean": 0.0, "p50": 0.0, "p90": 0.0, "p99": 0.0, "max": 0.0}
+    return {
+        "count": len(ordered),
+        "mean": sum(ordered) / len(ordered),
+        "p50": percentile(ordered, 50),
+        "p90": percentile(ordered, 90),
+        "p99": percentile(ordered, 99),
+        "max": ordered[-1],
+    }
+
+
+def format_summary(summary: Dict[str, float]) -> str:
+    return (
+        f"n={summary['count']} mean={summary['mean']:.3f}ms p50={summary['p50']:.3f}ms "
+        f"p90={summary['p90']:.3f}ms p99={summary['p99']:.3f}ms max={summary['max']:.3f}ms"
+    )
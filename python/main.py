@@ -1,32 +1,18 @@
 import socketio
 import random
 import os
+import time
 from dotenv import load_dotenv
-from typing import List, Tuple, Union
+from typing import List, Union
+from deadline import Deadline
+from forward_model import BeamPlanner
+from map_state import MapState, TilePropTuple, TileType
+from recording import GameRecorder
+from telemetry import DEBUG, ERROR, LEVELS, WARNING, Telemetry, open_sink, parse_sample
+from tile_index import TileIndex
 
 load_dotenv()
 
-sio = socketio.Client()
-
-
-class TileType:
-    Fog = 0
-    Land = 1
-    City = 2
-    General = 3
-
-
-TilePropTuple = Tuple[int, int, int]
-
-
-class TileProp:
-    def __init__(
-        self, tile_type: int, color_index: Union[int, None], army_size: Union[int, None]
-    ):
-        self.tile_type = tile_type
-        self.color_index = color_index  # owner_id
-        self.army_size = army_size
-
 
 class UserData:
     def __init__(self, id: int, username: str, color: int):
@@ -48,59 +34,109 @@ class Point:
 
 
 class GBot:
-    def __init__(self, room_id: str, username: str = "GenniaBot"):
+    def __init__(self, room_id: str, username: str = "GenniaBot", sio=None):
         self.room_id = room_id
+        self.sio = sio
         self.room = None
         self.username = username
         self.my_player_id = None
         self.color = None
         self.init_game_info = None
         self.game_map = None
+        self.tiles = None
+        self.turns_count = 0
+        # pick moves by lookahead instead of at random
+        self.use_beam = False
+        self.planner = None
+        self.turn_budget = 0.25
+        self.record_dir = None
+        self.recorder = None
+        self.telemetry = Telemetry()
+        self.warmup_ms = 0.0
+        # when the update being answered arrived
+        self.update_start = 0.0
 
     def init_map(self, map_width: int, map_height: int):
-        self.game_map = [
-            [TileProp(TileType.Fog, None, None) for _ in range(map_height)]
-            for _ in range(map_width)
-        ]
+        self.game_map = MapState(map_width, map_height)
+        self.tiles = TileIndex(map_width, map_height, self.color)
+        if self.use_beam:
+            self.planner = BeamPlanner(self.tiles.neighbors)
+
+    def warmup(self, init_game_info: dict):
+        """Allocate everything sized to the map and rehearse a move, before the first update."""
+        start = time.perf_counter()
+        self.init_map(init_game_info["mapWidth"], init_game_info["mapHeight"])
+        king = init_game_info.get("king")
+        if self.planner and king and self.color is not None:
+            # plan on a copy of the blank map holding only our king
+            game_map = self.game_map.copy()
+            general = game_map.index(king["x"], king["y"])
+            game_map.types[general] = TileType.King
+            game_map.owners[general] = self.color
+            game_map.armies[general] = 10
+            self.planner.plan(game_map, self.color, 0, [general], Deadline(self.turn_budget))
+        self.warmup_ms = (time.perf_counter() - start) * 1000
+        self.telemetry.event("warmup", ms=self.warmup_ms)
+
+    def start_recording(self, init_game_info: dict):
+        if not self.record_dir:
+            return
+        path = os.path.join(
+            self.record_dir, f"{self.room_id}-{self.username}-{int(time.time())}.grec"
+        )
+        self.recorder = GameRecorder(path)
+        self.recorder.game_started(init_game_info, self.color, self.my_player_id)
+
+    def stop_recording(self):
+        if self.recorder:
+            self.recorder.close()
+            self.recorder = None
+
+    def receive_update(
+        self,
+        map_diff: List[Union[int, TilePropTuple]],
+        turns_count: int,
+        leader_board_data: list,
+    ):
+        self.turns_count = turns_count
+        self.update_start = time.perf_counter()
+        if self.recorder:
+            self.recorder.game_update(map_diff, turns_count, leader_board_data)
+        return self.patch_map(map_diff)
 
     def patch_map(self, map_diff: List[Union[int, TilePropTuple]]):
+        """Apply the update and return the cells it changed."""
         if not self.game_map:
-            return
-        map_width = len(self.game_map)
-        map_height = len(self.game_map[0])
-        flattened = [tile for row in self.game_map for tile in row]
-        new_state = [[None for _ in range(map_height)] for _ in range(map_width)]
-        i = j = 0
-        for diff in map_diff:
-            if isinstance(diff, int):
-                j += diff
-            else:
-                flattened[j] = TileProp(*diff)
-                j += 1
-        for i in range(map_width):
-            for j in range(map_height):
-                new_state[i][j] = flattened[i * map_height + j]
-        self.game_map = new_state
+            return []
+        dirty = self.game_map.apply_diff(map_diff)
+        self.tiles.update(self.game_map, dirty)
+        return dirty
 
     def handle_move(self):
+        """Move, then emit the turn's counters, whichever runtime called."""
+        self.move()
+        self.telemetry.turn(self.turns_count, decision_ms=(time.perf_counter() - self.update_start) * 1000)
+
+    def move(self):
         if not self.game_map or not self.init_game_info or not self.color:
             return
-        map_width = len(self.game_map)
-        map_height = len(self.game_map[0])
-        lands = []
-        for i in range(map_width):
-            for j in range(map_height):
-                if (
-                    self.game_map[i][j].color_index == self.color
-                    and self.game_map[i][j].army_size > 1
-                ):
-                    lands.append(Point(i, j))
-        target = lands[random.randint(0, len(lands) - 1)] if lands else None
-        if not target:
+        if not self.tiles.movable:
             return
-        direction = random.choice([(0, 1), (0, -1), (1, 0), (-1, 0)])
-        print(f"attack {target.x} {target.y} {direction}")
-        sio.emit(
+        move = None
+        if self.planner:
+            move = self.planner.plan(
+                self.game_map, self.color, self.turns_count, self.tiles.movable, Deadline(self.turn_budget)
+            )
+        if move:
+            target = Point(*self.game_map.position(move[0]))
+            to = self.game_map.position(move[1])
+            direction = (to[0] - target.x, to[1] - target.y)
+        else:
+            target = Point(*self.game_map.position(random.choice(tuple(self.tiles.movable))))
+            direction = random.choice([(0, 1), (0, -1), (1, 0), (-1, 0)])
+        self.telemetry.event("attack", DEBUG, x=target.x, y=target.y, direction=direction)
+        self.telemetry.count("moves")
+        self.sio.emit(
             "attack",
             (
                 {"x": target.x, "y": target.y},
@@ -110,76 +146,88 @@ class GBot:
         )
 
 
-gbot = GBot(room_id=os.getenv("ROOM_ID"), username=os.getenv("BOT_NAME"))
-
-
-@sio.event
-def connect():
-    print(f"socket client connect to server: {sio.sid}")
+def register_handlers(sio, gbot: GBot):
+    @sio.event
+    def connect():
+        gbot.telemetry.event("connect", sid=sio.sid)
 
+    @sio.event
+    def update_room(room: dict):
+        gbot.telemetry.event("update_room", DEBUG)
+        gbot.room = room
+        gbot.color = next(
+            (p["color"] for p in room["players"] if p["id"] == gbot.my_player_id), None
+        )
 
-@sio.event
-def update_room(room: dict):
-    print("update_room")
-    gbot.room = room
-    gbot.color = next(
-        (p["color"] for p in room["players"] if p["id"] == gbot.my_player_id), None
+    @sio.event
+    def set_player_id(player_id: str):
+        gbot.telemetry.event("set_player_id", player_id=player_id)
+        gbot.my_player_id = player_id
+
+    @sio.event
+    def error(title: str, message: str):
+        gbot.telemetry.event("server_error", ERROR, title=title, message=message)
+
+    @sio.event
+    def room_message(player: dict, message: str):
+        gbot.telemetry.event("room_message", player=player["username"], message=message)
+
+    @sio.event
+    def game_started(init_game_info: dict):
+        gbot.telemetry.event(
+            "game_started",
+            width=init_game_info["mapWidth"],
+            height=init_game_info["mapHeight"],
+            **({"init_game_info": init_game_info} if gbot.telemetry.enabled(DEBUG) else {}),
+        )
+        gbot.init_game_info = init_game_info
+        gbot.warmup(init_game_info)
+        gbot.start_recording(init_game_info)
+
+    @sio.event
+    def attack_failure(from_p, to, message: str):
+        gbot.telemetry.event("attack_failure", WARNING, source=from_p, target=to, message=message)
+        gbot.telemetry.count("attack_failures")
+
+    @sio.event
+    def game_update(
+        map_diff: List[Union[int, TilePropTuple]],
+        turns_count: int,
+        leader_board_data: list,
+    ):
+        gbot.receive_update(map_diff, turns_count, leader_board_data)
+        gbot.handle_move()
+
+    @sio.event
+    def game_over(captured_by: dict):
+        gbot.telemetry.event("game_over", captured_by=captured_by["username"])
+        gbot.stop_recording()
+        sio.disconnect()
+
+    @sio.event
+    def game_ended(winner: dict, replay_link: str):
+        gbot.telemetry.event("game_ended", winner=winner["username"], replay_link=replay_link)
+        gbot.stop_recording()
+        sio.disconnect()
+
+
+if __name__ == "__main__":
+    sio = socketio.Client()
+    gbot = GBot(room_id=os.getenv("ROOM_ID"), username=os.getenv("BOT_NAME"), sio=sio)
+    gbot.record_dir = os.getenv("RECORD_DIR")
+    gbot.use_beam = os.getenv("PLANNER") == "beam"
+    gbot.turn_budget = float(os.getenv("TURN_BUDGET_MS") or 250) / 1000
+    gbot.telemetry = Telemetry(
+        open_sink(os.getenv("TELEMETRY") or "-"),
+        level=LEVELS[(os.getenv("TELEMETRY_LEVEL") or "info").lower()],
+        sample=parse_sample(os.getenv("TELEMETRY_SAMPLE")),
+        bot=gbot.username,
+        room=gbot.room_id,
     )
+    register_handlers(sio, gbot)
 
+    sio.connect(
+        os.getenv("SERVER_URL") + f"?username={gbot.username}&roomId={gbot.room_id}"
+    )
 
-@sio.event
-def set_player_id(player_id: str):
-    print(f"set_player_id: {player_id}")
-    gbot.my_player_id = player_id
-
-
-@sio.event
-def error(title: str, message: str):
-    print("GET ERROR FROM SERVER:\n", title, message)
-
-
-@sio.event
-def room_message(player: dict, message: str):
-    print(f"room_message: {player['username']} {message}")
-
-
-@sio.event
-def game_started(init_game_info: dict):
-    print("Game started:", init_game_info)
-    gbot.init_game_info = init_game_info
-    gbot.init_map(init_game_info["mapWidth"], init_game_info["mapHeight"])
-
-
-@sio.event
-def attack_failure(from_p, to, message: str):
-    print(f"attack_failure: {from_p} {to} {message}")
-
-
-@sio.event
-def game_update(
-    map_diff: List[Union[int, TilePropTuple]],
-    turns_count: int,
-    leader_board_data: dict,
-):
-    print(f"game_update: {turns_count}")
-    gbot.patch_map(map_diff)
-    gbot.handle_move()
-
-
-@sio.event
-def game_over(captured_by: dict):
-    print(f"game_over: {captured_by['username']}")
-    sio.disconnect()
-
-
-@sio.event
-def game_ended(winner: dict, replay_link: str):
-    print(f"game_ended: {winner['username']} {replay_link}")
-    sio.disconnect()
-
-
-sio.connect(
-    os.getenv("SERVER_URL") + f"?username={gbot.username}&roomId={gbot.room_id}"
-)
-
-sio.emit("force_start")
+    sio.emit("force_start")
@@ -0,0 +1,123 @@
+from array import array
+from itertools import accumulate, compress
+from typing import List, NamedTuple, Tuple, Union
+
+
+class TileType:
+    King = 0
+    City = 1
+    Fog = 2
+    Obstacle = 3
+    Plain = 4
+    Mountain = 5
+    Swamp = 6
+
+
+TilePropTuple = Tuple[int, Union[int, None], Union[int, None]]
+
+# owners array value for tiles nobody owns (the server sends `null`)
+NO_OWNER = -1
+
+
+class TileProp(NamedTuple):
+    tile_type: int
+    color_index: Union[int, None]  # owner_id
+    army_size: Union[int, None]
+
+
+class MapColumn:
+    """`game_map[x]` view, so `game_map[x][y]` keeps returning a TileProp."""
+
+    def __init__(self, game_map: "MapState", x: int):
+        self.game_map = game_map
+        self.x = x
+
+    def __len__(self) -> int:
+        return self.game_map.height
+
+    def __getitem__(self, y: int) -> TileProp:
+        return self.game_map.tile(self.x, y)
+
+
+class MapState:
+    """Struct-of-arrays map store indexed by `x * height + y`.
+
+    `types`, `owners` and `armies` are contiguous `array`s that `apply_diff`
+    patches in place, so a turn costs one write per changed tile instead of
+    a rebuilt width*height grid.
+    """
+
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.size = width * height
+        self.types = array("b", [TileType.Fog]) * self.size
+        self.owners = array("h", [NO_OWNER]) * self.size
+        self.armies = array("i", [0]) * self.size
+
+    def __len__(self) -> int:
+        return self.width
+
+    def __getitem__(self, x: int) -> MapColumn:
+        if x < 0 or x >= self.width:
+            raise IndexError(x)
+        return MapColumn(self, x)
+
+    def copy(self) -> "MapState":
+        clone = MapState.__new__(MapState)
+        clone.width = self.width
+        clone.height = self.height
+        clone.size = self.size
+        clone.types = array("b", self.types)
+        clone.owners = array("h", self.owners)
+        clone.armies = array("i", self.armies)
+        return clone
+
+    def index(self, x: int, y: int) -> int:
+        return x * self.height + y
+
+    def position(self, index: int) -> Tuple[int, int]:
+        return divmod(index, self.height)
+
+    def in_range(self, x: int, y: int) -> bool:
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def owner(self, index: int) -> Union[int, None]:
+        owner = self.owners[index]
+        return None if owner == NO_OWNER else owner
+
+    def tile(self, x: int, y: int) -> TileProp:
+        i = x * self.height + y
+        return TileProp(self.types[i], self.owner(i), self.armies[i])
+
+    def apply_diff(self, map_diff: List[Union[int, TilePropTuple]]) -> array:
+        """Apply a run-length `map_diff` in place and return the dirty cells.
+
+        Only cells whose tile actually changed count as dirty. The server's
+        first update lists every cell, most of them fog the map already has.
+        """
+        cells, tiles = decode_diff(map_diff)
+        types = self.types
+        owners = self.owners
+        armies = self.armies
+        dirty = array("i")
+        for j, (tile_type, color, army) in zip(cells, tiles):
+            owner = NO_OWNER if color is None else color
+            army = army or 0
+            if types[j] != tile_type or owners[j] != owner or armies[j] != army:
+                types[j] = tile_type
+                owners[j] = owner
+                armies[j] = army
+                dirty.append(j)
+        return dirty
+
+
+def decode_diff(map_diff: List[Union[int, TilePropTuple]]) -> Tuple[array, List[TilePropTuple]]:
+    """Split a run-length `map_diff` into the changed cells and their new tiles.
+
+    A skip count moves the cursor that many cells and a tile moves it one,
+    so the running sum of those steps is the cell each element starts at.
+    """
+    is_tile = [type(diff) is not int for diff in map_diff]
+    starts = accumulate([1 if tile else diff for diff, tile in zip(map_diff, is_tile)], initial=0)
+    return array("i", compress(starts, is_tile)), list(compress(map_diff, is_tile))
@@ -0,0 +1,16 @@
+"""The optional native BotEngine module, built from BotEngine.cpp into build/.
+
+`BotEngine` is None when it has not been built; callers fall back to the
+pure-Python searches in pathfinding.py and expansion.py.
+"""
+import os
+import sys
+
+BUILD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "build")
+if BUILD_DIR not in sys.path:
+    sys.path.append(BUILD_DIR)
+
+try:
+    import BotEngine
+except ImportError:
+    BotEngine = None
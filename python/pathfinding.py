@@ -0,0 +1,194 @@
+import random
+from array import array
+from itertools import permutations
+from typing import List, Union
+
+from deadline import CHECK_EVERY, Deadline
+from map_state import MapState, TileType
+
+# (dx, dy) in the same order as the bots' `directions`
+DIRECTIONS = [(-1, 0), (0, 1), (1, 0), (0, -1)]
+
+# every visiting order of the four directions, picked per node for tie-breaking
+DIRECTION_ORDERS = tuple(permutations(range(4)))
+
+
+def type_table(*tile_types: int) -> bytes:
+    """Lookup table indexed by tile type, 1 for each of `tile_types`."""
+    return bytes(1 if t in tile_types else 0 for t in range(TileType.Swamp + 1))
+
+
+# tiles nobody can walk through (un_moveable with ignore_city=False)
+MOVE_BLOCKED = type_table(TileType.Mountain, TileType.Obstacle)
+# same, plus cities (un_moveable with ignore_city=True)
+MOVE_BLOCKED_NO_CITY = type_table(TileType.Mountain, TileType.Obstacle, TileType.City)
+# tiles a search over the revealed board may not enter
+SIGHT_BLOCKED = type_table(TileType.Fog, TileType.Obstacle, TileType.Mountain)
+# a `within` mask as initial search states: cells outside it start as expanded
+OUTSIDE = bytes.maketrans(b"\x00\x01", b"\x02\x00")
+
+
+def neighbor_table(width: int, height: int) -> array:
+    """`table[4 * i + d]` is the neighbor of cell i in direction d, or -1."""
+    table = array("i", [-1]) * (width * height * 4)
+    for x in range(width):
+        for y in range(height):
+            base = (x * height + y) * 4
+            for d, (dx, dy) in enumerate(DIRECTIONS):
+                nx, ny = x + dx, y + dy
+                if 0 <= nx < width and 0 <= ny < height:
+                    table[base + d] = nx * height + ny
+    return table
+
+
+class SearchKernel:
+    """Breadth-first searches over flat cell indices.
+
+    Buffers are allocated once per map size and reused by every search, paths
+    are rebuilt from `parent` pointers, and each search touches a cell a
+    bounded number of times, so a search is linear in the tiles it explores.
+    After a search, `order[:count]` lists the reached cells in the order they
+    were first reached. A search given a `Deadline` stops expanding once it
+    expires and keeps what it found so far.
+    """
+
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.size = width * height
+        self.neighbors = neighbor_table(width, height)
+        # a cell is queued at most once per expanded neighbor
+        self.queue = array("i", [0]) * (self.size * 4 + 1)
+        self.order = array("i", [0]) * self.size
+        self.parent = array("i", [-1]) * self.size
+        self.depth = array("i", [0]) * self.size
+        self.value = array("q", [0]) * self.size
+        self.count = 0
+
+    def path(self, cell: int) -> List[int]:
+        """Cells from `cell` back to the search source, both included."""
+        parent = self.parent
+        way = []
+        while cell >= 0:
+            way.append(cell)
+            cell = parent[cell]
+        return way
+
+    def bfs(self, source: int, game_map: MapState, blocked: bytes, limit: int = -1, deadline: Union[Deadline, None] = None) -> int:
+        """Plain BFS from `source`; fills `depth`/`parent` and returns `count`."""
+        types = game_map.types
+        neighbors = self.neighbors
+        order = self.order
+        parent = self.parent
+        depth = self.depth
+        rand = random.random
+        seen = bytearray(self.size)
+        seen[source] = 1
+        order[0] = source
+        parent[source] = -1
+        depth[source] = 0
+        front = 0
+        end = 1
+        while front < end:
+            a = order[front]
+            front += 1
+            if deadline and front % CHECK_EVERY == 0 and deadline.expired():
+                break
+            next_depth = depth[a] + 1
+            if limit >= 0 and next_depth > limit:
+                break
+            base = a * 4
+            for d in DIRECTION_ORDERS[int(rand() * 24)]:
+                b = neighbors[base + d]
+                if b < 0 or seen[b] or blocked[types[b]]:
+                    continue
+                seen[b] = 1
+                parent[b] = a
+                depth[b] = next_depth
+                order[end] = b
+                end += 1
+        self.count = end
+        return end
+
+    def gather(
+        self,
+        source: int,
+        color: int,
+        game_map: MapState,
+        limit: int = -1,
+        deadline: Union[Deadline, None] = None,
+        within: Union[bytearray, None] = None,
+    ) -> int:
+        """Army-weighted search used by gather_armies and quick_expand.
+
+        Walking onto one of our tiles adds its army, anything else costs its
+        army; both cost one for the move itself. Tiles that are not ours and
+        are cities are never entered, nor are cells that are 0 in `within`,
+        when given. Returns the reached cell with the highest positive value,
+        or -1 when there is none.
+        """
+        types = game_map.types
+        owners = game_map.owners
+        armies = game_map.armies
+        neighbors = self.neighbors
+        queue = self.queue
+        order = self.order
+        parent = self.parent
+        depth = self.depth
+        value = self.value
+        blocked = MOVE_BLOCKED
+        city = TileType.City
+        rand = random.random
+        # 0: unseen, 1: queued, 2: expanded
+        state = within.translate(OUTSIDE) if within else bytearray(self.size)
+        state[source] = 1
+        value[source] = armies[source]
+        parent[source] = -1
+        depth[source] = 0
+        queue[0] = order[0] = source
+        count = 1
+        front = 0
+        end = 1
+        best = -1
+        best_value = 0
+        while front < end:
+            a = queue[front]
+            front += 1
+            if deadline and front % CHECK_EVERY == 0 and deadline.expired():
+                break
+            if state[a] == 2:
+                continue
+            state[a] = 2
+            if limit >= 0 and depth[a] >= limit:
+                # a cell re-queued for a better value can sit ahead of shallower ones
+                continue
+            base = a * 4
+            moved = value[a] - 1
+            next_depth = depth[a] + 1
+            for d in DIRECTION_ORDERS[int(rand() * 24)]:
+                b = neighbors[base + d]
+                if b < 0 or state[b] == 2 or blocked[types[b]]:
+                    continue
+                if owners[b] != color:
+                    if types[b] == city:
+                        continue
+                    new_value = moved - armies[b]
+                else:
+                    new_value = moved + armies[b]
+                if state[b]:
+                    if value[b] >= new_value:
+                        continue
+                else:
+                    state[b] = 1
+                    order[count] = b
+                    count += 1
+                value[b] = new_value
+                parent[b] = a
+                depth[b] = next_depth
+                queue[end] = b
+                end += 1
+                if new_value > best_value:
+                    best = b
+                    best_value = new_value
+        self.count = count
+        return best
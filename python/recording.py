@@ -0,0 +1,206 @@
+"""Compact append-only recordings of the updates a bot receives.
+
+A recording is a header followed by one record per event:
+
+    header  b"GNREC\\x00\\x01\\x00"
+    record  <kind u8> <turn i32> <length u32> <payload>
+    ...
+    index   <offset u64> * count, <turn i32> * count
+    footer  <index offset u64> <count u32> b"GNRECIDX"
+
+`game_started` payloads are JSON (they arrive once). `game_update`
+payloads are varints: the diff length, then per element either
+`skip << 1` or `type << 1 | 1, owner + 1, zigzag(army)`, then the leader
+board rows. The index is written by `close`; a recording cut short by a
+crash is still readable, `Recording` rebuilds the index by scanning it.
+"""
+import json
+import mmap
+import struct
+from typing import List, Tuple, Union
+
+from map_state import TilePropTuple
+
+MAGIC = b"GNREC\x00\x01\x00"
+INDEX_MAGIC = b"GNRECIDX"
+RECORD = struct.Struct("<BiI")
+FOOTER = struct.Struct("<QI8s")
+
+GAME_STARTED = 0
+GAME_UPDATE = 1
+
+
+def write_varint(buf: bytearray, n: int):
+    while n > 0x7F:
+        buf.append((n & 0x7F) | 0x80)
+        n >>= 7
+    buf.append(n)
+
+
+def read_varint(data, pos: int) -> Tuple[int, int]:
+    n = 0
+    shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+def zigzag(n: int) -> int:
+    return n << 1 if n >= 0 else (-n << 1) - 1
+
+
+def unzigzag(n: int) -> int:
+    return n >> 1 if not n & 1 else -((n + 1) >> 1)
+
+
+def encode_update(map_diff: List[Union[int, TilePropTuple]], leader_board_data: list) -> bytes:
+    buf = bytearray()
+    write_varint(buf, len(map_diff))
+    for diff in map_diff:
+        if isinstance(diff, int):
+            write_varint(buf, diff << 1)
+        else:
+            tile_type, color, army = diff
+            write_varint(buf, tile_type << 1 | 1)
+            write_varint(buf, 0 if color is None else color + 1)
+            write_varint(buf, zigzag(army or 0))
+    rows = leader_board_data or []
+    write_varint(buf, len(rows))
+    for row in rows:
+        write_varint(buf, len(row))
+        for value in row:
+            write_varint(buf, zigzag(int(value)))
+    return bytes(buf)
+
+
+def decode_update(data, pos: int = 0) -> Tuple[list, list]:
+    count, pos = read_varint(data, pos)
+    map_diff = []
+    for _ in range(count):
+        head, pos = read_varint(data, pos)
+        if not head & 1:
+            map_diff.append(head >> 1)
+            continue
+        color, pos = read_varint(data, pos)
+        army, pos = read_varint(data, pos)
+        map_diff.append([head >> 1, None if color == 0 else color - 1, unzigzag(army)])
+    rows, pos = read_varint(data, pos)
+    leader_board_data = []
+    for _ in range(rows):
+        width, pos = read_varint(data, pos)
+        row = []
+        for _ in range(width):
+            value, pos = read_varint(data, pos)
+            row.append(unzigzag(value))
+        leader_board_data.append(row)
+    return map_diff, leader_board_data
+
+
+class GameRecorder:
+    """Streams `game_started`/`game_update` payloads to a recording file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+        self.offsets: List[int] = []
+        self.turns: List[int] = []
+
+    def write(self, kind: int, turn: int, payload: bytes):
+        self.offsets.append(self.file.tell())
+        self.turns.append(turn)
+        self.file.write(RECORD.pack(kind, turn, len(payload)))
+        self.file.write(payload)
+
+    def game_started(self, init_game_info: dict, color: Union[int, None] = None, player_id: Union[str, None] = None):
+        payload = {"init_game_info": init_game_info, "color": color, "player_id": player_id}
+        self.write(GAME_STARTED, 0, json.dumps(payload, separators=(",", ":")).encode())
+
+    def game_update(self, map_diff: List[Union[int, TilePropTuple]], turns_count: int, leader_board_data: list):
+        self.write(GAME_UPDATE, turns_count, encode_update(map_diff, leader_board_data))
+
+    def close(self):
+        if self.file.closed:
+            return
+        # keep the index 8-byte aligned so it can be cast in place
+        self.file.write(b"\x00" * (-self.file.tell() % 8))
+        index_offset = self.file.tell()
+        count = len(self.offsets)
+        self.file.write(struct.pack(f"<{count}Q", *self.offsets))
+        self.file.write(struct.pack(f"<{count}i", *self.turns))
+        self.file.write(FOOTER.pack(index_offset, count, INDEX_MAGIC))
+        self.file.close()
+
+
+class Recording:
+    """Read-only, mmap-backed view of a recording with O(1) access by turn."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a game recording")
+        self.offsets, turns = self.read_index()
+        self.by_turn = {turn: i for i, turn in enumerate(turns)}
+        self.info = None
+        for i in range(len(self.offsets)):
+            kind, _, payload = self.record(i)
+            if kind == GAME_STARTED:
+                self.info = json.loads(bytes(payload))
+                break
+
+    def read_index(self) -> Tuple[memoryview, List[int]]:
+        data = self.data
+        if len(data) >= len(MAGIC) + FOOTER.size:
+            index_offset, count, magic = FOOTER.unpack_from(data, len(data) - FOOTER.size)
+            if magic == INDEX_MAGIC:
+                view = memoryview(data)
+                offsets = view[index_offset:index_offset + count * 8].cast("Q")
+                turns = view[index_offset + count * 8:index_offset + count * 12].cast("i").tolist()
+                return offsets, turns
+        # no index: the recorder did not get to close, walk the records
+        offsets = []
+        turns = []
+        pos = len(MAGIC)
+        while pos + RECORD.size <= len(data):
+            kind, turn, length = RECORD.unpack_from(data, pos)
+            if pos + RECORD.size + length > len(data):
+                break
+            offsets.append(pos)
+            turns.append(turn)
+            pos += RECORD.size + length
+        return memoryview(struct.pack(f"<{len(offsets)}Q", *offsets)).cast("Q"), turns
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def record(self, i: int) -> Tuple[int, int, memoryview]:
+        pos = self.offsets[i]
+        kind, turn, length = RECORD.unpack_from(self.data, pos)
+        start = pos + RECORD.size
+        return kind, turn, memoryview(self.data)[start:start + length]
+
+    def update(self, turn: int) -> Tuple[list, list]:
+        """The `(map_diff, leader_board_data)` received on `turn`."""
+        kind, _, payload = self.record(self.by_turn[turn])
+        if kind != GAME_UPDATE:
+            raise KeyError(turn)
+        return decode_update(payload)
+
+    def updates(self):
+        """Yield `(turns_count, map_diff, leader_board_data)` in recorded order."""
+        for i in range(len(self.offsets)):
+            kind, turn, payload = self.record(i)
+            if kind == GAME_UPDATE:
+                map_diff, leader_board_data = decode_update(payload)
+                yield turn, map_diff, leader_board_data
+
+    def close(self):
+        self.offsets = None
+        self.data.close()
+        self.file.close()
@@ -0,0 +1,116 @@
+"""Feed a recording through a bot at full speed and report decision latency.
+
+    python replay.py games/1-GenniaBot-1700000000.grec --bot app
+
+Each recorded `game_update` is handed to the bot's own `game_update`
+handler (patch_map, then the move logic) and timed. Moves the bot emits
+are counted and dropped.
+"""
+import argparse
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from bots import BOTS, create_bot
+from latency import format_summary, summarize
+from recording import Recording
+
+
+class ReplayClient:
+    """Socket client stand-in that only collects handlers and counts emits."""
+
+    def __init__(self):
+        self.handlers: Dict[str, Callable] = {}
+        self.sid = "replay"
+        self.emitted = 0
+
+    def event(self, handler: Callable) -> Callable:
+        self.handlers[handler.__name__] = handler
+        return handler
+
+    def on(self, event: str, handler: Optional[Callable] = None):
+        if handler:
+            self.handlers[event] = handler
+            return handler
+
+        def set_handler(handler: Callable) -> Callable:
+            self.handlers[event] = handler
+            return handler
+
+        return set_handler
+
+    def emit(self, event: str, data=None, **kwargs):
+        if event == "attack":
+            self.emitted += 1
+
+    def disconnect(self):
+        pass
+
+    def trigger(self, event: str, *args):
+        handler = self.handlers.get(event)
+        if handler:
+            handler(*args)
+
+
+def start_bot(bot: str, color: Optional[int], init_game_info: dict, player_id: Optional[str] = None) -> Tuple[ReplayClient, object]:
+    """A fresh bot of kind `bot`, taken through joining and the start of a game as `color`."""
+    client = ReplayClient()
+    instance = create_bot(bot, client, "replay", "replay")
+    player_id = player_id or "replay"
+    client.trigger("set_player_id", player_id)
+    client.trigger(
+        "update_room",
+        {
+            "id": "replay",
+            "gameStarted": True,
+            "players": [
+                {"id": player_id, "username": "replay", "color": color, "forceStart": True, "isRoomHost": False}
+            ],
+        },
+    )
+    client.trigger("game_started", init_game_info)
+    return client, instance
+
+
+def replay(recording: Recording, bot: str = "random", first: int = 0, last: int = -1) -> Tuple[List[float], object]:
+    """Play the recording into a fresh bot; returns per-turn latency in ms and the bot.
+
+    Turns before `first` are applied without timing so the bot reaches the
+    same state it had in the recorded game.
+    """
+    info = recording.info
+    if not info or not info.get("init_game_info"):
+        # a recorder started mid-game: the bot would have no map to patch
+        raise ValueError(f"{recording.path} has no game_started record, it cannot be replayed")
+    client, instance = start_bot(bot, info.get("color"), info.get("init_game_info"), info.get("player_id"))
+    gbot = instance.gbot
+    handler = client.handlers["game_update"]
+    samples = []
+    for turn, map_diff, leader_board_data in recording.updates():
+        if last >= 0 and turn > last:
+            break
+        start = time.perf_counter()
+        handler(map_diff, turn, leader_board_data)
+        if turn >= first:
+            samples.append((time.perf_counter() - start) * 1000)
+    return samples, gbot
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a game recording and report decision latency")
+    parser.add_argument("recording", type=str, help="Path to a .grec file")
+    parser.add_argument("--bot", type=str, default="random", choices=list(BOTS))
+    parser.add_argument("--first", type=int, default=0, help="first turn to time")
+    parser.add_argument("--last", type=int, default=-1, help="last turn to replay")
+    args = parser.parse_args()
+
+    recording = Recording(args.recording)
+    try:
+        samples, gbot = replay(recording, args.bot, args.first, args.last)
+    except ValueError as e:
+        parser.error(str(e))
+    recording.close()
+    print(f"{args.recording} ({args.bot}): {format_summary(summarize(samples))}")
+    if hasattr(gbot, "turn_stats"):
+        print(f"turn budget: {gbot.turn_stats.as_dict()}")
+    if getattr(gbot, "warmup_ms", None):
+        print(f"warmup: {gbot.warmup_ms:.1f}ms")
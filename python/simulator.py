@@ -0,0 +1,506 @@
+"""In-process stand-in for GenniaServer2.
+
+`LocalServer` runs the game rules of the server's `lib/map.ts` and
+`lib/block.ts` (army growth, combat, city and general capture, fog of war)
+and sends each player the same socket events a real server would, with
+run-length `map_diff` updates. `LocalClient` has the `socketio.Client`
+surface the bots use, so `register_handlers` can be pointed at it instead
+of a live connection, and `LocalServer.run` plays turns back to back with
+no tick delay.
+
+    python simulator.py --width 20 --height 20 --bots random,app
+"""
+import argparse
+import math
+import random
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import parse_qs, urlparse
+
+from bots import BOTS, create_bot
+from map_state import NO_OWNER, TileType
+
+# fog of war reveals the 3x3 square around every owned tile
+VIEW_OFFSETS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+MOVE_OFFSETS = [(-1, 0), (0, 1), (1, 0), (0, -1)]
+
+
+class LocalClient:
+    """Socket client stand-in that delivers events through a LocalServer."""
+
+    def __init__(self, server: "LocalServer"):
+        self.server = server
+        self.handlers: Dict[str, Callable] = {}
+        self.sid = None
+        self.connected = False
+
+    def event(self, handler: Callable) -> Callable:
+        self.handlers[handler.__name__] = handler
+        return handler
+
+    def on(self, event: str, handler: Optional[Callable] = None):
+        if handler:
+            self.handlers[event] = handler
+            return handler
+
+        def set_handler(handler: Callable) -> Callable:
+            self.handlers[event] = handler
+            return handler
+
+        return set_handler
+
+    def connect(self, url: str = "", **kwargs):
+        query = parse_qs(urlparse(url).query)
+        username = query.get("username", [None])[0]
+        self.connected = True
+        self.server.join(self, username)
+
+    def disconnect(self):
+        if self.connected:
+            self.connected = False
+            self.server.leave(self)
+
+    def emit(self, event: str, data=None, **kwargs):
+        if data is None:
+            args = ()
+        elif isinstance(data, tuple):
+            args = data
+        else:
+            args = (data,)
+        self.server.receive(self, event, args)
+
+    def trigger(self, event: str, args: tuple):
+        handler = self.handlers.get(event)
+        if handler:
+            handler(*args)
+
+
+class LocalPlayer:
+    def __init__(self, client: LocalClient, id: str, username: str, color: int):
+        self.client = client
+        self.id = id
+        self.username = username
+        self.color = color
+        self.is_room_host = False
+        self.force_start = False
+        self.is_dead = False
+        self.king = -1
+        self.moves = deque()
+        self.prev_view = None
+
+    def user_data(self) -> dict:
+        return {"id": self.id, "username": self.username, "color": self.color}
+
+
+class LocalServer:
+    """One room with the server's game rules, stepped by `step`/`run`."""
+
+    def __init__(
+        self,
+        width: int = 20,
+        height: int = 20,
+        mountain: float = 0.5,
+        city: float = 0.5,
+        swamp: float = 0.0,
+        fog_of_war: bool = True,
+        max_turns: int = 2000,
+        seed: Union[int, None] = None,
+        room_id: str = "local",
+    ):
+        self.width = width
+        self.height = height
+        self.size = width * height
+        self.mountain = mountain
+        self.city = city
+        self.swamp = swamp
+        self.fog_of_war = fog_of_war
+        self.max_turns = max_turns
+        self.random = random.Random(seed)
+        self.room_id = room_id
+        self.players: List[LocalPlayer] = []
+        self.clients: Dict[LocalClient, LocalPlayer] = {}
+        self.outbox = deque()
+        self.game_started = False
+        self.game_ended = False
+        self.winner: Union[LocalPlayer, None] = None
+        self.turn = 0
+        self.types = []
+        self.owners = []
+        self.units = []
+
+    # socket side
+
+    def send(self, player: LocalPlayer, event: str, *args):
+        self.outbox.append((player.client, event, args))
+
+    def flush(self):
+        while self.outbox:
+            client, event, args = self.outbox.popleft()
+            if client.connected:
+                client.trigger(event, args)
+
+    def room_info(self) -> dict:
+        return {
+            "id": self.room_id,
+            "gameStarted": self.game_started,
+            "mapWidth": self.width,
+            "mapHeight": self.height,
+            "fogOfWar": self.fog_of_war,
+            "players": [
+                {
+                    "id": p.id,
+                    "username": p.username,
+                    "color": p.color,
+                    "isRoomHost": p.is_room_host,
+                    "forceStart": p.force_start,
+                    "isDead": p.is_dead,
+                    "spectating": False,
+                }
+                for p in self.players
+            ],
+        }
+
+    def broadcast_room(self):
+        room = self.room_info()
+        for p in self.players:
+            self.send(p, "update_room", room)
+
+    def join(self, client: LocalClient, username: Union[str, None]):
+        if self.game_started:
+            raise RuntimeError("game already started")
+        # colors start at 1, the bots treat color 0 as "not set"
+        color = len(self.players) + 1
+        player = LocalPlayer(client, f"player{color}", username or f"Bot{color}", color)
+        player.is_room_host = not self.players
+        client.sid = player.id
+        self.players.append(player)
+        self.clients[client] = player
+        client.trigger("connect", ())
+        self.send(player, "set_player_id", player.id)
+        self.broadcast_room()
+        self.flush()
+
+    def leave(self, client: LocalClient):
+        player = self.clients.pop(client, None)
+        if player and not self.game_started:
+            self.players.remove(player)
+            self.broadcast_room()
+
+    def receive(self, client: LocalClient, event: str, args: tuple):
+        player = self.clients.get(client)
+        if not player:
+            return
+        if event == "attack":
+            if self.game_started and not player.is_dead:
+                player.moves.append(args)
+        elif event == "force_start":
+            if not self.game_started and not player.force_start:
+                player.force_start = True
+                self.broadcast_room()
+        elif event == "get_room_info":
+            self.send(player, "update_room", self.room_info())
+
+    def ready(self) -> bool:
+        return len(self.players) >= 2 and all(p.force_start for p in self.players)
+
+    # game rules
+
+    def index(self, x: int, y: int) -> int:
+        return x * self.height + y
+
+    def generate(self):
+        size = self.size
+        rand = self.random
+        self.types = [TileType.Plain] * size
+        self.owners = [NO_OWNER] * size
+        self.units = [0] * size
+        kings = []
+        min_dist = 6
+        while len(kings) < len(self.players):
+            for _ in range(1000):
+                x, y = rand.randrange(self.width), rand.randrange(self.height)
+                if all(abs(x - kx) + abs(y - ky) > min_dist for kx, ky in kings):
+                    break
+            else:
+                # the map is too small for the usual spacing
+                min_dist -= 1
+                continue
+            kings.append((x, y))
+        for player, (x, y) in zip(self.players, kings):
+            i = self.index(x, y)
+            self.types[i] = TileType.King
+            self.owners[i] = player.color
+            self.units[i] = 1
+            player.king = i
+        if self.mountain + self.city > 0:
+            mountains = math.ceil(size / 4 * self.mountain / (self.mountain + self.city))
+            cities = math.ceil(size / 6 * self.city / (self.mountain + self.city))
+        else:
+            mountains = cities = 0
+        plains = [i for i in range(size) if self.types[i] == TileType.Plain]
+        rand.shuffle(plains)
+        for i in plains[:mountains]:
+            self.types[i] = TileType.Mountain
+        for i in plains[mountains:mountains + cities]:
+            self.types[i] = TileType.City
+            self.units[i] = rand.randrange(35, 55)
+        swamps = math.ceil((size - mountains - cities) / 3 * self.swamp)
+        for i in plains[mountains + cities:mountains + cities + swamps]:
+            self.types[i] = TileType.Swamp
+        self.connect_kings()
+
+    def connect_kings(self):
+        # the server rejects obstacles that split the map; doing the same
+        # check per tile is quadratic, so instead clear random walls around
+        # the first king's region until every king can be reached
+        blocking = (TileType.Mountain, TileType.City)
+        while True:
+            reached = bytearray(self.size)
+            start = self.players[0].king
+            reached[start] = 1
+            queue = [start]
+            walls = []
+            for a in queue:
+                x, y = divmod(a, self.height)
+                for dx, dy in MOVE_OFFSETS:
+                    nx, ny = x + dx, y + dy
+                    if 0 <= nx < self.width and 0 <= ny < self.height:
+                        b = self.index(nx, ny)
+                        if reached[b]:
+                            continue
+                        reached[b] = 1
+                        if self.types[b] in blocking:
+                            walls.append(b)
+                        else:
+                            queue.append(b)
+            kings = set(queue)
+            if all(p.king in kings for p in self.players):
+                return
+            wall = self.random.choice(walls)
+            self.types[wall] = TileType.Plain
+            self.units[wall] = 0
+
+    def start(self):
+        self.generate()
+        self.game_started = True
+        self.broadcast_room()
+        for p in self.players:
+            x, y = divmod(p.king, self.height)
+            self.send(p, "game_started", {"king": {"x": x, "y": y}, "mapWidth": self.width, "mapHeight": self.height})
+        self.send_updates()
+        self.flush()
+
+    def alive(self) -> List[LocalPlayer]:
+        return [p for p in self.players if not p.is_dead]
+
+    def player_of(self, color: int) -> LocalPlayer:
+        return self.players[color - 1]
+
+    def move(self, player: LocalPlayer, args: tuple):
+        if len(args) < 2:
+            return
+        from_p, to = args[0], args[1]
+        half = len(args) > 2 and bool(args[2])
+        try:
+            fx, fy, tx, ty = int(from_p["x"]), int(from_p["y"]), int(to["x"]), int(to["y"])
+        except (KeyError, TypeError, ValueError):
+            self.send(player, "attack_failure", from_p, to, "Invalid position")
+            return
+        if not (0 <= fx < self.width and 0 <= fy < self.height and 0 <= tx < self.width and 0 <= ty < self.height):
+            self.send(player, "attack_failure", from_p, to, "Out of map")
+            return
+        if abs(fx - tx) + abs(fy - ty) != 1:
+            self.send(player, "attack_failure", from_p, to, "Not adjacent")
+            return
+        a = self.index(fx, fy)
+        b = self.index(tx, ty)
+        if self.owners[a] != player.color or self.types[b] == TileType.Mountain:
+            self.send(player, "attack_failure", from_p, to, "Not commandable")
+            return
+        unit = max(self.units[a] - 1, 0)
+        if half:
+            unit = math.ceil(unit / 2)
+        self.units[a] -= unit
+        if self.owners[b] == player.color:
+            self.units[b] += unit
+        elif self.units[b] >= unit:
+            self.units[b] -= unit
+        else:
+            loser = self.owners[b]
+            self.units[b] = unit - self.units[b]
+            self.owners[b] = player.color
+            if self.types[b] == TileType.King and loser != NO_OWNER:
+                self.capture_king(player, self.player_of(loser), b)
+
+    def capture_king(self, winner: LocalPlayer, loser: LocalPlayer, king: int):
+        self.types[king] = TileType.City
+        for i in range(self.size):
+            if self.owners[i] == loser.color:
+                self.owners[i] = winner.color
+                self.units[i] = math.ceil(self.units[i] / 2)
+        loser.is_dead = True
+        loser.moves.clear()
+        self.send(loser, "game_over", winner.user_data())
+
+    def update_units(self):
+        turn = self.turn
+        types = self.types
+        owners = self.owners
+        units = self.units
+        for i in range(self.size):
+            t = types[i]
+            if t == TileType.Plain:
+                if owners[i] != NO_OWNER and turn % 50 == 0:
+                    units[i] += 1
+            elif t == TileType.King:
+                if turn % 2 == 0:
+                    units[i] += 1
+            elif t == TileType.City:
+                if owners[i] != NO_OWNER and turn % 2 == 0:
+                    units[i] += 1
+            elif t == TileType.Swamp:
+                if owners[i] != NO_OWNER and turn % 2 == 0:
+                    units[i] -= 1
+                if units[i] <= 0:
+                    units[i] = 0
+                    owners[i] = NO_OWNER
+
+    def view(self, player: LocalPlayer) -> List[list]:
+        types = self.types
+        owners = self.owners
+        units = self.units
+        height = self.height
+        visible = bytearray(self.size)
+        if not self.fog_of_war or player.is_dead:
+            visible = bytearray(b"\x01") * self.size
+        else:
+            for i in range(self.size):
+                if owners[i] == player.color:
+                    x, y = divmod(i, height)
+                    for dx, dy in VIEW_OFFSETS:
+                        nx, ny = x + dx, y + dy
+                        if 0 <= nx < self.width and 0 <= ny < height:
+                            visible[nx * height + ny] = 1
+        tiles = []
+        for i in range(self.size):
+            if visible[i]:
+                owner = owners[i]
+                tiles.append([types[i], None if owner == NO_OWNER else owner, units[i]])
+            elif types[i] == TileType.Mountain or types[i] == TileType.City:
+                tiles.append([TileType.Obstacle, None, 0])
+            else:
+                tiles.append([TileType.Fog, None, 0])
+        return tiles
+
+    def leader_board(self) -> List[list]:
+        army = {p.color: 0 for p in self.players}
+        land = {p.color: 0 for p in self.players}
+        for owner, unit in zip(self.owners, self.units):
+            if owner in army:
+                army[owner] += unit
+                land[owner] += 1
+        rows = [[p.color, army[p.color], land[p.color]] for p in self.players]
+        return sorted(rows, key=lambda r: r[1], reverse=True)
+
+    def send_updates(self):
+        board = self.leader_board()
+        for p in self.players:
+            if not p.client.connected:
+                continue
+            cur = self.view(p)
+            self.send(p, "game_update", diff_views(p.prev_view, cur), self.turn, board)
+            p.prev_view = cur
+
+    def step(self):
+        """Play one turn: one queued move per player, growth, then updates."""
+        self.turn += 1
+        order = self.alive()
+        # rotate who moves first so no color always wins simultaneous fights
+        shift = self.turn % len(order) if order else 0
+        for p in order[shift:] + order[:shift]:
+            if p.moves and not p.is_dead:
+                self.move(p, p.moves.popleft())
+        self.update_units()
+        self.send_updates()
+        alive = self.alive()
+        if len(alive) <= 1 or self.turn >= self.max_turns:
+            self.end(alive)
+        self.flush()
+
+    def end(self, alive: List[LocalPlayer]):
+        if len(alive) == 1:
+            self.winner = alive[0]
+        else:
+            board = {row[0]: row[1] for row in self.leader_board()}
+            self.winner = max(alive or self.players, key=lambda p: board.get(p.color, 0))
+        self.game_ended = True
+        for p in self.players:
+            self.send(p, "game_ended", self.winner.user_data(), "local")
+
+    def run(self) -> Union[LocalPlayer, None]:
+        """Start once everyone forced start, then play until the game ends."""
+        self.flush()
+        if not self.game_started:
+            if not self.ready():
+                for p in self.players:
+                    p.force_start = True
+            self.start()
+        while not self.game_ended:
+            self.step()
+        return self.winner
+
+
+def diff_views(prev: Union[List[list], None], cur: List[list]) -> List[Union[int, list]]:
+    """Encode `cur` against `prev` the way the server's MapDiff does."""
+    if prev is None:
+        return list(cur)
+    data = []
+    same = 0
+    for a, b in zip(prev, cur):
+        if a == b:
+            same += 1
+        else:
+            if same:
+                data.append(same)
+                same = 0
+            data.append(b)
+    if same:
+        data.append(same)
+    return data
+
+
+def attach_bot(
+    server: LocalServer, kind: str, username: str, record_dir: Union[str, None] = None, client: Union[LocalClient, None] = None
+):
+    """Connect one of the repo's bots to `server` the way it joins a real room."""
+    client = client or LocalClient(server)
+    bot = create_bot(kind, client, server.room_id, username)
+    bot.gbot.record_dir = record_dir
+    client.connect(f"local?username={username}&roomId={server.room_id}")
+    client.emit(bot.join_event)
+    return bot
+
+
+def play(server: LocalServer, bots: List[str], record_dir: Union[str, None] = None) -> Tuple[Union[LocalPlayer, None], list]:
+    attached = [attach_bot(server, kind, f"{kind}{i}", record_dir) for i, kind in enumerate(bots)]
+    return server.run(), attached
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play a local game between bots, unthrottled")
+    parser.add_argument("--width", type=int, default=20)
+    parser.add_argument("--height", type=int, default=20)
+    parser.add_argument("--mountain", type=float, default=0.5)
+    parser.add_argument("--city", type=float, default=0.5)
+    parser.add_argument("--turns", type=int, default=2000, help="max turns")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--bots", type=str, default="random,random", help=f"comma separated, any of {', '.join(BOTS)}")
+    parser.add_argument("--record", type=str, default=None, help="directory to write each bot's recording to")
+    args = parser.parse_args()
+
+    server = LocalServer(args.width, args.height, args.mountain, args.city, max_turns=args.turns, seed=args.seed)
+    start = time.perf_counter()
+    winner, _ = play(server, args.bots.split(","), args.record)
+    elapsed = time.perf_counter() - start
+    print(f"winner: {winner.username if winner else None} after {server.turn} turns in {elapsed * 1000:.1f} ms")
@@ -0,0 +1,223 @@
+"""Crash-safe snapshots of a bot's state in a memory-mapped file.
+
+A snapshot file holds two slots, written in turn, so a process killed
+while writing one still leaves the other whole:
+
+    header  b"GNSNAP\\x00\\x01" <width u32> <height u32> <meta bytes u32>, padding to 64
+    slot    <begin u64> <end u64> <turn i32> <meta length u32> <8 pad>
+            map types i8 * n, owners i16 * n, armies i32 * n,
+            fog memory seen turn i32 * n, seen type i8 * n, seen owner i16 * n,
+            seen army i32 * n, visible u8 * n, viewed u8 * n (each padded to 8),
+            then the bot's own state as JSON, up to <meta bytes>
+    slot    the same again
+
+A write sets `begin` to the next sequence number, copies the state over
+and then sets `end` to it, so a slot is whole when the two match, and the
+newest whole slot is the snapshot. Only cells marked dirty since a slot
+was last written are copied, so a turn costs a write per changed cell and
+column, plus the JSON, which is usually the bot's queue of moves. The file
+lives in the page cache and is only synced by `close`: a crashed process
+loses nothing it wrote, but a crashed machine may.
+"""
+import json
+import mmap
+import os
+import struct
+from array import array
+from typing import Iterable, List, NamedTuple, Tuple, Union
+
+from fog_memory import FogMemory
+from map_state import NO_OWNER, MapState, TileType
+
+MAGIC = b"GNSNAP\x00\x01"
+HEADER = struct.Struct("<8sIII44x")
+SLOT = struct.Struct("<QQiI8x")
+END = struct.Struct("<Q")
+
+# (state, field, array typecode) of the cell columns, in file order
+COLUMNS = (
+    ("map", "types", "b"),
+    ("map", "owners", "h"),
+    ("map", "armies", "i"),
+    ("memory", "seen_turn", "i"),
+    ("memory", "seen_type", "b"),
+    ("memory", "seen_owner", "h"),
+    ("memory", "seen_army", "i"),
+    ("memory", "visible", "B"),
+    ("memory", "viewed", "B"),
+)
+
+# room for the JSON state per cell of the map, with a floor for small maps
+META_PER_CELL = 32
+MIN_META = 1 << 16
+
+
+class Snapshot(NamedTuple):
+    turn: int
+    game_map: MapState
+    memory: FogMemory
+    meta: dict
+
+
+def layout(size: int, meta_bytes: int) -> Tuple[List[int], int, int]:
+    """Offsets of the columns and of the JSON within a slot, and the slot size."""
+    offsets = []
+    pos = SLOT.size
+    for _, _, code in COLUMNS:
+        offsets.append(pos)
+        nbytes = struct.calcsize(code) * size
+        pos += nbytes + (-nbytes % 8)
+    return offsets, pos, pos + meta_bytes + (-meta_bytes % 8)
+
+
+def whole_slots(data, slot_size: int) -> List[Tuple[int, int, int, int]]:
+    """(sequence, slot, turn, meta length) of each slot that was written to the end."""
+    slots = []
+    for slot in range(2):
+        begin, end, turn, meta_length = SLOT.unpack_from(data, HEADER.size + slot * slot_size)
+        if begin and begin == end:
+            slots.append((begin, slot, turn, meta_length))
+    return slots
+
+
+class SnapshotWriter:
+    """Writes a bot's map, fog memory and JSON state into one of two slots per `save`.
+
+    Opening a file that already holds snapshots of a map this size keeps
+    them, on the understanding that the bot was just restored from the
+    newest one.
+    """
+
+    def __init__(self, path: str, width: int, height: int, meta_bytes: Union[int, None] = None, fresh: bool = False):
+        self.path = path
+        self.size = width * height
+        self.meta_bytes = meta_bytes or max(MIN_META, META_PER_CELL * self.size)
+        self.offsets, self.meta_offset, self.slot_size = layout(self.size, self.meta_bytes)
+        header = HEADER.pack(MAGIC, width, height, self.meta_bytes)
+        length = HEADER.size + 2 * self.slot_size
+        reuse = not fresh and os.path.exists(path) and os.path.getsize(path) == length
+        if reuse:
+            with open(path, "rb") as f:
+                reuse = f.read(HEADER.size) == header
+        self.file = open(path, "r+b" if reuse else "w+b")
+        if not reuse:
+            self.file.write(header)
+            self.file.truncate(length)
+            self.file.flush()
+        self.data = mmap.mmap(self.file.fileno(), length)
+        self.views = []
+        for slot in range(2):
+            view = memoryview(self.data)
+            base = HEADER.size + slot * self.slot_size
+            self.views.append([
+                view[base + offset:base + offset + struct.calcsize(code) * self.size].cast(code)
+                for offset, (_, _, code) in zip(self.offsets, COLUMNS)
+            ])
+        # per slot: copy every cell next time, or only the cells marked since its last write
+        self.full = [True, True]
+        self.marked = [bytearray(self.size), bytearray(self.size)]
+        self.cells: List[List[int]] = [[], []]
+        self.seq = 0
+        self.slot = 0
+        slots = whole_slots(self.data, self.slot_size) if reuse else []
+        if slots:
+            self.seq, newest, _, _ = max(slots)
+            self.full[newest] = False
+            self.slot = 1 - newest
+
+    def mark(self, cells: Iterable[int]):
+        """Cells whose tile or memory changed since the last `mark`."""
+        cells = list(cells)
+        for slot in range(2):
+            if self.full[slot]:
+                continue
+            marked = self.marked[slot]
+            pending = self.cells[slot]
+            for i in cells:
+                if not marked[i]:
+                    marked[i] = 1
+                    pending.append(i)
+            if len(pending) > self.size // 8:
+                # past this, copying whole columns is cheaper
+                self.full[slot] = True
+                self.marked[slot] = bytearray(self.size)
+                self.cells[slot] = []
+
+    def save(self, turn: int, game_map: MapState, memory: FogMemory, meta: dict) -> bool:
+        """Write a snapshot; False, writing nothing, if the JSON of `meta` does not fit."""
+        payload = json.dumps(
+            {"memory": {"turn": memory.turn, "generals": memory.generals}, "bot": meta}, separators=(",", ":")
+        ).encode()
+        if len(payload) > self.meta_bytes:
+            return False
+        slot = self.slot
+        base = HEADER.size + slot * self.slot_size
+        self.seq += 1
+        # `end` stays behind `begin` until the slot is whole again
+        SLOT.pack_into(self.data, base, self.seq, 0, turn, len(payload))
+        states = {"map": game_map, "memory": memory}
+        for view, (state, name, _) in zip(self.views[slot], COLUMNS):
+            column = getattr(states[state], name)
+            if self.full[slot]:
+                view[:] = column
+            else:
+                for i in self.cells[slot]:
+                    view[i] = column[i]
+        start = base + self.meta_offset
+        self.data[start:start + len(payload)] = payload
+        END.pack_into(self.data, base + 8, self.seq)
+        marked = self.marked[slot]
+        for i in self.cells[slot]:
+            marked[i] = 0
+        self.cells[slot] = []
+        self.full[slot] = False
+        self.slot = 1 - slot
+        return True
+
+    def close(self, remove: bool = False):
+        """Sync and close the file; `remove` deletes it, once the game it was for is over."""
+        self.views = []
+        self.data.flush()
+        self.data.close()
+        self.file.close()
+        if remove:
+            os.remove(self.path)
+
+
+def read_snapshot(path: str) -> Union[Snapshot, None]:
+    """The newest whole snapshot in `path`, or None if there is none."""
+    try:
+        f = open(path, "rb")
+    except OSError:
+        return None
+    with f:
+        data = f.read()
+    if len(data) < HEADER.size or data[:len(MAGIC)] != MAGIC:
+        return None
+    _, width, height, meta_bytes = HEADER.unpack_from(data)
+    size = width * height
+    offsets, meta_offset, slot_size = layout(size, meta_bytes)
+    if len(data) < HEADER.size + 2 * slot_size:
+        return None
+    slots = whole_slots(data, slot_size)
+    if not slots:
+        return None
+    _, slot, turn, meta_length = max(slots)
+    base = HEADER.size + slot * slot_size
+    game_map = MapState(width, height)
+    memory = FogMemory(width, height)
+    states = {"map": game_map, "memory": memory}
+    for offset, (state, name, code) in zip(offsets, COLUMNS):
+        raw = data[base + offset:base + offset + struct.calcsize(code) * size]
+        setattr(states[state], name, bytearray(raw) if code == "B" else array(code, raw))
+    meta = json.loads(data[base + meta_offset:base + meta_offset + meta_length])
+    memory.turn = meta["memory"]["turn"]
+    memory.generals = {int(color): cell for color, cell in meta["memory"]["generals"].items()}
+    # the rest of the memory follows from what was last seen of each cell
+    for i in range(size):
+        owner = memory.seen_owner[i]
+        if owner != NO_OWNER:
+            memory.by_owner.setdefault(owner, set()).add(i)
+        if memory.seen_type[i] == TileType.City:
+            memory.cities.add(i)
+    return Snapshot(turn, game_map, memory, meta["bot"])
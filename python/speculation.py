@@ -0,0 +1,72 @@
+"""Guess the next update so the next turn can be planned before it arrives.
+
+`predict` applies the move we just sent and the coming turn's growth to a
+copy of the map. Whatever is planned on that copy stays good as long as
+the real update agrees with it on the cells the plan goes through, which
+`invalidated` checks from the cells either side touched.
+"""
+from typing import Iterable, List, Set, Tuple
+
+from fog_memory import FogMemory
+from map_state import NO_OWNER, MapState, TileType
+from tile_index import TileIndex
+
+
+def predict(
+    game_map: MapState, move: Tuple[int, int], color: int, turn: int, memory: FogMemory, tiles: TileIndex
+) -> Tuple[MapState, List[int]]:
+    """The map as we expect `turn`'s update to leave it, and the cells that differ."""
+    predicted = game_map.copy()
+    types = predicted.types
+    owners = predicted.owners
+    armies = predicted.armies
+    changed = set()
+    a, b = move
+    # the server's move rules, see simulator.LocalServer.move
+    if owners[a] == color and types[b] != TileType.Mountain:
+        unit = max(armies[a] - 1, 0)
+        armies[a] -= unit
+        if owners[b] == color:
+            armies[b] += unit
+        elif armies[b] >= unit:
+            armies[b] -= unit
+        else:
+            armies[b] = unit - armies[b]
+            owners[b] = color
+        changed.update(move)
+    visible = memory.visible
+    if turn % 2 == 0:
+        for cell in list(memory.cities) + list(memory.generals.values()):
+            if visible[cell] and owners[cell] != NO_OWNER:
+                armies[cell] += 1
+                changed.add(cell)
+    if turn % 50 == 0:
+        for cells in tiles.owned.values():
+            for cell in cells:
+                if types[cell] == TileType.Plain:
+                    armies[cell] += 1
+                    changed.add(cell)
+    return predicted, list(changed)
+
+
+def mismatches(game_map: MapState, predicted: MapState, cells: Iterable[int]) -> Set[int]:
+    """The `cells` where the real map and the prediction disagree."""
+    types = game_map.types
+    owners = game_map.owners
+    armies = game_map.armies
+    p_types = predicted.types
+    p_owners = predicted.owners
+    p_armies = predicted.armies
+    return {
+        i for i in cells
+        if types[i] != p_types[i] or owners[i] != p_owners[i] or armies[i] != p_armies[i]
+    }
+
+
+def invalidated(game_map: MapState, predicted: MapState, cells: Iterable[int], footprint: Set[int]) -> bool:
+    """Whether the real map differs from the prediction anywhere in `footprint`.
+
+    `cells` must cover every cell that may differ: the update's dirty cells
+    plus the cells `predict` changed.
+    """
+    return not footprint.isdisjoint(mismatches(game_map, predicted, cells))
@@ -0,0 +1,186 @@
+"""Structured events and per-turn counters, written off the bot's thread.
+
+    telemetry = Telemetry(open_sink("bot.jsonl"), level=INFO, sample={"attack": 0.1}, bot="GenniaBot")
+    telemetry.event("game_started", width=20, height=20)
+    telemetry.count("moves")
+    telemetry.turn(12, decision_ms=0.4)
+    telemetry.close()
+
+`event` only checks the level and the sampling rate and appends a tuple
+to a bounded queue; when the queue is full the event is dropped and
+counted. A daemon thread wakes every `interval` seconds (or once `batch`
+events are waiting), turns what is queued into JSON lines and writes them
+to the sink in one go, so the handler thread never waits on I/O. `count`
+adds to the current turn's counters, which `turn` emits as one `turn`
+event and resets.
+
+A sink is a file path, `-` for stdout, or `udp://host:port` /
+`tcp://host:port`. Without a sink, events are discarded on the spot.
+"""
+import atexit
+import json
+import socket
+import sys
+import threading
+import time
+from collections import deque
+from typing import BinaryIO, Dict, Union
+from urllib.parse import urlparse
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR}
+LEVEL_NAMES = {level: name for name, level in LEVELS.items()}
+# one encoder for every record, json.dumps builds a new one per call when given options
+ENCODER = json.JSONEncoder(separators=(",", ":"), default=str)
+
+
+class SocketSink:
+    """Sends each batch over TCP, or each line as a datagram over UDP."""
+
+    def __init__(self, url: str):
+        parsed = urlparse(url)
+        self.address = (parsed.hostname, parsed.port)
+        self.udp = parsed.scheme == "udp"
+        if self.udp:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        else:
+            self.sock = socket.create_connection(self.address)
+
+    def write(self, data: bytes):
+        if self.udp:
+            for line in data.splitlines(keepends=True):
+                self.sock.sendto(line, self.address)
+        else:
+            self.sock.sendall(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.sock.close()
+
+
+def open_sink(target: Union[str, None]):
+    """A writable binary sink for `target`, or None for no telemetry."""
+    if not target:
+        return None
+    if target == "-":
+        return sys.stdout.buffer
+    if target.startswith(("udp://", "tcp://")):
+        return SocketSink(target)
+    return open(target, "ab")
+
+
+def parse_sample(text: Union[str, None]) -> Dict[str, float]:
+    """`attack=0.1,turn=0.5` into a sampling rate per event name."""
+    if not text:
+        return {}
+    return {name: float(rate) for name, _, rate in (item.partition("=") for item in text.split(","))}
+
+
+class Telemetry:
+    def __init__(
+        self,
+        sink: Union[BinaryIO, SocketSink, None] = None,
+        level: int = INFO,
+        sample: Union[Dict[str, float], None] = None,
+        capacity: int = 10000,
+        batch: int = 256,
+        interval: float = 0.5,
+        **fields,
+    ):
+        self.sink = sink
+        self.level = level if sink else ERROR + 1
+        # keep one event in `every[name]` of that name
+        self.every = {name: max(round(1 / rate), 1) if rate > 0 else 0 for name, rate in (sample or {}).items()}
+        self.seen: Dict[str, int] = {}
+        self.capacity = capacity
+        self.batch = batch
+        self.interval = interval
+        self.fields = fields
+        self.queue = deque()
+        self.dropped = 0
+        self.reported = 0  # drops already written out as telemetry_dropped
+        self.write_errors = 0
+        self.counters: Dict[str, int] = {}
+        self.wake = threading.Event()
+        self.closed = False
+        self.writer = None
+        if sink:
+            self.writer = threading.Thread(target=self.drain, name="telemetry", daemon=True)
+            self.writer.start()
+            atexit.register(self.close)
+
+    def enabled(self, level: int) -> bool:
+        return level >= self.level
+
+    def event(self, name: str, level: int = INFO, **fields) -> bool:
+        """Queue an event; False if it was filtered, sampled out or dropped."""
+        if level < self.level:
+            return False
+        every = self.every.get(name)
+        if every is not None:
+            seen = self.seen[name] = self.seen.get(name, 0) + 1
+            if not every or seen % every:
+                return False
+        queue = self.queue
+        if len(queue) >= self.capacity:
+            self.dropped += 1
+            return False
+        queue.append((time.time(), level, name, fields))
+        if len(queue) >= self.batch:
+            self.wake.set()
+        return True
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def turn(self, turn: int, level: int = INFO, **fields):
+        """Emit the counters gathered since the last turn, with `fields`, and reset them."""
+        counters = self.counters
+        self.counters = {}
+        self.event("turn", level, turn=turn, **counters, **fields)
+
+    def drain(self):
+        while True:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            self.flush()
+            if self.closed:
+                return
+
+    def flush(self):
+        queue = self.queue
+        if not queue and self.dropped == self.reported:
+            return
+        lines = []
+        encode = ENCODER.encode
+        for _ in range(len(queue)):
+            t, level, name, fields = queue.popleft()
+            record = {"t": round(t, 6), "level": LEVEL_NAMES.get(level, level), "event": name, **self.fields, **fields}
+            lines.append(encode(record))
+        dropped = self.dropped
+        if dropped > self.reported:
+            record = {"t": round(time.time(), 6), "level": "warning", "event": "telemetry_dropped", **self.fields, "count": dropped - self.reported}
+            lines.append(ENCODER.encode(record))
+            self.reported = dropped
+        try:
+            self.sink.write(("\n".join(lines) + "\n").encode())
+            self.sink.flush()
+        except (OSError, ValueError):
+            # a broken sink loses events, it must not take the bot down
+            self.write_errors += 1
+
+    def close(self):
+        """Write out what is queued and stop the writer."""
+        if self.closed or not self.writer:
+            self.closed = True
+            return
+        self.closed = True
+        self.wake.set()
+        self.writer.join()
+        if self.sink is not sys.stdout.buffer:
+            self.sink.close()
@@ -0,0 +1,92 @@
+import random
+
+from distance_field import UNREACHABLE, DistanceFields
+from map_state import MapState, TileType
+
+
+def bfs(game_map: MapState, source: int):
+    """Walking distances from `source` on the grid, from scratch."""
+    blocked = {TileType.Mountain, TileType.Obstacle}
+    dist = [UNREACHABLE] * game_map.size
+    if game_map.types[source] in blocked:
+        return dist
+    dist[source] = 0
+    queue = [source]
+    for a in queue:
+        x, y = game_map.position(a)
+        for nx, ny in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+            if not game_map.in_range(nx, ny):
+                continue
+            b = game_map.index(nx, ny)
+            if dist[b] == UNREACHABLE and game_map.types[b] not in blocked:
+                dist[b] = dist[a] + 1
+                queue.append(b)
+    return dist
+
+
+def set_type(game_map: MapState, cell: int, tile_type: int) -> list:
+    if game_map.types[cell] == tile_type:
+        return []
+    game_map.types[cell] = tile_type
+    return [cell]
+
+
+def test_build_matches_bfs():
+    rng = random.Random(3)
+    game_map = MapState(9, 7)
+    for i in range(game_map.size):
+        game_map.types[i] = TileType.Mountain if rng.random() < 0.3 else TileType.Plain
+    fields = DistanceFields(9, 7)
+    fields.update(game_map, range(game_map.size))
+    for source in range(game_map.size):
+        assert list(fields.field(source)) == bfs(game_map, source)
+
+
+def test_update_returns_cells_that_changed_passability():
+    game_map = MapState(4, 4)
+    fields = DistanceFields(4, 4)
+    game_map.types[5] = TileType.Mountain
+    game_map.types[6] = TileType.City
+    assert fields.update(game_map, [5, 6]) == [5]
+    game_map.types[5] = TileType.Plain
+    game_map.types[9] = TileType.Obstacle
+    assert sorted(fields.update(game_map, [5, 6, 9])) == [5, 9]
+
+
+def test_incremental_repair_matches_fresh_bfs():
+    rng = random.Random(5)
+    width, height = 12, 10
+    game_map = MapState(width, height)
+    fields = DistanceFields(width, height)
+    sources = rng.sample(range(width * height), 4)
+    for source in sources:
+        fields.field(source)
+    for _ in range(300):
+        dirty = []
+        for cell in rng.sample(range(width * height), rng.randint(1, 6)):
+            tile_type = rng.choice([TileType.Mountain, TileType.Obstacle, TileType.Plain, TileType.Fog, TileType.City])
+            dirty += set_type(game_map, cell, tile_type)
+        fields.update(game_map, dirty)
+        for source in sources:
+            assert list(fields.field(source)) == bfs(game_map, source)
+
+
+def test_blocked_source_is_rebuilt_once_opened():
+    game_map = MapState(5, 5)
+    fields = DistanceFields(5, 5)
+    source = game_map.index(2, 2)
+    fields.field(source)
+    fields.update(game_map, set_type(game_map, source, TileType.Mountain))
+    assert set(fields.field(source)) == {UNREACHABLE}
+    # the field cached while the source was blocked must not survive it opening
+    fields.update(game_map, set_type(game_map, source, TileType.Plain))
+    assert list(fields.field(source)) == bfs(game_map, source)
+    assert fields.distance(source, game_map.index(0, 0)) == 4
+
+
+def test_nearest_skips_unreachable_cells():
+    game_map = MapState(5, 1)
+    fields = DistanceFields(5, 1)
+    fields.update(game_map, set_type(game_map, 2, TileType.Mountain))
+    assert fields.nearest(0, [3, 4]) == -1
+    assert fields.nearest(0, [4, 1, 3]) == 1
@@ -0,0 +1,64 @@
+import random
+
+from distance_field import UNREACHABLE, DistanceFields
+from hierarchy import ClusterGraph
+from map_state import MapState, TileType
+
+
+def walled(width: int, height: int, wall_x: int) -> MapState:
+    """A map cut in two by a full column of mountains at `wall_x`."""
+    game_map = MapState(width, height)
+    for i in range(game_map.size):
+        game_map.types[i] = TileType.Plain
+    for y in range(height):
+        game_map.types[game_map.index(wall_x, y)] = TileType.Mountain
+    return game_map
+
+
+def graph_of(game_map: MapState, size: int = 4) -> ClusterGraph:
+    graph = ClusterGraph(game_map.width, game_map.height, size)
+    graph.update(game_map, range(game_map.size))
+    return graph
+
+
+def test_walled_off_components_have_no_route():
+    game_map = walled(12, 8, 5)
+    graph = graph_of(game_map)
+    start = game_map.index(1, 1)
+    goal = game_map.index(10, 6)
+    assert graph.route(start, goal) is None
+    assert graph.corridor(start, goal) is None
+    assert graph.path(start, goal) == []
+    # a wall inside one cluster splits it into two components
+    assert graph.path(game_map.index(4, 0), game_map.index(6, 0)) == []
+
+
+def test_opening_the_wall_links_the_components():
+    game_map = walled(12, 8, 5)
+    graph = graph_of(game_map)
+    gap = game_map.index(5, 7)
+    game_map.types[gap] = TileType.Plain
+    graph.update(game_map, [gap])
+    cells = graph.path(game_map.index(1, 1), game_map.index(10, 6))
+    assert cells[0] == game_map.index(1, 1) and cells[-1] == game_map.index(10, 6)
+    assert gap in cells
+    for a, b in zip(cells, cells[1:]):
+        (ax, ay), (bx, by) = game_map.position(a), game_map.position(b)
+        assert abs(ax - bx) + abs(ay - by) == 1
+        assert game_map.types[b] != TileType.Mountain
+
+
+def test_route_exists_exactly_when_cells_connect():
+    rng = random.Random(9)
+    game_map = MapState(16, 12)
+    for i in range(game_map.size):
+        game_map.types[i] = TileType.Mountain if rng.random() < 0.35 else TileType.Plain
+    graph = graph_of(game_map)
+    fields = DistanceFields(16, 12)
+    fields.update(game_map, range(game_map.size))
+    for _ in range(200):
+        start, goal = rng.sample(range(game_map.size), 2)
+        connected = fields.distance(start, goal) != UNREACHABLE
+        assert (graph.route(start, goal) is not None) == connected
+        cells = graph.path(start, goal, margin=16)
+        assert (len(cells) - 1 if cells else UNREACHABLE) == fields.distance(start, goal)
@@ -0,0 +1,97 @@
+import random
+
+from map_state import NO_OWNER, MapState, TileType, decode_diff
+
+
+def naive_decode(map_diff):
+    """Walk the diff one element at a time, the way the server builds it."""
+    cells = []
+    tiles = []
+    cursor = 0
+    for diff in map_diff:
+        if type(diff) is int:
+            cursor += diff
+        else:
+            cells.append(cursor)
+            tiles.append(diff)
+            cursor += 1
+    return cells, tiles
+
+
+def random_diff(rng: random.Random, size: int):
+    map_diff = []
+    cursor = 0
+    while cursor < size:
+        if rng.random() < 0.4:
+            skip = rng.randint(1, 5)
+            map_diff.append(skip)
+            cursor += skip
+        else:
+            tile_type = rng.choice([TileType.Plain, TileType.City, TileType.Mountain, TileType.Fog, TileType.King])
+            color = rng.choice([None, 0, 1])
+            army = rng.choice([None, 0, 1, 40])
+            map_diff.append([tile_type, color, army])
+            cursor += 1
+    # the server never ends a diff past the last cell
+    while map_diff and cursor > size:
+        last = map_diff.pop()
+        cursor -= last if type(last) is int else 1
+    return map_diff
+
+
+def test_decode_diff_skips_and_tiles():
+    plain = [TileType.Plain, None, 0]
+    king = [TileType.King, 1, 5]
+    cells, tiles = decode_diff([2, plain, 3, king, plain])
+    assert list(cells) == [2, 6, 7]
+    assert tiles == [plain, king, plain]
+
+
+def test_decode_diff_empty_and_skip_only():
+    cells, tiles = decode_diff([])
+    assert list(cells) == [] and tiles == []
+    cells, tiles = decode_diff([400])
+    assert list(cells) == [] and tiles == []
+
+
+def test_decode_diff_matches_naive_walk():
+    rng = random.Random(7)
+    for _ in range(200):
+        map_diff = random_diff(rng, 64)
+        cells, tiles = decode_diff(map_diff)
+        assert (list(cells), tiles) == naive_decode(map_diff)
+
+
+def test_apply_diff_writes_tiles_and_normalizes_nulls():
+    game_map = MapState(3, 4)
+    dirty = game_map.apply_diff([1, [TileType.King, 2, 7], 4, [TileType.Mountain, None, None]])
+    assert list(dirty) == [1, 6]
+    assert game_map.tile(0, 1) == (TileType.King, 2, 7)
+    assert game_map.owners[6] == NO_OWNER
+    assert game_map.armies[6] == 0
+    assert game_map.tile(*game_map.position(6)) == (TileType.Mountain, None, 0)
+
+
+def test_apply_diff_reports_only_changed_cells():
+    game_map = MapState(2, 3)
+    # the first update lists every cell, most of them the fog the map starts with
+    fog = [TileType.Fog, None, None]
+    dirty = game_map.apply_diff([fog, fog, [TileType.Plain, 0, 3], fog, fog, fog])
+    assert list(dirty) == [2]
+    dirty = game_map.apply_diff([2, [TileType.Plain, 0, 3], 1, [TileType.Plain, 0, 1]])
+    assert list(dirty) == [4]
+
+
+def test_apply_diff_sequence_matches_full_rebuild():
+    rng = random.Random(11)
+    width, height = 6, 5
+    game_map = MapState(width, height)
+    grid = [(TileType.Fog, None, 0)] * (width * height)
+    for _ in range(100):
+        map_diff = random_diff(rng, width * height)
+        before = list(grid)
+        for i, (tile_type, color, army) in zip(*naive_decode(map_diff)):
+            grid[i] = (tile_type, color, army or 0)
+        dirty = game_map.apply_diff(map_diff)
+        assert sorted(dirty) == [i for i in range(width * height) if grid[i] != before[i]]
+        assert [game_map.tile(*game_map.position(i)) for i in range(width * height)] == grid
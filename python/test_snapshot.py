@@ -0,0 +1,114 @@
+import random
+
+from fog_memory import FogMemory
+from map_state import MapState, TileType
+from snapshot import HEADER, SLOT, SnapshotWriter, read_snapshot
+
+COLUMNS = ("types", "owners", "armies")
+MEMORY_COLUMNS = ("seen_turn", "seen_type", "seen_owner", "seen_army", "visible", "viewed")
+
+
+def play(rng: random.Random, game_map: MapState, memory: FogMemory, turn: int) -> list:
+    """Reveal and change a few random cells, the way an update does."""
+    map_diff = []
+    cursor = 0
+    for cell in sorted(rng.sample(range(game_map.size), 6)):
+        if cell > cursor:
+            map_diff.append(cell - cursor)
+        tile_type = rng.choice([TileType.Plain, TileType.City, TileType.Mountain, TileType.King])
+        map_diff.append([tile_type, rng.choice([None, 0, 1]), rng.randint(0, 50)])
+        cursor = cell + 1
+    dirty = game_map.apply_diff(map_diff)
+    memory.update(game_map, dirty, turn)
+    return list(dirty)
+
+
+def assert_same(snapshot, game_map: MapState, memory: FogMemory):
+    for name in COLUMNS:
+        assert list(getattr(snapshot.game_map, name)) == list(getattr(game_map, name)), name
+    for name in MEMORY_COLUMNS:
+        assert list(getattr(snapshot.memory, name)) == list(getattr(memory, name)), name
+    assert snapshot.memory.turn == memory.turn
+    assert snapshot.memory.generals == memory.generals
+    assert snapshot.memory.cities == memory.cities
+    assert snapshot.memory.by_owner == {owner: cells for owner, cells in memory.by_owner.items() if cells}
+
+
+def test_no_snapshot(tmp_path):
+    assert read_snapshot(str(tmp_path / "missing.gsnap")) is None
+    path = tmp_path / "junk.gsnap"
+    path.write_bytes(b"not a snapshot")
+    assert read_snapshot(str(path)) is None
+    SnapshotWriter(str(tmp_path / "blank.gsnap"), 4, 4).close()
+    assert read_snapshot(str(tmp_path / "blank.gsnap")) is None
+
+
+def test_marked_cells_match_live_state(tmp_path):
+    rng = random.Random(2)
+    path = str(tmp_path / "bot.gsnap")
+    game_map = MapState(8, 6)
+    memory = FogMemory(8, 6)
+    writer = SnapshotWriter(path, 8, 6)
+    for turn in range(1, 40):
+        writer.mark(play(rng, game_map, memory, turn))
+        assert writer.save(turn, game_map, memory, {"turn": turn})
+        snapshot = read_snapshot(path)
+        assert snapshot.turn == turn
+        assert snapshot.meta == {"turn": turn}
+        assert_same(snapshot, game_map, memory)
+    writer.close(remove=True)
+
+
+def test_torn_slot_falls_back_a_turn(tmp_path):
+    rng = random.Random(4)
+    path = str(tmp_path / "bot.gsnap")
+    game_map = MapState(5, 5)
+    memory = FogMemory(5, 5)
+    writer = SnapshotWriter(path, 5, 5)
+    writer.mark(play(rng, game_map, memory, 1))
+    writer.save(1, game_map, memory, {"turn": 1})
+    writer.mark(play(rng, game_map, memory, 2))
+    writer.save(2, game_map, memory, {"turn": 2})
+    # a process killed while writing turn 2 leaves its slot with `end` behind `begin`
+    base = HEADER.size + (1 - writer.slot) * writer.slot_size
+    begin, _, turn, meta_length = SLOT.unpack_from(writer.data, base)
+    SLOT.pack_into(writer.data, base, begin, begin - 1, turn, meta_length)
+    writer.close()
+    snapshot = read_snapshot(path)
+    assert snapshot.turn == 1
+    assert snapshot.meta == {"turn": 1}
+
+
+def test_reopened_writer_keeps_newest_snapshot(tmp_path):
+    rng = random.Random(6)
+    path = str(tmp_path / "bot.gsnap")
+    game_map = MapState(6, 6)
+    memory = FogMemory(6, 6)
+    writer = SnapshotWriter(path, 6, 6)
+    for turn in range(1, 4):
+        writer.mark(play(rng, game_map, memory, turn))
+        writer.save(turn, game_map, memory, {})
+    writer.close()
+    resumed = read_snapshot(path)
+    writer = SnapshotWriter(path, 6, 6)
+    assert read_snapshot(path).turn == 3
+    game_map, memory = resumed.game_map, resumed.memory
+    for turn in range(4, 12):
+        writer.mark(play(rng, game_map, memory, turn))
+        writer.save(turn, game_map, memory, {})
+        assert_same(read_snapshot(path), game_map, memory)
+    writer.close()
+    # a fresh writer starts a new game over the old file
+    SnapshotWriter(path, 6, 6, fresh=True).close()
+    assert read_snapshot(path) is None
+
+
+def test_oversized_meta_is_refused(tmp_path):
+    path = str(tmp_path / "bot.gsnap")
+    game_map = MapState(3, 3)
+    memory = FogMemory(3, 3)
+    writer = SnapshotWriter(path, 3, 3, meta_bytes=256)
+    assert writer.save(1, game_map, memory, {"moves": []})
+    assert not writer.save(2, game_map, memory, {"moves": list(range(200))})
+    writer.close()
+    assert read_snapshot(path).turn == 1
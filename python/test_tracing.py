@@ -0,0 +1,51 @@
+import tracemalloc
+
+from tracing import Tracer
+
+
+def test_spans_aggregate_per_stack():
+    tracer = Tracer(enabled=True)
+    tracer.begin_turn(1)
+    with tracer.span("plan_move"):
+        with tracer.span("gather_armies"):
+            tracer.count("gather_armies.nodes", 5)
+    tracer.end_turn()
+    summary = tracer.summary()
+    assert summary["turns"] == 1
+    assert set(summary["phases"]) == {"turn;plan_move", "turn;plan_move;gather_armies"}
+    assert summary["counters"] == {"gather_armies.nodes": 5}
+    assert set(tracer.turns[0]["phases"]) == {"plan_move", "gather_armies"}
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = Tracer()
+    tracer.begin_turn(1)
+    with tracer.span("plan_move"):
+        tracer.count("nodes")
+    tracer.end_turn()
+    assert tracer.turns == [] and tracer.phases == {} and tracer.counters == {}
+
+
+def test_memory_counts_what_a_turn_frees_again():
+    tracing = tracemalloc.is_tracing()
+    tracer = Tracer(enabled=True, memory=True)
+    try:
+        tracer.begin_turn(1)
+        with tracer.span("churn"):
+            scratch = bytearray(1 << 20)
+            del scratch
+        tracer.end_turn()
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+    turn = tracer.turns[0]
+    assert turn["peak_kb"] >= 1024
+    assert turn["alloc_kb"] < 64
+
+
+def test_memory_is_off_by_default():
+    tracer = Tracer(enabled=True)
+    tracer.begin_turn(1)
+    tracer.end_turn()
+    assert "net_blocks" in tracer.turns[0]
+    assert "peak_kb" not in tracer.turns[0] and "alloc_kb" not in tracer.turns[0]
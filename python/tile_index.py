@@ -0,0 +1,71 @@
+from array import array
+from typing import Dict, Iterable, Set, Union
+
+from map_state import NO_OWNER, MapState
+from pathfinding import MOVE_BLOCKED, neighbor_table
+
+
+class TileIndex:
+    """Who owns what, kept current from each update's dirty cells.
+
+    `owned[c]` holds the cells of color c. For our own `color`, `movable`
+    holds our cells with more than one army, and `frontier` the passable
+    cells we don't own that touch one of ours. An update costs a few set
+    operations per dirty cell, so strategies can walk or sample these sets
+    instead of scanning the board.
+    """
+
+    def __init__(self, width: int, height: int, color: Union[int, None], neighbors: Union[array, None] = None):
+        self.size = width * height
+        self.color = color
+        self.neighbors = neighbors or neighbor_table(width, height)
+        # the owner each cell is currently filed under
+        self.owner_of = array("h", [NO_OWNER]) * self.size
+        self.owned: Dict[int, Set[int]] = {}
+        self.movable: Set[int] = set()
+        self.frontier: Set[int] = set()
+
+    def lands(self, color: int) -> Set[int]:
+        return self.owned.setdefault(color, set())
+
+    def update(self, game_map: MapState, cells: Iterable[int]):
+        owners = game_map.owners
+        armies = game_map.armies
+        neighbors = self.neighbors
+        owner_of = self.owner_of
+        movable = self.movable
+        color = self.color
+        # cells whose frontier membership may have changed
+        touched = set()
+        for i in cells:
+            owner = owners[i]
+            old = owner_of[i]
+            if owner != old:
+                if old != NO_OWNER:
+                    self.owned[old].discard(i)
+                if owner != NO_OWNER:
+                    self.lands(owner).add(i)
+                owner_of[i] = owner
+                if owner == color or old == color:
+                    touched.update(neighbors[i * 4:i * 4 + 4])
+            touched.add(i)
+            if owner == color and armies[i] > 1:
+                movable.add(i)
+            else:
+                movable.discard(i)
+        touched.discard(-1)
+        self.refresh_frontier(game_map, touched)
+
+    def refresh_frontier(self, game_map: MapState, cells: Iterable[int]):
+        owners = game_map.owners
+        types = game_map.types
+        neighbors = self.neighbors
+        frontier = self.frontier
+        color = self.color
+        for b in cells:
+            if owners[b] != color and not MOVE_BLOCKED[types[b]] and any(
+                n >= 0 and owners[n] == color for n in neighbors[b * 4:b * 4 + 4]
+            ):
+                frontier.add(b)
+            else:
+                frontier.discard(b)
@@ -0,0 +1,222 @@
+"""Play many bot-vs-bot games on the local simulator across all cores.
+
+    python tournament.py --bots app,random,beam --games 200 --out results.jsonl
+    python tournament.py --bots app,app:use_beam=false --games 500 --size 30
+
+Every pair of entrants plays `--games` games; each seeded map is played
+twice, once from each seat. An entrant is a bot kind from `bots.BOTS`,
+optionally followed by `:attribute=value` settings applied to its GBot
+before the game starts (values are read as JSON, so `false`, `0.05`, ...),
+which is how two variants of one strategy are pitted against each other.
+
+Games run in a process pool. Each result is appended to `--out` as a
+JSON line as soon as its game ends, so a long run can be watched or cut
+short. At the end the runner prints, per entrant, the win rate, an Elo
+rating fitted to all the results, and the percentiles of the time its
+`game_update` handler took (patching the map and choosing a move), along
+with games/s over the whole run.
+"""
+import argparse
+import json
+import math
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import combinations
+from typing import Dict, List, NamedTuple, Tuple, Union
+
+from bots import BOTS
+from latency import format_summary, summarize
+from simulator import LocalClient, LocalServer, attach_bot
+
+ELO_BASE = 1500
+# virtual draws against every opponent, so unbeaten entrants get a finite rating
+ELO_PRIOR = 0.5
+
+
+class GameSpec(NamedTuple):
+    game: int
+    entrants: Tuple[str, ...]
+    seed: int
+    width: int
+    height: int
+    mountain: float
+    city: float
+    max_turns: int
+
+
+class TimedClient(LocalClient):
+    """LocalClient that times the bot's handler for every `game_update`."""
+
+    def __init__(self, server: LocalServer):
+        super().__init__(server)
+        self.samples = array("d")
+
+    def trigger(self, event: str, args: tuple):
+        if event != "game_update":
+            super().trigger(event, args)
+            return
+        start = time.perf_counter()
+        super().trigger(event, args)
+        self.samples.append((time.perf_counter() - start) * 1000)
+
+
+def parse_entrant(entrant: str) -> Tuple[str, Dict[str, object]]:
+    """`kind:attr=value:...` into the bot kind and its settings."""
+    kind, *settings = entrant.split(":")
+    if kind not in BOTS:
+        raise ValueError(f"unknown bot {kind}, expected one of {', '.join(BOTS)}")
+    options = {}
+    for setting in settings:
+        name, _, value = setting.partition("=")
+        try:
+            options[name] = json.loads(value)
+        except ValueError:
+            options[name] = value
+    return kind, options
+
+
+def play_game(spec: GameSpec) -> dict:
+    start = time.perf_counter()
+    server = LocalServer(spec.width, spec.height, spec.mountain, spec.city, max_turns=spec.max_turns, seed=spec.seed)
+    clients = []
+    for seat, entrant in enumerate(spec.entrants):
+        kind, options = parse_entrant(entrant)
+        client = TimedClient(server)
+        bot = attach_bot(server, kind, f"{kind}{seat}", client=client)
+        for name, value in options.items():
+            setattr(bot.gbot, name, value)
+        clients.append(client)
+    winner = server.run()
+    return {
+        "game": spec.game,
+        "seed": spec.seed,
+        "entrants": list(spec.entrants),
+        "winner": server.players.index(winner) if winner else None,
+        "turns": server.turn,
+        # the turn limit ran out, the winner is the larger army
+        "timeout": server.turn >= spec.max_turns,
+        "seconds": time.perf_counter() - start,
+        "latency": [client.samples for client in clients],
+    }
+
+
+def schedule(entrants: List[str], games: int, seed: int, **board) -> List[GameSpec]:
+    specs = []
+    for a, b in combinations(entrants, 2):
+        for i in range(games):
+            seats = (a, b) if i % 2 == 0 else (b, a)
+            specs.append(GameSpec(len(specs), seats, seed + i // 2, **board))
+    return specs
+
+
+def fit_elo(results: List[dict], iterations: int = 200) -> Dict[str, float]:
+    """Elo-scale ratings that best explain every result at once (Bradley-Terry)."""
+    wins: Dict[str, float] = {}
+    played: Dict[Tuple[str, str], float] = {}
+    for result in results:
+        if result["winner"] is None:
+            continue
+        a, b = result["entrants"]
+        winner = result["entrants"][result["winner"]]
+        wins[winner] = wins.get(winner, 0.0) + 1
+        for pair in ((a, b), (b, a)):
+            played[pair] = played.get(pair, 0.0) + 1
+    names = sorted({name for pair in played for name in pair})
+    for a, b in list(played):
+        played[a, b] += 2 * ELO_PRIOR
+    strength = {name: 1.0 for name in names}
+    for _ in range(iterations):
+        for name in names:
+            score = wins.get(name, 0.0) + ELO_PRIOR * sum(1 for a, _ in played if a == name)
+            expected = sum(n / (strength[a] + strength[b]) for (a, b), n in played.items() if a == name)
+            strength[name] = score / expected if expected else 1.0
+        mean = sum(math.log(s) for s in strength.values()) / len(strength)
+        strength = {name: s / math.exp(mean) for name, s in strength.items()}
+    return {name: ELO_BASE + 400 * math.log10(s) for name, s in strength.items()}
+
+
+def run(specs: List[GameSpec], out: Union[str, None], workers: Union[int, None]) -> Tuple[List[dict], Dict[str, array], float]:
+    """Play `specs` over the pool; returns the results, per-entrant latency samples and the wall time."""
+    results = []
+    latency: Dict[str, array] = {}
+    start = time.perf_counter()
+    sink = open(out, "w") if out else None
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(play_game, spec) for spec in specs]
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # a bot that raises ends its game, not the tournament
+                    print(f"game failed: {type(e).__name__}: {e}")
+                    continue
+                for entrant, samples in zip(result["entrants"], result.pop("latency")):
+                    latency.setdefault(entrant, array("d")).extend(samples)
+                results.append(result)
+                if sink:
+                    sink.write(json.dumps(result) + "\n")
+                    sink.flush()
+                if len(results) % 50 == 0:
+                    print(f"{len(results)}/{len(specs)} games, {len(results) / (time.perf_counter() - start):.1f} games/s")
+    finally:
+        if sink:
+            sink.close()
+    return results, latency, time.perf_counter() - start
+
+
+def standings(results: List[dict]) -> Dict[str, Dict[str, int]]:
+    table: Dict[str, Dict[str, int]] = {}
+    for result in results:
+        for seat, entrant in enumerate(result["entrants"]):
+            row = table.setdefault(entrant, {"games": 0, "wins": 0, "timeouts": 0})
+            row["games"] += 1
+            row["wins"] += result["winner"] == seat
+            row["timeouts"] += result["timeout"]
+    return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play a round-robin of local bot-vs-bot games over a process pool")
+    parser.add_argument("--bots", type=str, default="app,random", help="comma separated entrants, kind[:attr=value...]")
+    parser.add_argument("--games", type=int, default=100, help="games per pair of entrants")
+    parser.add_argument("--size", type=int, default=20, help="map width and height")
+    parser.add_argument("--mountain", type=float, default=0.5)
+    parser.add_argument("--city", type=float, default=0.5)
+    parser.add_argument("--turns", type=int, default=500, help="max turns per game")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first map")
+    parser.add_argument("--workers", type=int, default=None, help="processes, defaults to one per CPU")
+    parser.add_argument("--out", type=str, default=None, help="JSON lines file to stream each game's result to")
+    args = parser.parse_args()
+
+    entrants = args.bots.split(",")
+    for entrant in entrants:
+        try:
+            parse_entrant(entrant)
+        except ValueError as e:
+            parser.error(str(e))
+    if len(set(entrants)) < 2:
+        parser.error("need at least two different entrants")
+    specs = schedule(
+        entrants,
+        args.games,
+        args.seed,
+        width=args.size,
+        height=args.size,
+        mountain=args.mountain,
+        city=args.city,
+        max_turns=args.turns,
+    )
+    results, latency, elapsed = run(specs, args.out, args.workers)
+    turns = sum(result["turns"] for result in results)
+    print(f"{len(results)} games in {elapsed:.1f}s: {len(results) / elapsed:.2f} games/s, {turns / elapsed:.0f} turns/s")
+    elo = fit_elo(results)
+    table = standings(results)
+    for entrant in sorted(table, key=lambda e: elo.get(e, ELO_BASE), reverse=True):
+        row = table[entrant]
+        print(
+            f"{entrant}: elo {elo.get(entrant, ELO_BASE):.0f} won {row['wins']}/{row['games']} "
+            f"({row['wins'] / row['games']:.1%}, {row['timeouts']} on the turn limit)"
+        )
+        print(f"  turn latency {format_summary(summarize(latency.get(entrant, ())))}")
@@ -0,0 +1,179 @@
+"""Per-turn phase timings and counters for a bot, off unless switched on.
+
+    tracer = Tracer(enabled=True)
+    tracer.begin_turn(12)
+    with tracer.span("plan_move"):
+        with tracer.span("gather_armies"):
+            tracer.count("gather_armies.nodes", 420)
+    tracer.end_turn()
+    tracer.dump("trace.json", "trace.folded")
+
+Spans nest, and time is aggregated per stack of span names over the game.
+A turn lasts until the next `begin_turn` (or `end_turn`), and its time is
+the time spent in its outermost spans, so waiting for the server between
+turns does not count.
+`dump` writes the aggregate and every turn as JSON (each turn with
+`net_blocks`, the change in memory blocks held over it), plus the self time of
+each stack in the collapsed format flamegraph tools read
+(`flamegraph.pl trace.folded > trace.svg`, speedscope, ...). While
+`enabled` is False, `span` hands back one shared no-op context manager.
+
+`net_blocks` misses memory a turn allocates and frees again. With `memory`
+on, each turn also gets `peak_kb`, how far the memory tracemalloc traces
+rose above its level at the start of the turn, which counts those
+allocations too, and `alloc_kb`, what the turn left allocated. tracemalloc
+slows every allocation down, so it is off unless asked for, and the
+phase times of a traced turn run slower than untraced ones.
+"""
+import functools
+import json
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Union
+
+ROOT = "turn"
+
+
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+    __slots__ = ("tracer", "name", "start", "children")
+
+    def __init__(self, tracer: "Tracer", name: str):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.tracer.stack.append(self)
+        self.children = 0.0
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        tracer = self.tracer
+        tracer.stack.pop()
+        if tracer.stack:
+            tracer.stack[-1].children += elapsed
+        else:
+            tracer.turn_top += elapsed
+        key = ";".join([ROOT] + [span.name for span in tracer.stack] + [self.name])
+        phase = tracer.phases.get(key)
+        if phase is None:
+            phase = tracer.phases[key] = [0, 0.0, 0.0, 0.0]  # calls, total, self, max
+        phase[0] += 1
+        phase[1] += elapsed
+        phase[2] += elapsed - self.children
+        phase[3] = max(phase[3], elapsed)
+        turn_phases = tracer.turn_phases
+        turn_phases[self.name] = turn_phases.get(self.name, 0.0) + elapsed
+        return False
+
+
+class Tracer:
+    def __init__(self, enabled: bool = False, memory: bool = False):
+        self.enabled = enabled
+        self.memory = memory
+        self.stack: List[Span] = []
+        self.phases: Dict[str, list] = {}
+        self.counters: Dict[str, int] = {}
+        self.turns: List[dict] = []
+        self.turn: Union[int, None] = None
+        self.turn_top = 0.0  # time in spans opened outside any other span
+        self.turn_blocks = 0
+        self.turn_bytes = 0  # traced memory at the start of the turn
+        self.turn_phases: Dict[str, float] = {}
+        self.turn_counters: Dict[str, int] = {}
+
+    def span(self, name: str):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name)
+
+    def count(self, name: str, n: int = 1):
+        if not self.enabled:
+            return
+        self.counters[name] = self.counters.get(name, 0) + n
+        self.turn_counters[name] = self.turn_counters.get(name, 0) + n
+
+    def begin_turn(self, turn: int):
+        if not self.enabled:
+            return
+        if self.turn is not None:
+            self.end_turn()
+        self.turn = turn
+        self.turn_top = 0.0
+        self.turn_blocks = sys.getallocatedblocks()
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            self.turn_bytes = tracemalloc.get_traced_memory()[0]
+        self.turn_phases = {}
+        self.turn_counters = {}
+
+    def end_turn(self):
+        if not self.enabled or self.turn is None:
+            return
+        turn = {
+            "turn": self.turn,
+            "ms": self.turn_top * 1000,
+            # blocks the interpreter holds after the turn minus before it (sys.getallocatedblocks),
+            # not how many allocations the turn made: what it freed cancels what it allocated
+            "net_blocks": sys.getallocatedblocks() - self.turn_blocks,
+            "phases": {name: t * 1000 for name, t in self.turn_phases.items()},
+            "counters": self.turn_counters,
+        }
+        if self.memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            turn["alloc_kb"] = (current - self.turn_bytes) / 1024
+            turn["peak_kb"] = (peak - self.turn_bytes) / 1024
+        self.turns.append(turn)
+        self.turn = None
+
+    def summary(self) -> dict:
+        return {
+            "turns": len(self.turns),
+            "ms": sum(turn["ms"] for turn in self.turns),
+            "phases": {
+                key: {"calls": calls, "total_ms": total * 1000, "self_ms": own * 1000, "max_ms": longest * 1000}
+                for key, (calls, total, own, longest) in sorted(self.phases.items())
+            },
+            "counters": dict(sorted(self.counters.items())),
+        }
+
+    def collapsed(self) -> List[str]:
+        """One `stack;of;spans microseconds` line per stack, by self time."""
+        return [f"{key} {round(own * 1e6)}" for key, (_, _, own, _) in sorted(self.phases.items()) if own > 0]
+
+    def dump(self, json_path: str, folded_path: Union[str, None] = None):
+        with open(json_path, "w") as f:
+            json.dump({**self.summary(), "per_turn": self.turns}, f, separators=(",", ":"))
+        if folded_path:
+            with open(folded_path, "w") as f:
+                f.write("\n".join(self.collapsed()) + "\n")
+
+
+def traced(fn: Callable) -> Callable:
+    """Time `fn` as a span of the tracer carried by its last argument (a bot)."""
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args):
+        tracer = args[-1].tracer
+        if not tracer.enabled:
+            return fn(*args)
+        with Span(tracer, name):
+            return fn(*args)
+
+    return wrapper
@@ -1,7 +1,20 @@
+"""Convert custom maps saved as HTML tables to CustomMapData JSON.
+
+    python map_converter.py map.html map.json
+    python map_converter.py maps/ "more/**/*.html" --out-dir json/ --workers 8
+
+With `--out-dir`, every `.html`/`.htm` file under the given directories and
+globs is converted over a process pool, keeping the directory layout, and
+the run ends with a maps/s summary.
+"""
 import argparse
+import glob
 import json
-from bs4 import BeautifulSoup
-from typing import List, Tuple
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from typing import List, Tuple, Union
 from enum import Enum
 
 
@@ -45,7 +58,37 @@ class CustomMapData:
         self.mapTilesData = mapTilesData
 
 
+def tile_data(classes: List[str], text: str, is_always_revealed: bool) -> CustomMapTileData:
+    color_index = None
+    tile_type = TileType.Plain
+    units_count = 0
+    king_priority = 0
+
+    if text.isdigit():
+        units_count = int(text.strip())
+
+    if "swamp" in classes:
+        tile_type = TileType.Swamp
+    elif "city" in classes:
+        tile_type = TileType.City
+    elif "mountain" in classes:
+        tile_type = TileType.Mountain
+    elif "king" in classes:
+        tile_type = TileType.King
+        color_index = 0
+    return [
+        tile_type.value,
+        color_index,
+        units_count,
+        is_always_revealed,
+        king_priority,
+    ]
+
+
 def convert_html_to_2d_array(html: str) -> List[List[CustomMapTileData]]:
+    """Tiles of the map's `<table>`, through BeautifulSoup's parse tree."""
+    from bs4 import BeautifulSoup
+
     soup = BeautifulSoup(html, "html.parser")
     rows = soup.find_all("tr")
     result = []
@@ -53,46 +96,75 @@ def convert_html_to_2d_array(html: str) -> List[List[CustomMapTileData]]:
         cells = row.find_all("td")
         row_data = []
         for cell in cells:
-            color_index = None
-            tile_type = TileType.Plain
-            units_count = 0
-            king_priority = 0
-            classes = cell["class"]
-
             is_always_revealed = True if cell.find("img", {"alt": "light"}) else False
-
-            if cell.text.isdigit():
-                units_count = int(cell.text.strip())
-
-            if "swamp" in classes:
-                tile_type = TileType.Swamp
-            elif "city" in classes:
-                tile_type = TileType.City
-            elif "mountain" in classes:
-                tile_type = TileType.Mountain
-            elif "king" in classes:
-                tile_type = TileType.King
-                color_index = 0
-            row_data.append(
-                [
-                    tile_type.value,
-                    color_index,
-                    units_count,
-                    is_always_revealed,
-                    king_priority,
-                ]
-            )
+            row_data.append(tile_data(cell["class"], cell.text, is_always_revealed))
         result.append(row_data)
     return result
 
 
-def convert_to_custom_map_data(html_path: str, json_path: str):
+class TileParser(HTMLParser):
+    """Turns each `<td>` into a tile as soon as it closes, without building a tree."""
+
+    def __init__(self):
+        super().__init__()
+        self.rows: List[List[CustomMapTileData]] = []
+        self.row: Union[List[CustomMapTileData], None] = None
+        self.classes: Union[List[str], None] = None  # of the open <td>
+        self.text: List[str] = []
+        self.light = False
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Union[str, None]]]):
+        if tag == "td":
+            # a new cell closes one left open
+            self.close_cell()
+            if self.row is not None:
+                self.classes = next((value or "" for name, value in attrs if name == "class"), "").split()
+                self.text = []
+                self.light = False
+        elif tag == "tr":
+            self.close_cell()
+            self.row = []
+            self.rows.append(self.row)
+        elif tag == "img" and self.classes is not None and ("alt", "light") in attrs:
+            self.light = True
+
+    def handle_endtag(self, tag: str):
+        if tag == "td":
+            self.close_cell()
+        elif tag == "tr":
+            self.close_cell()
+            self.row = None
+
+    def handle_data(self, data: str):
+        if self.classes is not None:
+            self.text.append(data)
+
+    def close_cell(self):
+        if self.classes is None:
+            return
+        self.row.append(tile_data(self.classes, "".join(self.text), self.light))
+        self.classes = None
+
+
+def parse_tiles(html: str) -> List[List[CustomMapTileData]]:
+    """Tiles of the map's `<table>`, read in one streaming pass over the HTML."""
+    parser = TileParser()
+    parser.feed(html)
+    parser.close()
+    parser.close_cell()
+    return parser.rows
+
+
+def convert_to_custom_map_data(html_path: str, json_path: str, indent: Union[int, None] = None, soup: bool = False) -> int:
+    """Convert one HTML map to a JSON file; returns the number of tiles."""
     with open(html_path, "r") as f:
         html = f.read()
-    map_tiles_data = convert_html_to_2d_array(html)
+    map_tiles_data = convert_html_to_2d_array(html) if soup else parse_tiles(html)
+    # the file name is the only identity an exported map has
+    map_id = os.path.splitext(os.path.basename(html_path))[0]
     custom_map_data = CustomMapData(
-        "id",
-        "name",
+        map_id,
+        map_id,
         len(map_tiles_data[0]),
         len(map_tiles_data),
         "creator",
@@ -101,14 +173,108 @@ def convert_to_custom_map_data(html_path: str, json_path: str):
     )
 
     with open(json_path, "w") as f:
-        json.dump(custom_map_data.__dict__, f, indent=4)
+        json.dump(custom_map_data.__dict__, f, indent=indent, separators=None if indent else (",", ":"))
+    return sum(len(row) for row in map_tiles_data)
+
+
+def glob_root(pattern: str) -> str:
+    """The directories a glob starts with, before its first wildcard."""
+    parts = pattern.split(os.sep)
+    fixed = []
+    for part in parts[:-1]:
+        if any(c in part for c in "*?["):
+            break
+        fixed.append(part)
+    return os.sep.join(fixed) or ("/" if pattern.startswith(os.sep) else ".")
+
+
+def find_maps(paths: List[str], extensions: Tuple[str, ...] = (".html", ".htm")) -> List[Tuple[str, str]]:
+    """(file, path relative to the output directory) of every map under `paths`.
+
+    Each path is a file, a directory searched recursively for files ending
+    in one of `extensions`, or a glob pattern. A match of a glob keeps its
+    path below the glob's directories, so `maps/*/map.html` finds
+    `a/map.html` and `b/map.html`.
+    """
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    if name.endswith(extensions):
+                        file = os.path.join(root, name)
+                        found.append((file, os.path.relpath(file, path)))
+        elif os.path.isfile(path):
+            found.append((path, os.path.basename(path)))
+        else:
+            root = glob_root(path)
+            found.extend((file, os.path.relpath(file, root)) for file in sorted(glob.glob(path, recursive=True)) if os.path.isfile(file))
+    return found
+
+
+def convert_one(job: Tuple[str, str, Union[int, None], bool]) -> Tuple[str, int, Union[str, None]]:
+    html_path, json_path, indent, soup = job
+    try:
+        os.makedirs(os.path.dirname(json_path) or ".", exist_ok=True)
+        return html_path, convert_to_custom_map_data(html_path, json_path, indent, soup), None
+    except Exception as e:
+        return html_path, 0, f"{type(e).__name__}: {e}"
+
+
+def convert_batch(
+    paths: List[str], out_dir: str, workers: Union[int, None] = None, indent: Union[int, None] = None, soup: bool = False
+) -> dict:
+    """Convert every map under `paths` into `out_dir`, spread over a process pool."""
+    jobs = [
+        (html_path, os.path.join(out_dir, os.path.splitext(relative)[0] + ".json"), indent, soup)
+        for html_path, relative in find_maps(paths)
+    ]
+    outputs = {}
+    for html_path, json_path, _, _ in jobs:
+        if json_path in outputs:
+            raise ValueError(f"{outputs[json_path]} and {html_path} would both be written to {json_path}")
+        outputs[json_path] = html_path
+    workers = workers or os.cpu_count() or 1
+    # a map is small, so hand them out in chunks to keep the pool busy
+    chunksize = max(len(jobs) // (4 * workers), 1)
+    start = time.perf_counter()
+    converted = tiles = 0
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for html_path, count, error in pool.map(convert_one, jobs, chunksize=chunksize):
+            if error:
+                failed.append(html_path)
+                print(f"{html_path}: {error}")
+            else:
+                converted += 1
+                tiles += count
+    elapsed = time.perf_counter() - start
+    return {
+        "maps": converted,
+        "failed": len(failed),
+        "tiles": tiles,
+        "seconds": elapsed,
+        "maps_per_sec": converted / elapsed if elapsed else 0.0,
+    }
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Convert HTML data to CustomMapData object and store it in a JSON file"
     )
-    parser.add_argument("html_path", type=str, help="Path to the HTML file")
-    parser.add_argument("json_path", type=str, help="Path to the JSON file")
+    parser.add_argument("paths", type=str, nargs="+", help="HTML file and JSON file, or with --out-dir any number of HTML files, directories and globs")
+    parser.add_argument("--out-dir", type=str, help="convert every map found into this directory")
+    parser.add_argument("--workers", type=int, default=None, help="processes for --out-dir, defaults to one per CPU")
+    parser.add_argument("--indent", type=int, default=None, help="pretty-print the JSON with this indent")
+    parser.add_argument("--soup", action="store_true", help="parse with BeautifulSoup instead of the streaming parser")
     args = parser.parse_args()
-    convert_to_custom_map_data(args.html_path, args.json_path)
+    if args.out_dir:
+        stats = convert_batch(args.paths, args.out_dir, args.workers, args.indent, args.soup)
+        print(
+            f"{stats['maps']} maps ({stats['tiles']} tiles) in {stats['seconds']:.2f}s, "
+            f"{stats['maps_per_sec']:.1f} maps/s, {stats['failed']} failed"
+        )
+    elif len(args.paths) == 2:
+        convert_to_custom_map_data(args.paths[0], args.paths[1], args.indent, args.soup)
+    else:
+        parser.error("expected an HTML file and a JSON file, or --out-dir")
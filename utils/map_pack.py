@@ -0,0 +1,267 @@
+"""A library of CustomMapData maps in one file, read through mmap.
+
+    python map_pack.py pack maps.gnmap json/ "more/*.json"
+    python map_pack.py unpack maps.gnmap json/
+    python map_pack.py list maps.gnmap
+
+Layout:
+
+    header  b"GNMAP\\x00\\x01\\x00"
+    map     <id> <name> <creator> <description> (utf-8), padding to 8,
+            then the tile columns, each padded to 8:
+            units i32 * n, king priority i16 * n, type i8 * n,
+            color i8 * n (-1 for none), always revealed u8 * n
+    ...
+    index   <tiles offset u64> <text offset u64> <id, name, creator length u16 * 3>
+            <description length u32> <width u16> <height u16> <2 pad> per map
+    footer  <index offset u64> <count u32> b"GNMAPIDX"
+
+n is width * height. Tiles are stored in the order of `mapTilesData`
+flattened, `height` lists of `width` tiles. Every tile takes the same
+9 bytes, split into one column per field, so `MapPack.tiles` hands out
+each field as a flat array view into the mapped file. Opening a pack
+reads only the index and the ids.
+"""
+import argparse
+import itertools
+import json
+import mmap
+import os
+import struct
+import weakref
+from typing import BinaryIO, Dict, Iterable, List, NamedTuple, Union
+
+from map_converter import CustomMapData, find_maps
+
+MAGIC = b"GNMAP\x00\x01\x00"
+INDEX_MAGIC = b"GNMAPIDX"
+ENTRY = struct.Struct("<QQHHHIHH2x")
+FOOTER = struct.Struct("<QI8s")
+NO_COLOR = -1
+
+# (field, array typecode) of the tile columns, in file order
+COLUMNS = (("units", "i"), ("priorities", "h"), ("types", "b"), ("colors", "b"), ("revealed", "B"))
+
+
+class MapTiles(NamedTuple):
+    """One array view per tile field, `height * width` long each.
+
+    Use it as a context manager, or call `release`, to let go of the views.
+    """
+
+    width: int
+    height: int
+    units: memoryview
+    priorities: memoryview
+    types: memoryview
+    colors: memoryview
+    revealed: memoryview
+
+    def release(self):
+        for column in self[2:]:
+            column.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class MapEntry(NamedTuple):
+    tiles_offset: int
+    text_offset: int
+    id_length: int
+    name_length: int
+    creator_length: int
+    description_length: int
+    width: int
+    height: int
+
+
+def pad(f: BinaryIO):
+    f.write(b"\x00" * (-f.tell() % 8))
+
+
+def write_map(f: BinaryIO, custom_map_data: CustomMapData) -> MapEntry:
+    rows = custom_map_data.mapTilesData
+    height = len(rows)
+    width = len(rows[0]) if rows else 0
+    if any(len(row) != width for row in rows):
+        raise ValueError(f"map {custom_map_data.id} is not rectangular")
+    texts = [
+        str(text).encode()
+        for text in (custom_map_data.id, custom_map_data.name, custom_map_data.creator, custom_map_data.description)
+    ]
+    text_offset = f.tell()
+    f.write(b"".join(texts))
+    pad(f)
+    tiles_offset = f.tell()
+    tiles = [tile for row in rows for tile in row]
+    columns = (
+        [tile[2] for tile in tiles],
+        [tile[4] for tile in tiles],
+        [tile[0] for tile in tiles],
+        [NO_COLOR if tile[1] is None else tile[1] for tile in tiles],
+        [1 if tile[3] else 0 for tile in tiles],
+    )
+    for (_, code), values in zip(COLUMNS, columns):
+        f.write(struct.pack(f"<{len(values)}{code}", *values))
+        pad(f)
+    return MapEntry(tiles_offset, text_offset, *(len(text) for text in texts), width, height)
+
+
+def write_pack(path: str, maps: Iterable[CustomMapData]) -> int:
+    """Pack `maps` into a new file at `path`; returns how many were written."""
+    entries = []
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        for custom_map_data in maps:
+            entries.append(write_map(f, custom_map_data))
+        pad(f)
+        index_offset = f.tell()
+        for entry in entries:
+            f.write(ENTRY.pack(*entry))
+        f.write(FOOTER.pack(index_offset, len(entries), INDEX_MAGIC))
+    return len(entries)
+
+
+class MapPack:
+    """Read-only, mmap-backed view of a map pack with access by position or id."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(MAGIC)] != MAGIC or len(self.data) < len(MAGIC) + FOOTER.size:
+            raise ValueError(f"{path} is not a map pack")
+        index_offset, count, magic = FOOTER.unpack_from(self.data, len(self.data) - FOOTER.size)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{path} has no index, it was not written to the end")
+        self.entries = [MapEntry(*ENTRY.unpack_from(self.data, index_offset + i * ENTRY.size)) for i in range(count)]
+        self.by_id: Dict[str, int] = {}
+        # views `tiles` handed out and not yet collected, released by `close`
+        self.views: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+        self.view_ids = itertools.count()
+        for i, entry in enumerate(self.entries):
+            self.by_id.setdefault(self.text(entry, 0), i)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def text(self, entry: MapEntry, field: int) -> str:
+        lengths = (entry.id_length, entry.name_length, entry.creator_length, entry.description_length)
+        start = entry.text_offset + sum(lengths[:field])
+        return self.data[start:start + lengths[field]].decode()
+
+    def position(self, key: Union[int, str]) -> int:
+        return self.by_id[key] if isinstance(key, str) else key
+
+    def info(self, key: Union[int, str]) -> dict:
+        """Everything about a map but its tiles."""
+        entry = self.entries[self.position(key)]
+        return {
+            "id": self.text(entry, 0),
+            "name": self.text(entry, 1),
+            "width": entry.width,
+            "height": entry.height,
+            "creator": self.text(entry, 2),
+            "description": self.text(entry, 3),
+        }
+
+    def tiles(self, key: Union[int, str]) -> MapTiles:
+        """The tile columns of a map as views into the file, nothing is copied.
+
+        `close` releases any views still held, so they must not be used after it.
+        """
+        entry = self.entries[self.position(key)]
+        n = entry.width * entry.height
+        view = memoryview(self.data)
+        pos = entry.tiles_offset
+        columns = []
+        for _, code in COLUMNS:
+            size = struct.calcsize(code) * n
+            columns.append(view[pos:pos + size].cast(code))
+            pos += size + (-size % 8)
+        for column in columns:
+            self.views[next(self.view_ids)] = column
+        view.release()
+        return MapTiles(entry.width, entry.height, *columns)
+
+    def map_data(self, key: Union[int, str]) -> CustomMapData:
+        """A map as the nested lists `map_converter` produces."""
+        info = self.info(key)
+        with self.tiles(key) as tiles:
+            flat = [
+                [tile_type, None if color == NO_COLOR else color, units, bool(revealed), priority]
+                for tile_type, color, units, revealed, priority in zip(
+                    tiles.types, tiles.colors, tiles.units, tiles.revealed, tiles.priorities
+                )
+            ]
+            width = tiles.width
+        rows = [flat[i:i + width] for i in range(0, len(flat), width)] if width else []
+        return CustomMapData(
+            info["id"], info["name"], info["width"], info["height"], info["creator"], info["description"], rows
+        )
+
+    def close(self):
+        """Close the file, releasing every tile view still held so this cannot fail."""
+        for view in list(self.views.values()):
+            view.release()
+        self.views.clear()
+        self.entries = None
+        self.data.close()
+        self.file.close()
+
+
+def load_json(path: str) -> CustomMapData:
+    with open(path) as f:
+        return CustomMapData(**json.load(f))
+
+
+def pack_json(paths: List[str], pack_path: str) -> int:
+    """Pack every JSON map under `paths` (files, directories or globs)."""
+    return write_pack(pack_path, (load_json(path) for path, _ in find_maps(paths, (".json",))))
+
+
+def unpack_json(pack_path: str, out_dir: str, indent: Union[int, None] = None) -> int:
+    """Write each map of a pack back to `<out_dir>/<position>-<id>.json`."""
+    os.makedirs(out_dir, exist_ok=True)
+    with MapPack(pack_path) as pack:
+        for i in range(len(pack)):
+            custom_map_data = pack.map_data(i)
+            name = "".join(c if c.isalnum() or c in "-_" else "_" for c in custom_map_data.id)
+            with open(os.path.join(out_dir, f"{i}-{name}.json"), "w") as f:
+                json.dump(custom_map_data.__dict__, f, indent=indent, separators=None if indent else (",", ":"))
+        return len(pack)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack CustomMapData JSON files into one memory-mapped library and back")
+    commands = parser.add_subparsers(dest="command", required=True)
+    pack_parser = commands.add_parser("pack", help="pack JSON maps")
+    pack_parser.add_argument("pack_path", type=str, help="map pack to write")
+    pack_parser.add_argument("paths", type=str, nargs="+", help="JSON files, directories and globs")
+    unpack_parser = commands.add_parser("unpack", help="write every map of a pack as JSON")
+    unpack_parser.add_argument("pack_path", type=str, help="map pack to read")
+    unpack_parser.add_argument("out_dir", type=str, help="directory for the JSON files")
+    unpack_parser.add_argument("--indent", type=int, default=None, help="pretty-print the JSON with this indent")
+    list_parser = commands.add_parser("list", help="print the index of a pack")
+    list_parser.add_argument("pack_path", type=str, help="map pack to read")
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        print(f"packed {pack_json(args.paths, args.pack_path)} maps into {args.pack_path}")
+    elif args.command == "unpack":
+        print(f"wrote {unpack_json(args.pack_path, args.out_dir, args.indent)} maps to {args.out_dir}")
+    else:
+        with MapPack(args.pack_path) as pack:
+            for i in range(len(pack)):
+                info = pack.info(i)
+                print(f"{i} {info['id']} {info['name']} {info['width']}x{info['height']}")
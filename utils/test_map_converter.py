@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+from map_converter import convert_batch, find_maps, glob_root
+
+HTML = "<table><tr><td class='king'>1</td><td></td></tr></table>"
+
+
+def write_maps(tmp_path, *names):
+    for name in names:
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(HTML)
+
+
+def test_glob_root():
+    assert glob_root(os.path.join("maps", "*", "map.html")) == "maps"
+    assert glob_root(os.path.join("maps", "a", "*.html")) == os.path.join("maps", "a")
+    assert glob_root("*.html") == "."
+    assert glob_root(os.path.join("maps", "**", "*.html")) == "maps"
+
+
+def test_glob_matches_keep_their_directories(tmp_path):
+    write_maps(tmp_path, "maps/a/map.html", "maps/b/map.html")
+    found = find_maps([str(tmp_path / "maps" / "*" / "map.html")])
+    assert [relative for _, relative in found] == [os.path.join("a", "map.html"), os.path.join("b", "map.html")]
+
+
+def test_directories_and_files(tmp_path):
+    write_maps(tmp_path, "maps/x.html", "maps/deep/y.htm", "maps/notes.txt", "z.html")
+    found = find_maps([str(tmp_path / "maps"), str(tmp_path / "z.html")])
+    assert sorted(relative for _, relative in found) == [os.path.join("deep", "y.htm"), "x.html", "z.html"]
+
+
+def test_batch_refuses_to_overwrite_a_map(tmp_path):
+    write_maps(tmp_path, "a/map.html", "b/map.html")
+    with pytest.raises(ValueError):
+        convert_batch([str(tmp_path / "a" / "map.html"), str(tmp_path / "b" / "map.html")], str(tmp_path / "out"), workers=1)
+    stats = convert_batch([str(tmp_path / "*" / "map.html")], str(tmp_path / "out"), workers=1)
+    assert stats["maps"] == 2 and stats["failed"] == 0
+    assert sorted(os.listdir(tmp_path / "out")) == ["a", "b"]
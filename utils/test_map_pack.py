@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+from map_converter import CustomMapData, TileType, convert_to_custom_map_data
+from map_pack import MapPack, pack_json, unpack_json, write_pack
+
+KING = TileType.King.value
+PLAIN = TileType.Plain.value
+MOUNTAIN = TileType.Mountain.value
+CITY = TileType.City.value
+
+
+def sample_maps():
+    return [
+        CustomMapData("rivers", "Rivers", 3, 2, "ana", "two rows", [
+            [[KING, 0, 1, False, 2], [PLAIN, None, 0, False, 0], [MOUNTAIN, None, 0, True, 0]],
+            [[CITY, None, 40, True, 0], [PLAIN, 3, 12, False, 0], [KING, 1, 1, False, 1]],
+        ]),
+        CustomMapData("é-unicode", "Pâturage", 1, 1, "", "", [[[PLAIN, None, 0, False, 0]]]),
+        CustomMapData("empty", "Empty", 0, 0, "bo", "no tiles", []),
+    ]
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "maps.gnmap")
+    maps = sample_maps()
+    assert write_pack(path, maps) == len(maps)
+    with MapPack(path) as pack:
+        assert len(pack) == len(maps)
+        for i, original in enumerate(maps):
+            assert pack.map_data(i).__dict__ == original.__dict__
+            assert pack.map_data(original.id).__dict__ == original.__dict__
+        assert pack.info("rivers") == {
+            "id": "rivers", "name": "Rivers", "width": 3, "height": 2, "creator": "ana", "description": "two rows",
+        }
+
+
+def test_tiles_are_flat_columns(tmp_path):
+    path = str(tmp_path / "maps.gnmap")
+    write_pack(path, sample_maps())
+    with MapPack(path) as pack:
+        with pack.tiles("rivers") as tiles:
+            assert (tiles.width, tiles.height) == (3, 2)
+            assert list(tiles.types) == [KING, PLAIN, MOUNTAIN, CITY, PLAIN, KING]
+            assert list(tiles.colors) == [0, -1, -1, -1, 3, 1]
+            assert list(tiles.units) == [1, 0, 0, 40, 12, 1]
+            assert list(tiles.revealed) == [0, 0, 1, 1, 0, 0]
+            assert list(tiles.priorities) == [2, 0, 0, 0, 0, 1]
+        with pytest.raises(ValueError):
+            tiles.units[0]
+
+
+def test_close_releases_held_views(tmp_path):
+    path = str(tmp_path / "maps.gnmap")
+    write_pack(path, sample_maps())
+    pack = MapPack(path)
+    held = pack.tiles("rivers")
+    pack.tiles(1)
+    pack.close()
+    assert pack.data.closed
+    with pytest.raises(ValueError):
+        held.types[0]
+
+
+def test_json_round_trip(tmp_path):
+    maps = sample_maps()
+    json_dir = tmp_path / "json"
+    json_dir.mkdir()
+    for custom_map_data in maps:
+        (json_dir / f"{custom_map_data.name}.json").write_text(json.dumps(custom_map_data.__dict__))
+    pack_path = str(tmp_path / "maps.gnmap")
+    assert pack_json([str(json_dir)], pack_path) == len(maps)
+    out_dir = tmp_path / "out"
+    assert unpack_json(pack_path, str(out_dir)) == len(maps)
+    unpacked = sorted(json.loads(path.read_text())["id"] for path in out_dir.iterdir())
+    assert unpacked == sorted(custom_map_data.id for custom_map_data in maps)
+
+
+def test_truncated_pack_is_rejected(tmp_path):
+    path = tmp_path / "maps.gnmap"
+    write_pack(str(path), sample_maps())
+    path.write_bytes(path.read_bytes()[:-4])
+    with pytest.raises(ValueError):
+        MapPack(str(path))
+
+
+def test_converted_maps_are_found_by_id(tmp_path):
+    html = "<table><tr><td class='king'>1</td><td class='mountain'></td></tr></table>"
+    paths = []
+    for name in ("north", "south"):
+        html_path = tmp_path / f"{name}.html"
+        html_path.write_text(html)
+        paths.append(str(tmp_path / f"{name}.json"))
+        assert convert_to_custom_map_data(str(html_path), paths[-1]) == 2
+    pack_path = str(tmp_path / "maps.gnmap")
+    pack_json(paths, pack_path)
+    with MapPack(pack_path) as pack:
+        assert pack.by_id == {"north": 0, "south": 1}
+        assert pack.map_data("south").mapTilesData == [[[KING, 0, 1, False, 0], [MOUNTAIN, None, 0, False, 0]]]